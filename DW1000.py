@@ -4,18 +4,29 @@ This python module contains low-level functions to interact with the DW1000 chip
 
 import time
 import math
+import zlib
 from random import randrange
-import spidev
-import RPi.GPIO as GPIO
 import logging
-import copy
 
 import DW1000Constants as C
 from DW1000Register import DW1000Register
+from DW1000Diagnostics import DW1000Diagnostics
 import MAC
-from Helper import convertStringToByte, writeValueToBytes
-
-GPIO.setwarnings(False)
+import profiler as P
+from profiler import profiler
+from logsetup import TRACE
+from Helper import convertStringToByte, writeValueToBytes, bitMask
+
+try:
+    import spidev
+    import RPi.GPIO as GPIO
+except ImportError:
+    # Only emulated devices (see simulator.py) can be used without the Raspberry Pi libraries
+    spidev = None
+    GPIO = None
+
+if GPIO is not None:
+    GPIO.setwarnings(False)
 
 class DW1000:
     """
@@ -27,12 +38,19 @@ class DW1000:
         cs: Chip select pin number
         rst: Reset pin number
         irq: Interrupt pin number
+        spi: SPI device, a spidev.SpiDev is opened by begin() if not given
+        gpio: GPIO module, RPi.GPIO if not given
+        bus: SPI bus of the spidev.SpiDev
+        device: SPI device of the spidev.SpiDev, the chip select line is driven by the cs pin
 
     Attributes:
         cs: Chip select pin
         rst: Reset pin
         irq: Interrupt pin
         spi: SPI device
+        gpio: GPIO module
+        bus: SPI bus
+        device: SPI device on the bus
         dblbuffon (bool): Double buffer state (enabled/disabled)
         sysctrl (DW1000Register): DW1000 system control register
         chanctrl (DW1000Register): DW1000 channel control register
@@ -48,21 +66,34 @@ class DW1000:
         eui (DW1000Register): DW1000 extended unique identifer register
         ackrespt (DW1000Register): DW1000 ackrept register
         rxfinfo (DW1000Register): DW1000 received frame information
+        rxfqual (DW1000Register): DW1000 received frame quality information
+        rxtime (DW1000Register): DW1000 receive time stamp and first path information
+        txtime (DW1000Register): DW1000 transmit time stamp
+        systime (DW1000Register): DW1000 system time counter
+        dxtime (DW1000Register): DW1000 delayed send or receive time
+        rxDiagnostics (DW1000Diagnostics): Diagnostics of the last frame, updated in place by readRxDiagnostics()
+        rxFrame (MAC.Frame): Host side receive buffer, reused for every frame, see getFrame()
         seqNum: Track sequence numbers of send frames (increase after send)
         operationMode: Mode of operation
-        permanentReceive (bool): Enable/disable permanent receiver
+        permanentReceive (bool): Keep the receiver on, see resumeReceive()
         extendedAddress: Long form address of DW1000
         shortAddress: Short form address, extracted last 2 bytes from extendedAddress
         interruptCallback: Function to call on interrupt receiption
+        spiBytesRead: Number of bytes read over SPI
+        spiBytesWritten: Number of bytes written over SPI
     """
-    def __init__(self, cs, rst, irq):
+    def __init__(self, cs, rst, irq, spi=None, gpio=None, bus=0, device=0):
         self.cs = cs #: Test
         self.rst = rst # Test2
         self.irq = irq
 
-        self.spi = None
+        self.spi = spi
+        self.gpio = gpio if gpio is not None else GPIO
+        self.bus = bus
+        self.device = device
 
         self.dblbuffon = False
+        self.antennaDelay = C.ANTENNA_DELAY # Configured TX and RX antenna delay
 
         self.sysctrl = DW1000Register(C.SYS_CTRL, C.NO_SUB, 4)
         self.chanctrl = DW1000Register(C.CHAN_CTRL, C.NO_SUB, 4)
@@ -78,6 +109,23 @@ class DW1000:
         self.eui = DW1000Register(C.EUI, C.NO_SUB, 8)
         self.ackrespt = DW1000Register(C.ACK_RESP_T, C.NO_SUB, 4)
         self.rxfinfo = DW1000Register(C.RX_FINFO, C.NO_SUB, 4)
+        self.rxfqual = DW1000Register(C.RX_FQUAL, C.NO_SUB, 8)
+        self.rxtime = DW1000Register(C.RX_TIME, C.NO_SUB, 14)
+        self.rxttcki = DW1000Register(C.RX_TTCKI, C.NO_SUB, 4)
+        self.rxttcko = DW1000Register(C.RX_TTCKO, C.NO_SUB, 3)
+        self.txtime = DW1000Register(C.TX_TIME, C.TX_STAMP_SUB, 5)
+        self.systime = DW1000Register(C.SYS_TIME, C.NO_SUB, 5)
+        self.dxtime = DW1000Register(C.DX_TIME, C.NO_SUB, 5)
+        self.rxDiagnostics = DW1000Diagnostics()
+        self.rxFrame = MAC.Frame(C.LEN_RX_BUFFER)
+        self.spiHeader = bytearray(3)
+        self.spiByte = [0] # Argument of the single byte SPI transfers
+        self.hrbpt = bytearray([1 << C.HRBPT_BIT % 8])
+        self.statusByte = bytearray(1)
+        self.softResetRx = bytearray([C.SOFT_RESET_RX])
+        self.softResetSet = bytearray([C.SOFT_RESET_SET])
+        self.txFrame = None # Frame from buildFrame() in the TX buffer, None if unknown
+        self.txSeqNum = bytearray(1)
 
         self.seqNum = randrange(0, 256) # Sequence number for transmitted frames | hashmap and per connection number?
 
@@ -90,6 +138,10 @@ class DW1000:
         # Main interrupt callback
         self.interruptCallback = lambda: None
 
+        # Statistics
+        self.spiBytesRead = 0
+        self.spiBytesWritten = 0
+
 
     def begin(self):
         """
@@ -97,16 +149,17 @@ class DW1000:
 
         Initialize GPIO on Host, establish SPI connection and initialize the DWM1000.
         """
-        GPIO.setmode(GPIO.BCM)
+        self.gpio.setmode(self.gpio.BCM)
 
-        # Reset to ensure correct operation of module
+        # Reset to ensure correct operation of module, the chip is polled until it is ready below
         self.hardReset()
         time.sleep(C.INIT_DELAY)
 
         # Setup SPI
         try:
-            self.spi = spidev.SpiDev()
-            self.spi.open(0, 0)
+            if self.spi is None:
+                self.spi = spidev.SpiDev()
+                self.spi.open(self.bus, self.device)
             self.spi.no_cs = True
             self.spi.max_speed_hz = 4000000
         except Exception as e:
@@ -114,10 +167,12 @@ class DW1000:
             raise
 
         # Setup Host GPIO
-        GPIO.setup(self.cs, GPIO.OUT, initial=GPIO.HIGH)
-        GPIO.setup(self.irq, GPIO.IN, pull_up_down=GPIO.PUD_DOWN) # TODO: CHECK
+        self.gpio.setup(self.cs, self.gpio.OUT, initial=self.gpio.HIGH)
+        self.gpio.setup(self.irq, self.gpio.IN, pull_up_down=self.gpio.PUD_DOWN) # TODO: CHECK
         #self.enableInterrupt()
 
+        self.waitReady()
+
         self.enableClock(C.AUTO_CLOCK)
 
         self.softReset()
@@ -147,13 +202,14 @@ class DW1000:
         """
         Break down connection to DWM1000
 
-        Release resources (GPIO, SPI).
+        Release resources (GPIO, SPI). Only the pins of this device are released,
+        other devices driven by the same host keep running.
         """
         self.disableInterrupt()
-        GPIO.setup(self.rst, GPIO.OUT, initial=GPIO.LOW)
+        self.gpio.setup(self.rst, self.gpio.OUT, initial=self.gpio.LOW)
         time.sleep(0.1)
         self.spi.close()
-        GPIO.cleanup()
+        self.gpio.cleanup((self.cs, self.irq, self.rst))
         logging.info("Stopped DW1000")
 
 
@@ -161,11 +217,30 @@ class DW1000:
         """
         Reset the DWM1000 by driving the reset line low for a short time.
         """
-        # Low for 100ms for reset
-        GPIO.setup(self.rst, GPIO.OUT, initial=GPIO.LOW)
-        time.sleep(0.20)
+        self.gpio.setup(self.rst, self.gpio.OUT, initial=self.gpio.LOW)
+        time.sleep(C.RESET_DELAY)
         # Reset pin to high impedance open drain
-        GPIO.cleanup(self.rst)
+        self.gpio.cleanup(self.rst)
+        self.txFrame = None
+
+
+    def waitReady(self):
+        """
+        Wait until the chip answers with its device identifier after a reset.
+
+        Returns:
+            (bool): True if the chip is ready, False after C.READY_TIMEOUT
+        """
+        devid = DW1000Register(C.DEV_ID, C.NO_SUB, 4)
+        deadline = time.monotonic() + C.READY_TIMEOUT
+        while True:
+            self.readRegister(devid)
+            if devid.value == C.DEV_ID_DW1000:
+                return True
+            if time.monotonic() > deadline:
+                logging.error("DW1000 not ready, device ID {:08X}".format(devid.value))
+                return False
+            time.sleep(C.INIT_DELAY)
 
 
     def softReset(self):
@@ -181,6 +256,7 @@ class DW1000:
         self.pmscctrl0[3] = C.SOFT_RESET_SET
         self.writeRegister(self.pmscctrl0)
         self.idle()
+        self.txFrame = None
 
 
     def enableLeds(self):
@@ -227,41 +303,38 @@ class DW1000:
     def toggleHSRBP(self):
         """
         Toggle host side receive buffer pointer.
+
+        Frees the host side buffer for the receiver. HRBPT is written with a single byte write,
+        the other SYS_CTRL bits and the interrupt mask stay untouched. The status bits of the
+        other buffer become visible in SYS_STATUS afterwards.
         """
         if self.dblbuffon:
-            # Save interrupt mask and change HRBPT bits
-            oldmask = self.sysmask.data.copy()
-            self.sysmask.setBits((C.MRXFCE_BIT, C.MRXFCG_BIT, C.MRXDFR_BIT, C.MLDEDONE_BIT), False)
-            self.writeRegister(self.sysmask)
-
-            # Toggle HSRBP
-            self.sysctrl.setBit(C.HRBPT_BIT, True)
-            self.writeRegister(self.sysctrl)
-
-            # Restore interrupt mask
-            self.sysmask.data = oldmask
-            self.writeRegister(self.sysmask)
+            self.writeBytes(C.SYS_CTRL, C.HRBPT_BIT // 8, self.hrbpt, 1)
 
 
     def syncHSRBP(self):
         """
         Synchronize host side receive buffer pointer to ic side receive buffer pointer.
+
+        Both pointers have to be equal before the receiver is enabled, the host then reads
+        the buffers in the order the receiver fills them.
         """
-        self.readRegister(self.sysstatus)
-        hsrbp = self.sysstatus.getBit(C.HSRBP_BIT)
-        icrbp = self.sysstatus.getBit(C.ICRBP_BIT)
-        if hsrbp == icrbp:
+        self.readBytes(C.SYS_STATUS, C.HSRBP_BIT // 8, self.statusByte, 1)
+        hsrbp = self.statusByte[0] >> C.HSRBP_BIT % 8 & 1
+        icrbp = self.statusByte[0] >> C.ICRBP_BIT % 8 & 1
+        if hsrbp != icrbp:
             self.toggleHSRBP()
 
 
     def forceTRxOff(self):
         """
         Force shutdown transmitte/receiver.
+
+        The interrupt line stays low while the interrupt mask is cleared, the event
+        detection on the host (see enableInterrupt()) is kept.
         """
         self.readRegister(self.sysmask)
-        mask = copy.copy(self.sysmask.data)
-
-        self.disableInterrupt()
+        mask = self.sysmask.value
 
         self.sysmask.setAll(0x00)
         self.writeRegister(self.sysmask)
@@ -270,45 +343,70 @@ class DW1000:
         self.sysctrl.setBit(C.TRXOFF_BIT, True)
         self.writeRegister(self.sysctrl)
 
-        self.clearStatus(C.SYS_STATUS_ALL_TX + C.SYS_STATUS_ALL_RX_ERR + \
-                            C.SYS_STATUS_ALL_RX_TO + C.SYS_STATUS_ALL_RX_GOOD)
+        self.clearStatus(C.SYS_STATUS_ALL_EVENTS)
 
         self.syncHSRBP()
 
-        self.sysmask.data = mask
+        self.sysmask.value = mask
         self.writeRegister(self.sysmask)
 
-        #self.enableInterrupt()
+        self.sysctrl.setBit(C.WAIT4RESP_BIT, False)
+
+
+    def abortReceive(self):
+        """
+        Turn the transceiver off after a receive timeout or error and soft reset the receiver.
+
+        Same as forceTRxOff() followed by rxreset() for a host polling the status register, in half the SPI transactions:
+        the interrupt mask is not saved and restored and the receive buffer pointers are only synchronized with double buffering.
+        The receiver reset is needed for correct timestamps of the next frame.
+        """
+        self.idle()
+        self.clearStatus(C.SYS_STATUS_ALL_EVENTS)
+        if self.dblbuffon:
+            self.syncHSRBP()
+        self.rxreset()
         self.sysctrl.setBit(C.WAIT4RESP_BIT, False)
 
 
     def disableInterrupt(self):
-        GPIO.remove_event_detect(self.irq)
+        self.gpio.remove_event_detect(self.irq)
 
 
-    def enableInterrupt(self):
+    def enableInterrupt(self, callback=None):
+        """
+        Detect rising edges of the interrupt line.
+
+        Args:
+            callback: Called with the pin number on an edge, handleInterrupt() if not given
+        """
         try:
-            GPIO.add_event_detect(self.irq, GPIO.RISING, callback=self.handleInterrupt)
+            self.gpio.add_event_detect(self.irq, self.gpio.RISING, callback=callback if callback is not None else self.handleInterrupt)
         except:
             logging.error("Failed to enable interrupt!")
 
     def enableDoubleBuffer(self):
+        """
+        Enable the double receive buffer, the receiver fills one buffer while the host reads the other.
+        """
+        self.syscfg.setBit(C.DIS_DRXB_BIT, False)
+        self.writeRegister(self.syscfg)
         self.dblbuffon = True
         self.syncHSRBP()
-        self.syscfg.setBit(C.HSRBP_BIT, True)
-        self.writeRegister(self.syscfg)
 
 
     def disableDoubleBuffer(self):
-        self.dblbuffon = False
-        self.syncHSRBP()
-        self.syscfg.setBit(C.HSRBP_BIT, False)
+        """
+        Disable the double receive buffer.
+        """
+        self.syscfg.setBit(C.DIS_DRXB_BIT, True)
         self.writeRegister(self.syscfg)
+        self.dblbuffon = False
 
 
     def rxreset(self):
-        self.writeBytes(C.PMSC, C.PMSC_CTRL0_SUB+0x3, bytearray([C.SOFT_RESET_RX]), 1)
-        self.writeBytes(C.PMSC, C.PMSC_CTRL0_SUB+0x3, bytearray([C.SOFT_RESET_SET]), 1)
+        self.writeBytes(C.PMSC, C.PMSC_CTRL0_SUB+0x3, self.softResetRx, 1)
+        self.writeBytes(C.PMSC, C.PMSC_CTRL0_SUB+0x3, self.softResetSet, 1)
 
 
     def readBytes(self, cmd, offset, data, n):
@@ -321,7 +419,8 @@ class DW1000:
             data: Array for the data to be stored in
             n: Number of bytes to read
         """
-        header = bytearray(3)
+        t = profiler.start()
+        header = self.spiHeader
         headerLen = 1
 
         if offset == C.NO_SUB:
@@ -336,21 +435,27 @@ class DW1000:
                 header[2] = offset >> 7
                 headerLen = headerLen + 2
 
-        GPIO.output(self.cs, GPIO.LOW)
+        self.gpio.output(self.cs, self.gpio.LOW)
 
         #_data = self.spi.xfer2(header[0:headerLen] + bytearray(n))
 
+        spiByte = self.spiByte
         for i in range(0, headerLen):
-            self.spi.xfer([int(header[i])])
+            spiByte[0] = header[i]
+            self.spi.xfer(spiByte)
 
+        spiByte[0] = C.JUNK
         for i in range(0, n):
-            data[i] = self.spi.xfer([C.JUNK])[0]
+            data[i] = self.spi.xfer(spiByte)[0]
 
-        GPIO.output(self.cs, GPIO.HIGH)
+        self.gpio.output(self.cs, self.gpio.HIGH)
 
         #for i in range(0, n):
         #    data[i] = _data[headerLen + i]
 
+        self.spiBytesRead += n
+        profiler.stop(P.SPI_READ, t)
+
 
     def writeBytes(self, cmd, offset, data, dataSize):
         """
@@ -362,7 +467,8 @@ class DW1000:
             data: Array for the data to be written
             dataSize: Number of bytes to write
         """
-        header = bytearray(3)
+        t = profiler.start()
+        header = self.spiHeader
         headerLen = 1
 
         if offset == C.NO_SUB:
@@ -377,18 +483,24 @@ class DW1000:
                 header[2] = offset >> 7
                 headerLen = headerLen + 2
 
-        GPIO.output(self.cs, GPIO.LOW)
+        self.gpio.output(self.cs, self.gpio.LOW)
 
+        spiByte = self.spiByte
         for i in range(0, headerLen):
-            self.spi.xfer([int(header[i])])
+            spiByte[0] = header[i]
+            self.spi.xfer(spiByte)
 
         for i in range(0, dataSize):
             if (data[i] != None):
-                self.spi.xfer([int(data[i])])
+                spiByte[0] = int(data[i])
+                self.spi.xfer(spiByte)
 
         #self.spi.xfer2(header[0:headerLen] + data[0:dataSize])
 
-        GPIO.output(self.cs, GPIO.HIGH)
+        self.gpio.output(self.cs, self.gpio.HIGH)
+
+        self.spiBytesWritten += dataSize
+        profiler.stop(P.SPI_WRITE, t)
 
 
     def enableClock(self, clock):
@@ -477,7 +589,8 @@ class DW1000:
         Args:
             channel: Unused
         """
-        logging.debug("Interrupt received")
+        if __debug__ and TRACE:
+            logging.debug("Interrupt received")
         if callable(self.interruptCallback):
             self.interruptCallback()
 
@@ -579,6 +692,7 @@ class DW1000:
         writeValueToBytes(antennaDelayBytes, val, 5)
         self.writeBytes(C.TX_ANTD, C.NO_SUB, antennaDelayBytes, 2)
         self.writeBytes(C.LDE_CTRL, C.LDE_RXANTD_SUB, antennaDelayBytes, 2)
+        self.antennaDelay = val
 
 
     def setEUI(self, currentAddress):
@@ -819,6 +933,71 @@ class DW1000:
         self.commitConfiguration()
 
 
+    def readSnapshotRegisters(self):
+        """
+        This function reads the registers of a configuration snapshot (see C.SNAPSHOT_REGISTERS).
+
+        Returns:
+            (list): Register contents as bytearrays
+        """
+        registers = []
+        for address, offset, size in C.SNAPSHOT_REGISTERS:
+            data = bytearray(size)
+            self.readBytes(address, offset, data, size)
+            registers.append(data)
+        return registers
+
+
+    def takeSnapshot(self):
+        """
+        This function reads back the configuration of the chip, call it after generalConfiguration().
+        The snapshot contains the tuned register values and the crystal trim read from the OTP memory, it can be restored with restoreSnapshot().
+
+        Returns:
+            (dict): Operation mode, register contents as hex strings and the CRC32 of the register contents
+        """
+        registers = self.readSnapshotRegisters()
+        return {"mode": list(self.operationMode), "registers": [r.hex() for r in registers], "crc": zlib.crc32(b"".join(registers))}
+
+
+    def restoreSnapshot(self, snapshot):
+        """
+        This function restores a configuration taken by takeSnapshot() instead of generalConfiguration().
+        The register contents are checked against the CRC32 of the snapshot before anything is written, then every register is written once.
+        Only the registers in C.SNAPSHOT_VERIFY are read back, a full read back costs more SPI transfers than the configuration itself.
+
+        Args:
+            snapshot (dict): Snapshot from takeSnapshot()
+
+        Returns:
+            (bool): True if the snapshot is intact and the verified registers match it
+        """
+        registers = [bytes.fromhex(r) for r in snapshot["registers"]]
+        if len(registers) != len(C.SNAPSHOT_REGISTERS) or len(snapshot["mode"]) != len(self.operationMode):
+            return False
+        if zlib.crc32(b"".join(registers)) != snapshot["crc"]:
+            return False
+
+        self.idle()
+        for (address, offset, size), data in zip(C.SNAPSHOT_REGISTERS, registers):
+            self.writeBytes(address, offset, data, size)
+
+        # Host side copies used by later read-modify-write accesses
+        index = {(address, offset): i for i, (address, offset, size) in enumerate(C.SNAPSHOT_REGISTERS)}
+        for reg in (self.eui, self.panadr, self.syscfg, self.chanctrl, self.txfctrl, self.sysmask, self.ackrespt):
+            reg.data[:] = registers[index[(reg.address, reg.subaddress)]]
+        self.operationMode[:] = snapshot["mode"]
+        self.txFrame = None
+        self.antennaDelay = int.from_bytes(registers[index[(C.TX_ANTD, C.NO_SUB)]], "little")
+
+        for address, offset, size in C.SNAPSHOT_VERIFY:
+            data = bytearray(size)
+            self.readBytes(address, offset, data, size)
+            if data != registers[index[(address, offset)]]:
+                return False
+        return True
+
+
     def getDeviceInfoString(self):
         """
         This function returns some infos about the DW1000 module
@@ -1111,6 +1290,24 @@ class DW1000:
         self.writeRegister(self.sysctrl)
 
 
+    def resumeReceive(self):
+        """
+        This function turns the receiver on again for permanent receive.
+
+        Only RXENAB is written and only when the transceiver is idle. A receiver kept on by
+        auto re-enable and double buffering, or by WAIT4RESP, is not switched off, so a frame
+        arriving in the other receive buffer is not lost and both buffer pointers stay in sync.
+        A pending delayed transmission is not cancelled either, its TXFRS re-enables the receiver.
+        Unlike newReceive() the receive status is not cleared.
+        """
+        self.readBytes(C.SYS_STATE, C.PMSC_STATE_SUB, self.statusByte, 1)
+        if self.statusByte[0] & 0x1F > C.PMSC_STATE_IDLE:
+            return
+        self.sysctrl.clear()
+        self.sysctrl.setBit(C.RXENAB_BIT, True)
+        self.writeRegister(self.sysctrl)
+
+
     def isReceiveFailed(self):
         """
         This function reads the system event status register and checks if the message reception failed.
@@ -1118,7 +1315,7 @@ class DW1000:
         Returns:
             True if the reception failed. False otherwise.
         """
-        val = self.sysstatus.getBitsOr([C.LDEERR_BIT, C.RXFCE_BIT, C.RXPHE_BIT, C.RXRFSL_BIT])
+        val = self.sysstatus.getBitsOr(1 << C.LDEERR_BIT | 1 << C.RXFCE_BIT | 1 << C.RXPHE_BIT | 1 << C.RXRFSL_BIT)
         if val:
             return True
         else:
@@ -1142,10 +1339,44 @@ class DW1000:
         """
         This function clears the system event status register at the bits related to the reception of a message.
         """
-        self.clearStatus((C.RXDFR_BIT, C.LDEDONE_BIT
-                                , C.LDEERR_BIT, C.RXPHE_BIT
-                                , C.RXFCE_BIT, C.RXFCG_BIT
-                                , C.RXRFSL_BIT))
+        self.clearStatus(1 << C.RXDFR_BIT | 1 << C.LDEDONE_BIT
+                                | 1 << C.LDEERR_BIT | 1 << C.RXPHE_BIT
+                                | 1 << C.RXFCE_BIT | 1 << C.RXFCG_BIT
+                                | 1 << C.RXRFSL_BIT)
+
+
+    def readRxDiagnostics(self):
+        """
+        This function reads the complete RX_FINFO, RX_FQUAL and RX_TIME register files of the last received frame
+        and computes all receive diagnostics from this single read.
+
+        Returns:
+            (DW1000Diagnostics): Diagnostics of the last received frame, this is rxDiagnostics which is overwritten by the next call.
+        """
+        self.readRegister(self.rxfinfo)
+        self.readRegister(self.rxfqual)
+        self.readRegister(self.rxtime)
+        self.rxDiagnostics.update(self.rxfinfo.data, self.rxfqual.data, self.rxtime.data,
+                                  self.operationMode[C.PULSE_FREQUENCY_BIT])
+        return self.rxDiagnostics
+
+
+    def getClockOffset(self):
+        """
+        This function reads the receiver time tracking interval and offset of the last received frame.
+        Their ratio is the clock frequency offset of the remote transmitter, see section 7.2.21 of the DW1000 user manual.
+
+        Returns:
+            (float): Clock offset ratio of the transmitter to the local clock, positive if the transmitter clock is faster
+        """
+        self.readRegister(self.rxttcki)
+        self.readRegister(self.rxttcko)
+        data = self.rxttcko.data
+        offset = (data[0] | data[1] << 8 | data[2] << 16) & C.RXTOFS_MASK
+        if offset & C.RXTOFS_SIGN:
+            offset -= C.RXTOFS_MASK + 1
+        interval = self.rxttcki.data[0] | self.rxttcki.data[1] << 8 | self.rxttcki.data[2] << 16 | self.rxttcki.data[3] << 24
+        return offset / interval if interval else 0.
 
 
     def getFirstPathPower(self):
@@ -1155,31 +1386,7 @@ class DW1000:
         Returns:
             The estimated power in the first path signal.
         """
-        fpAmpl1Bytes = DW1000Register(C.RX_TIME, C.FP_AMPL1_SUB, 2)
-        fpAmpl2Bytes = DW1000Register(C.RX_FQUAL, C.FP_AMPL2_SUB, 2)
-        fpAmpl3Bytes = DW1000Register(C.RX_FQUAL, C.PP_AMPL3_SUB, 2)
-        rxFrameInfo = DW1000Register(C.RX_FINFO, C.NO_SUB, 4)
-        self.readRegister(fpAmpl1Bytes)
-        self.readRegister(fpAmpl2Bytes)
-        self.readRegister(fpAmpl3Bytes)
-        self.readRegister(rxFrameInfo)
-        f1 = fpAmpl1Bytes[0] | fpAmpl1Bytes[1] << 8
-        f2 = fpAmpl2Bytes[0] | fpAmpl2Bytes[1] << 8
-        f3 = fpAmpl3Bytes[0] | fpAmpl3Bytes[1] << 8
-        N = ((rxFrameInfo[2] >> 4) & C.MASK_LS_BYTE) | (rxFrameInfo[3] << 4)
-        if self.operationMode[C.PULSE_FREQUENCY_BIT] == C.TX_PULSE_FREQ_16MHZ:
-            A = C.A_16MHZ
-            corrFac = C.CORRFAC_16MHZ
-        else:
-            A = C.A_64MHZ
-            corrFac = C.CORRFAC_64MHZ
-        estFPPower = C.PWR_COEFF2 * \
-            math.log10((f1 * f1 + f2 * f2 + f3 * f3) / (N * N)) - A
-        if estFPPower <= -C.PWR_COEFF:
-            return estFPPower
-        else:
-            estFPPower += (estFPPower + C.PWR_COEFF) * corrFac
-        return estFPPower
+        return self.readRxDiagnostics().fpPower
 
 
     def getReceivePower(self):
@@ -1189,57 +1396,32 @@ class DW1000:
         Returns:
             The estimated receive power for the current reception.
         """
-        cirPwrBytes = DW1000Register(C.RX_FQUAL, C.CIR_PWR_SUB, 2)
-        rxFrameInfo = DW1000Register(C.RX_FINFO, C.NO_SUB, 4)
-        self.readRegister(cirPwrBytes)
-        self.readRegister(rxFrameInfo)
-        cir = cirPwrBytes[0] | cirPwrBytes[1] << 8
-        N = ((rxFrameInfo[2] >> 4) & C.MASK_LS_BYTE) | rxFrameInfo[3] << 4
-        if self.operationMode[C.PULSE_FREQUENCY_BIT] == C.TX_PULSE_FREQ_16MHZ:
-            A = C.A_16MHZ
-            corrFac = C.CORRFAC_16MHZ
-        else:
-            A = C.A_64MHZ
-            corrFac = C.CORRFAC_64MHZ
-        estRXPower = 0
-        if ((float(cir) * float(C.TWOPOWER17)) / (float(N) * float(N)) > 0):
-            estRXPower = C.PWR_COEFF2 * math.log10((float(cir) * float(C.TWOPOWER17)) / (float(N) * float(N))) - A
-        if estRXPower <= -C.PWR_COEFF:
-            return estRXPower
-        else:
-            estRXPower += (estRXPower + C.PWR_COEFF) * corrFac
-        return estRXPower
+        return self.readRxDiagnostics().rxPower
 
 
     def getReceiveQuality(self):
         """
-        This function calculates an estimate of the receive quality.abs
+        This function calculates an estimate of the receive quality.
 
         Returns:
             The estimated receive quality for the current reception.
         """
-        noiseBytes = DW1000Register(C.RX_FQUAL, C.STD_NOISE_SUB, 2)
-        fpAmpl2Bytes = DW1000Register(C.RX_FQUAL, C.FP_AMPL2_SUB, 2)
-        self.readRegister(noiseBytes)
-        self.readRegister(fpAmpl2Bytes)
-        noise = float(noiseBytes[0] | noiseBytes[1] << 8)
-        f2 = float(fpAmpl2Bytes[0] | fpAmpl2Bytes[1] << 8)
-        return f2 / noise
+        return self.readRxDiagnostics().quality
 
 
     def getReceiveTimestamp(self):
         """
         This function reads the receive timestamp from the register and returns it.
 
+        The receive diagnostics are read along with the timestamp and are available in rxDiagnostics afterwards.
+
         Returns:
             The timestamp value of the last reception.
         """
-        rxTimeBytes = DW1000Register(C.RX_TIME, C.RX_STAMP_SUB, 5)
-        self.readRegister(rxTimeBytes)
-        timestamp = 0
-        for i in range(0, 5):
-            timestamp |= rxTimeBytes[i] << (i * 8)
-        timestamp = int(round(self.correctTimestamp(timestamp)))
+        diagnostics = self.readRxDiagnostics()
+        t = profiler.start()
+        timestamp = int(round(self.correctTimestamp(diagnostics.rawTimestamp, diagnostics.rxPower)))
+        profiler.stop(P.CORRECT_TIMESTAMP, t)
 
         return timestamp
 
@@ -1256,17 +1438,20 @@ class DW1000:
         return ((self.rxfinfo[1] & 0x3) << 8) | self.rxfinfo[0] # [RXFLE | RXFLEN]
 
 
-    def correctTimestamp(self, timestamp):
+    def correctTimestamp(self, timestamp, rxPower=None):
         """
         This function corrects the timestamp read from the RX buffer.
 
         Args:
             timestamp: the timestamp you want to correct
+            rxPower: receive power of the frame, read from the chip if not given
 
         Returns:
             The corrected timestamp.
         """
-        rxPowerBase = -(self.getReceivePower() + 61.0) * 0.5
+        if rxPower is None:
+            rxPower = self.getReceivePower()
+        rxPowerBase = -(rxPower + 61.0) * 0.5
         rxPowerBaseLow = int(math.floor(rxPowerBase))
         rxPowerBaseHigh = rxPowerBaseLow + 1
 
@@ -1330,12 +1515,29 @@ class DW1000:
         return timestamp
 
 
+    def getFrame(self):
+        """
+        This function reads the most recent message in the receive buffer into rxFrame and parses its header.
+
+        Returns:
+            (MAC.Frame): rxFrame, overwritten by the next call
+        """
+        messageLen = self.getReceiveFrameLength()
+        self.readBytes(C.RX_BUFFER, C.NO_SUB, self.rxFrame.buffer, messageLen)
+        t = profiler.start()
+        self.rxFrame.load(messageLen)
+        profiler.stop(P.MAC_DECODE, t)
+        return self.rxFrame
+
+
     def getMessage(self):
         """
         This function returns the most recent message in the receive buffer.
+
+        Returns:
+            (memoryview): The message including the CRC, a view of rxFrame which is overwritten by the next call
         """
-        messageLen = self.getReceiveFrameLength()
-        return bytearray(self.getData(messageLen))
+        return self.getFrame().data
 
 
     """
@@ -1366,7 +1568,7 @@ class DW1000:
         """
         This function clears the event status register at the bits related to the transmission of a message.
         """
-        self.clearStatus((C.TXFRB_BIT, C.TXPRS_BIT, C.TXPHS_BIT, C.TXFRS_BIT))
+        self.clearStatus(1 << C.TXFRB_BIT | 1 << C.TXPRS_BIT | 1 << C.TXPHS_BIT | 1 << C.TXFRS_BIT)
 
 
     def setDelay(self, delay, unit, mode):
@@ -1388,27 +1590,13 @@ class DW1000:
         else:
             logging.error("Unknown mode")
 
-        delayReg = DW1000Register(C.DX_TIME, C.NO_SUB, 5)
-        sysTimeReg = DW1000Register(C.SYS_TIME, C.NO_SUB, 5)
-        self.readRegister(sysTimeReg)
-        futureTimeTS = 0
-        for i in range(0, 5):
-            futureTimeTS |= sysTimeReg[i] << (i * 8)
-        futureTimeTS += int(delay * unit * C.TIME_RES_INV)
-
-        delayReg.clear()
-        for i in range(0, 5):
-            delayReg[i] = int(futureTimeTS >> (i * 8)) & C.MASK_LS_BYTE
-
-        delayReg[0] = 0
-        delayReg[1] &= C.SET_DELAY_MASK
-        self.writeRegister(delayReg)
+        self.readRegister(self.systime)
+        futureTimeTS = self.systime.value + int(delay * unit * C.TIME_RES_INV)
 
-        futureTimeTS = 0
-        for i in range(0, 5):
-            futureTimeTS |= delayReg[i] << (i * 8)
+        self.dxtime.value = futureTimeTS & C.DX_TIME_MASK
+        self.writeRegister(self.dxtime)
 
-        futureTimeTS += C.ANTENNA_DELAY
+        futureTimeTS = self.dxtime.value + self.antennaDelay
         return futureTimeTS
 
 
@@ -1429,10 +1617,9 @@ class DW1000:
         This function clears all specified bits in status register. Local status is invalid afterwards!
 
         Args:
-            bits (array-like): List of bits to clear
+            bits: Mask or list of bits to clear
         """
-        self.sysstatus.clear()
-        self.sysstatus.setBits(bits, True)
+        self.sysstatus.value = bits if isinstance(bits, int) else bitMask(bits)
         self.writeRegister(self.sysstatus)
 
 
@@ -1451,12 +1638,8 @@ class DW1000:
         Returns:
             The timestamp value of the last transmission.
         """
-        txTimeRegister = DW1000Register(C.TX_TIME, C.TX_STAMP_SUB, 5)
-        self.readRegister(txTimeRegister)
-        timeStamp = 0
-        for i in range(0, 5):
-            timeStamp |= int(txTimeRegister[i] << (i * 8))
-        return timeStamp
+        self.readRegister(self.txtime)
+        return self.txtime.value
 
 
     def setTimeStamp(self, data, timeStamp, index):
@@ -1521,6 +1704,7 @@ class DW1000:
             wait4resp: Immediately turn on receiver after send
             delay: Time in microseconds
         """
+        t = profiler.start()
         srcAddr = self.panadr[0:2]
 
         # Fill header structures
@@ -1552,6 +1736,67 @@ class DW1000:
 
         self.seqNum = (self.seqNum + 1) % 256
 
+        profiler.stop(P.SEND_MESSAGE, t)
+
+
+    def buildFrame(self, dstAddr, dstPAN, payload, ackReq=True):
+        """
+        This function builds a data frame for sendFrame(), like sendMessage() does. Call it after the configuration, the source address is taken from the chip.
+
+        Args:
+            dstAddr: Short ID of the destination
+            dstPAN: Network identifier of the destination
+            payload (bytes): Data to be send
+            ackReq: Request receiver to reply with acknowledge frame
+
+        Returns:
+            (bytearray): Frame without CRC, the sequence number is set by sendFrame()
+        """
+        header = MAC.MACHeader()
+        header.frameControl.frameType = MAC.FT_DATA
+        header.frameControl.ackRequest = ackReq
+        header.frameControl.panCompression = 1
+        header.frameControl.destAddrMode = MAC.AD_SAD
+        header.frameControl.frameVersion = MAC.IEEE802_15_4_2003
+        header.frameControl.srcAddrMode = MAC.AD_SAD
+        header.seqNumber = 0
+        header.destPAN = dstPAN
+        header.destAddr = dstAddr
+        header.srcAddr = self.panadr[0:2]
+        return bytearray(header.encode() + payload)
+
+
+    def sendFrame(self, frame, wait4resp=True, delay=0):
+        """
+        This function sends a frame built by buildFrame().
+        If the same frame was sent last, only its sequence number is written to the TX buffer, otherwise the whole frame.
+
+        Args:
+            frame (bytearray): Frame from buildFrame()
+            wait4resp: Immediately turn on receiver after send
+            delay: Time in microseconds, see sendMessage()
+        """
+        t = profiler.start()
+        self.newTransmit()
+        self.txSeqNum[0] = self.seqNum
+        if frame is self.txFrame:
+            self.writeBytes(C.TX_BUFFER, MAC.SEQ_NUMBER_OFFSET, self.txSeqNum, 1)
+        else:
+            frame[MAC.SEQ_NUMBER_OFFSET] = self.seqNum
+            self.writeBytes(C.TX_BUFFER, C.NO_SUB, frame, len(frame))
+            length = len(frame) + 2 # Two bytes CRC
+            self.txfctrl[0] = length & C.MASK_LS_BYTE
+            self.txfctrl[1] &= C.SET_DATA_MASK1
+            self.txfctrl[1] |= (length >> 8) & C.SET_DATA_MASK2
+            self.txFrame = frame
+        if delay:
+            self.setDelay(delay, C.MICROSECONDS, "tx")
+        self.startTransmit(wait4resp)
+
+        self.seqNum = (self.seqNum + 1) % 256
+
+        profiler.stop(P.SEND_MESSAGE, t)
+
 
     """
     Data functions
@@ -1613,6 +1858,7 @@ class DW1000:
             data: the byte array which contains the data to be written in the register
             dataLength: The size of the data which will be sent.
         """
+        self.txFrame = None
         self.writeBytes(C.TX_BUFFER, C.NO_SUB, data, dataLength)
         self.readBytes(C.TX_BUFFER, C.NO_SUB, data, dataLength)
         dataLength += 2  # _frameCheck true, two bytes CRC
@@ -14,6 +14,8 @@ JUNK = 0x00
 # Delay
 INIT_DELAY = 0.000005
 PMSC_CONFIG_DELAY = 0.00015
+RESET_DELAY = 0.002 # RSTn low time of a hard reset, the chip needs at least 10 ns
+READY_TIMEOUT = 0.1 # Maximum time for the chip to answer with DEV_ID_DW1000 after a reset
 
 # DW1000 TX/RX Modes
 IDLE_MODE = 0x00
@@ -70,6 +72,14 @@ PFREQ_DICT = {
     TX_PULSE_FREQ_64MHZ     : 64
 }
 
+# Preamble codes supported per pulse repetition frequency and channel (DW1000 user manual, channel and preamble selection)
+PREAMBLE_CODES = {
+    TX_PULSE_FREQ_16MHZ: {CHANNEL_1: (1, 2), CHANNEL_2: (3, 4), CHANNEL_3: (5, 6),
+                          CHANNEL_4: (7, 8), CHANNEL_5: (3, 4), CHANNEL_7: (7, 8)},
+    TX_PULSE_FREQ_64MHZ: {CHANNEL_1: (9, 10, 11, 12), CHANNEL_2: (9, 10, 11, 12), CHANNEL_3: (9, 10, 11, 12),
+                          CHANNEL_4: (17, 18, 19, 20), CHANNEL_5: (9, 10, 11, 12), CHANNEL_7: (17, 18, 19, 20)}
+}
+
 # Preamble length
 TX_PREAMBLE_LEN_64 = 0x01
 TX_PREAMBLE_LEN_128 = 0x05
@@ -127,7 +137,7 @@ RX_TIME = 0x15          # Receive Time Stamp                        ROD 14
 # Reserved 0x16
 TX_TIME = 0x17          # Transmit Time Stamp                       RO  10
 TX_ANTD = 0x18          # Transmitter Antenna Delay                 RW  2
-# Reserved 0x19
+SYS_STATE = 0x19        # System State                              RO  5
 ACK_RESP_T = 0x1A       # Acknowledement Time and Response Time     RW  4
 # Reserved 0x1B
 # Reserved 0x1C
@@ -167,6 +177,9 @@ PMSC = 0x36             # Power Management and System Control       -   -
 # Reserved 0x3E
 # Reserved 0x3F
 
+# DEV_ID register content of the DW1000 (RIDTAG 0xDECA, model 1, version 3, revision 0)
+DEV_ID_DW1000 = 0xDECA0130
+
 # Registers offset
 NO_SUB = 0xFF
 PMSC_CTRL0_SUB = 0x00
@@ -177,6 +190,8 @@ PMSC_RES2_SUB = 0x10
 PMSC_TXFSEQ_SUB = 0x26
 PMSC_LEDC_SUB = 0x28
 SFD_LENGTH_SUB = 0x00
+# SYS_STATE subregisters
+PMSC_STATE_SUB = 0x02
 # OTP_IF subregisters
 OTP_ADDR_SUB = 0x04
 OTP_CTRL_SUB = 0x06
@@ -210,6 +225,9 @@ FP_AMPL1_SUB = 0x07
 RX_STAMP_SUB = 0x00
 # TX_TIME subregisters
 TX_STAMP_SUB = 0
+# RX_TTCKO, receiver time tracking offset RXTOFS in bits 18:0, signed
+RXTOFS_MASK = 0x7FFFF
+RXTOFS_SIGN = 0x40000
 # RX_FQUAL subregisters
 STD_NOISE_SUB = 0x00
 FP_AMPL2_SUB = 0x02
@@ -322,14 +340,18 @@ RXRSCS_BIT = 32         # Receiver Reed-Solomon Correction Status
 RXPREJ_BIT = 33         # Receiver Preamble Rejection
 TXPUTE_BIT = 34         # Transmit power up time error
 
-SYS_STATUS_ALL_RX_GOOD = (RXDFR_BIT, RXFCG_BIT, RXPRD_BIT, \
-                            RXSFDD_BIT, RXPHD_BIT, LDEDONE_BIT)
-SYS_STATUS_ALL_DBLBUFF = (RXDFR_BIT, RXFCG_BIT)
-SYS_STATUS_ALL_RX_ERR = (RXPHE_BIT, RXFCE_BIT, RXRFSL_BIT, \
-                            AFFREJ_BIT, LDEERR_BIT)
-SYS_STATUS_ALL_RX_TO = (RXRFTO_BIT, RXPTO_BIT)
-SYS_STATUS_ALL_TX = (AAT_BIT, TXFRB_BIT, TXPRS_BIT, \
-                       TXPHS_BIT, TXFRS_BIT)
+# Bit groups as integer masks of the status register
+SYS_STATUS_ALL_RX_GOOD = 1 << RXDFR_BIT | 1 << RXFCG_BIT | 1 << RXPRD_BIT | \
+                            1 << RXSFDD_BIT | 1 << RXPHD_BIT | 1 << LDEDONE_BIT
+SYS_STATUS_ALL_DBLBUFF = 1 << RXDFR_BIT | 1 << RXFCG_BIT
+SYS_STATUS_ALL_RX_ERR = 1 << RXPHE_BIT | 1 << RXFCE_BIT | 1 << RXRFSL_BIT | \
+                            1 << AFFREJ_BIT | 1 << LDEERR_BIT
+SYS_STATUS_ALL_RX_TO = 1 << RXRFTO_BIT | 1 << RXPTO_BIT
+SYS_STATUS_ALL_TX = 1 << AAT_BIT | 1 << TXFRB_BIT | 1 << TXPRS_BIT | \
+                       1 << TXPHS_BIT | 1 << TXFRS_BIT
+SYS_STATUS_RX_OVRR = 1 << RXOVRR_BIT
+SYS_STATUS_ALL_EVENTS = SYS_STATUS_ALL_TX | SYS_STATUS_ALL_RX_TO | SYS_STATUS_ALL_RX_GOOD | SYS_STATUS_ALL_RX_ERR | \
+                           SYS_STATUS_RX_OVRR
 
 # 0x1F: Channel control register bits, see 7.2.32 of user manual
 DWSFD_BIT = 17
@@ -364,6 +386,14 @@ SOFT_RESET_CLEAR = 0x00
 SOFT_RESET_SET = 0xF0
 SOFT_RESET_RX = 0xE0 # Assuming only 4th byte is written!
 
+# 0x19 0x02: PMSC_STATE values, the transceiver is off in INIT and IDLE
+PMSC_STATE_INIT = 0x00
+PMSC_STATE_IDLE = 0x01
+PMSC_STATE_TX_WAIT = 0x02
+PMSC_STATE_RX_WAIT = 0x03
+PMSC_STATE_TX = 0x04
+PMSC_STATE_RX = 0x05
+
 # 0x36 0x28: PMSCLEDC bits and preconfigured bytes
 PMSC_LEDC_BLINKEN_BIT = 8
 PMSC_LEDC_BLINK_TIM_BYTE = 0x20
@@ -398,9 +428,11 @@ PREACODE_MASK3 = 0x07
 
 # Set delay masks
 SET_DELAY_MASK = 0xFE
+DX_TIME_MASK = 0xFFFFFFFE00 # The lower 9 bits of DX_TIME are ignored by the chip
 
 # get data masks
 GET_DATA_MASK = 0x03FF
+LEN_RX_BUFFER = 1024
 
 # set data masks
 SET_DATA_MASK1 = 0xE0
@@ -519,6 +551,9 @@ DEFAULT_REPLY_DELAY_TIME = 7000
 ANTENNA_DELAY_RASPI = 16390
 ANTENNA_DELAY = 16470
 TIME_OVERFLOW = 0x10000000000
+# Receiver time tracking interval RXTTCKI per PRF
+RXTTCKI_16MHZ = 0x01F00000
+RXTTCKI_64MHZ = 0x01FC0000
 # time resolution in micro seconds of time based registers
 TIME_RES = 0.000015650040064103
 TIME_RES_INV = 63897.6
@@ -596,3 +631,43 @@ DEFAULT_REPLY_DELAY_TIME = 7000
 
 # Default timer delay
 DEFAULT_TIMER_DELAY = 80
+
+# Configuration snapshot, see DW1000.takeSnapshot()
+# (address, sub-address, size) of every register set by generalConfiguration() and tune(), in write order
+SNAPSHOT_REGISTERS = (
+    (EUI, NO_SUB, 8),
+    (PANADR, NO_SUB, 4),
+    (SYS_CFG, NO_SUB, 4),
+    (CHAN_CTRL, NO_SUB, 4),
+    (TX_FCTRL, NO_SUB, 5),
+    (SYS_MASK, NO_SUB, 4),
+    (USR_SFD, SFD_LENGTH_SUB, 1),
+    (ACK_RESP_T, NO_SUB, 4),
+    (TX_ANTD, NO_SUB, 2),
+    (LDE_CTRL, LDE_RXANTD_SUB, 2),
+    (AGC_CTRL, AGC_TUNE1_SUB, 2),
+    (AGC_CTRL, AGC_TUNE2_SUB, 4),
+    (AGC_CTRL, AGC_TUNE3_SUB, 2),
+    (DRX_CONF, DRX_TUNE0b_SUB, 2),
+    (DRX_CONF, DRX_TUNE1a_SUB, 2),
+    (DRX_CONF, DRX_TUNE1b_SUB, 2),
+    (DRX_CONF, DRX_TUNE2_SUB, 4),
+    (DRX_CONF, DRX_TUNE4H_SUB, 2),
+    (LDE_CTRL, LDE_CFG1_SUB, 1),
+    (LDE_CTRL, LDE_CFG2_SUB, 2),
+    (LDE_CTRL, LDE_REPC_SUB, 2),
+    (TX_POWER, NO_SUB, 4),
+    (RF_CONF, RF_RXCTRLH_SUB, 1),
+    (RF_CONF, RF_TXCTRL_SUB, 4),
+    (TX_CAL, TC_PGDELAY_SUB, 1),
+    (FS_CTRL, FS_PLLTUNE_SUB, 1),
+    (FS_CTRL, FS_PLLCFG_SUB, 4),
+    (FS_CTRL, FS_XTALT_SUB, 1)
+)
+# Registers read back after a restore (see DW1000.restoreSnapshot()): written early, in the middle and last,
+# SYS_CFG and TX_POWER always differ from their reset values
+SNAPSHOT_VERIFY = (
+    (SYS_CFG, NO_SUB, 4),
+    (TX_POWER, NO_SUB, 4),
+    (FS_CTRL, FS_XTALT_SUB, 1)
+)
@@ -0,0 +1,119 @@
+"""@package DW1000Diagnostics
+
+This module provides a class holding the receive diagnostics of one frame.
+"""
+
+import math
+
+import DW1000Constants as C
+
+class DW1000Diagnostics:
+    """
+    Receive diagnostics of a single frame.
+
+    All values are computed from one read of the RX_FINFO, RX_FQUAL and RX_TIME
+    register files, see section 4.7 of the DW1000 user manual. Without register
+    contents all values are zero, see update() to fill the object in place.
+
+    Args:
+        rxfinfo: Contents of RX_FINFO (4 bytes)
+        rxfqual: Contents of RX_FQUAL (8 bytes)
+        rxtime: Contents of RX_TIME (14 bytes)
+        prf: Pulse repetition frequency identifier from DW1000Constants
+
+    Attributes:
+        rawTimestamp: Uncorrected receive timestamp (RX_STAMP)
+        noise: Standard deviation of the CIR noise (STD_NOISE)
+        fpAmpl1: First path amplitude point 1 (FP_AMPL1)
+        fpAmpl2: First path amplitude point 2 (FP_AMPL2)
+        fpAmpl3: First path amplitude point 3 (PP_AMPL3)
+        cirPower: Channel impulse response power (CIR_PWR)
+        preambleCount: Preamble accumulation count (RXPACC)
+        fpPower: Estimated first path power in dBm
+        rxPower: Estimated receive power in dBm
+        quality: First path amplitude to noise ratio
+        nlos: NLOS indicator in range [0, 1], derived from rxPower - fpPower
+    """
+    NLOS_LOW = 6.0 # Power difference in dB below which a channel is considered LOS
+    NLOS_HIGH = 10.0 # Power difference in dB above which a channel is considered NLOS
+
+    __slots__ = ("rawTimestamp", "noise", "fpAmpl1", "fpAmpl2", "fpAmpl3", "cirPower", "preambleCount",
+                 "fpPower", "rxPower", "quality", "nlos")
+
+    def __init__(self, rxfinfo=None, rxfqual=None, rxtime=None, prf=C.TX_PULSE_FREQ_64MHZ):
+        if rxfinfo is None:
+            for name in self.__slots__:
+                setattr(self, name, 0)
+        else:
+            self.update(rxfinfo, rxfqual, rxtime, prf)
+
+    def update(self, rxfinfo, rxfqual, rxtime, prf):
+        """
+        Compute the diagnostics of a new frame in place.
+
+        Args:
+            rxfinfo: Contents of RX_FINFO (4 bytes)
+            rxfqual: Contents of RX_FQUAL (8 bytes)
+            rxtime: Contents of RX_TIME (14 bytes)
+            prf: Pulse repetition frequency identifier from DW1000Constants
+        """
+        self.rawTimestamp = rxtime[0] | rxtime[1] << 8 | rxtime[2] << 16 | rxtime[3] << 24 | rxtime[4] << 32
+        self.fpAmpl1 = rxtime[7] | rxtime[8] << 8
+        self.noise = rxfqual[0] | rxfqual[1] << 8
+        self.fpAmpl2 = rxfqual[2] | rxfqual[3] << 8
+        self.fpAmpl3 = rxfqual[4] | rxfqual[5] << 8
+        self.cirPower = rxfqual[6] | rxfqual[7] << 8
+        self.preambleCount = ((rxfinfo[2] >> 4) & C.MASK_LS_BYTE) | (rxfinfo[3] << 4)
+
+        if prf == C.TX_PULSE_FREQ_16MHZ:
+            A = C.A_16MHZ
+            corrFac = C.CORRFAC_16MHZ
+        else:
+            A = C.A_64MHZ
+            corrFac = C.CORRFAC_64MHZ
+
+        N2 = float(self.preambleCount * self.preambleCount)
+
+        self.fpPower = -math.inf
+        fp = self.fpAmpl1 * self.fpAmpl1 + self.fpAmpl2 * self.fpAmpl2 + self.fpAmpl3 * self.fpAmpl3
+        if fp > 0 and N2 > 0:
+            self.fpPower = self.correctPower(C.PWR_COEFF2 * math.log10(fp / N2) - A, corrFac)
+
+        self.rxPower = 0.
+        if self.cirPower > 0 and N2 > 0:
+            self.rxPower = C.PWR_COEFF2 * math.log10((float(self.cirPower) * float(C.TWOPOWER17)) / N2) - A
+        self.rxPower = self.correctPower(self.rxPower, corrFac)
+
+        self.quality = self.fpAmpl2 / float(self.noise) if self.noise else 0.
+
+        difference = self.rxPower - self.fpPower
+        self.nlos = min(1., max(0., (difference - self.NLOS_LOW) / (self.NLOS_HIGH - self.NLOS_LOW)))
+
+    def assign(self, other):
+        """
+        Copy all values of another diagnostics object.
+
+        Args:
+            other (DW1000Diagnostics): Source
+        """
+        for name in self.__slots__:
+            setattr(self, name, getattr(other, name))
+
+    @staticmethod
+    def correctPower(power, corrFac):
+        """
+        Apply the non linearity correction of the power estimates.
+
+        Args:
+            power: Estimated power in dBm
+            corrFac: Correction factor for the used PRF
+
+        Returns:
+            Corrected power in dBm
+        """
+        if power <= -C.PWR_COEFF:
+            return power
+        return power + (power + C.PWR_COEFF) * corrFac
+
+    def __str__(self):
+        return "{:.2f} {:.2f} {:.2f} {:.2f}".format(self.fpPower, self.rxPower, self.quality, self.nlos)
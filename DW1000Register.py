@@ -4,7 +4,7 @@ This module provides a class to manage DWM1000 registers on the host device.
 """
 
 import DW1000Constants as C
-from Helper import writeValueToBytes
+from Helper import writeValueToBytes, bitMask
 
 class DW1000Register:
     """
@@ -20,13 +20,27 @@ class DW1000Register:
         subaddress: Store the subaddress
         size: Store the size
         data: Host side buffer to hold the contents of the referenced ic memory
+        value: Integer view of the data buffer (little endian)
+
+    Multiple bits are passed either as integer mask (see the bit groups in
+    DW1000Constants) or as list of bit indices, which is converted to a mask.
     """
+    __slots__ = ("address", "subaddress", "size", "data")
+
     def __init__(self, address, subaddress, size):
         self.address = address
         self.subaddress = subaddress
         self.size = size
         self.data = bytearray(self.size)
 
+    @property
+    def value(self):
+        return int.from_bytes(self.data, "little")
+
+    @value.setter
+    def value(self, value):
+        self.data[:] = value.to_bytes(self.size, "little")
+
     def setBit(self, bit, value):
         """
         This function sets a single bit inside the buffer.
@@ -35,26 +49,27 @@ class DW1000Register:
             bit: Index of the bit
             value: 1 or 0
         """
-        shift = bit % 8
-        byteidx = int(bit / 8)
-
         if value:
-            self.data[byteidx] |= 0x1 << shift
+            self.data[bit >> 3] |= 0x1 << (bit & 0x7)
         else:
-            self.data[byteidx] &= ~(0x1 << shift)
+            self.data[bit >> 3] &= ~(0x1 << (bit & 0x7))
 
     def setBits(self, bits, value):
         """
         This function sets multiple bits.
 
-        Sets all specified bits to the same value. Uses setBit() internally.
+        Sets all specified bits to the same value.
 
         Args:
-            bits: List of bits to set
+            bits: Mask or list of bits to set
             value: 1 or 0
         """
-        for bit in bits:
-            self.setBit(bit, value)
+        if not isinstance(bits, int):
+            bits = bitMask(bits)
+        if value:
+            self.value = self.value | bits
+        else:
+            self.value = self.value & ~bits
 
     def getBit(self, bit):
         """
@@ -66,29 +81,21 @@ class DW1000Register:
         Returns:
             Value of the bit
         """
-        shift = bit % 8
-        byteidx = int(bit / 8)
-
-        return (self.data[byteidx] >> shift) & 0x1
+        return (self.data[bit >> 3] >> (bit & 0x7)) & 0x1
 
     def getBitsOr(self, bits):
         """
         This function extracts an or reduction of the valuews of multiple bits.
 
-        Uses getBit() internally.
-
         Args:
-            bits: List of bits to get
+            bits: Mask or list of bits to get
 
         Returns:
             Value of all bits ored together
         """
-        ret = 0
-
-        for bit in bits:
-            ret |= self.getBit(bit)
-
-        return ret
+        if not isinstance(bits, int):
+            bits = bitMask(bits)
+        return 1 if int.from_bytes(self.data, "little") & bits else 0
 
     def setAll(self, value):
         """
@@ -97,14 +104,13 @@ class DW1000Register:
         Args:
             value: Value to use for setting
         """
-        for i in range(0, self.size):
-            self.data[i] = value
+        self.data[:] = bytes((value,)) * self.size
 
     def clear(self):
         """
         This function clears the whole data buffer to 0.
         """
-        self.setAll(0x00)
+        self.data[:] = bytes(self.size)
 
     def writeValue(self, value, len=None):
         """
@@ -35,3 +35,19 @@ def convertStringToByte(string):
     for i in range(0, 8):
         data[i] = (int(string[i * 3], 16) << 4) + int(string[i * 3 + 1], 16)
     return data
+
+
+def bitMask(bits):
+    """
+    This function builds an integer mask from bit indices.
+
+    Args:
+        bits: Iterable of bit indices
+
+    Returns:
+        The mask with all specified bits set
+    """
+    mask = 0
+    for bit in bits:
+        mask |= 1 << bit
+    return mask
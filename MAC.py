@@ -4,8 +4,6 @@
 This module provides all functions necessary to encode/decode MAC header and payloads of messages from byte strings.
 """
 
-from construct import Struct, BitStruct, BitsInteger, Bit, Padding, Embedded, Byte, Probe, If, IfThenElse, Tell
-
 # Frame Control Frame Type
 FT_BEACON = 0b000
 FT_DATA = 0b001
@@ -22,92 +20,134 @@ AD_EAD = 0b11  # 8 octet address
 IEEE802_15_4_2003 = 0b00
 IEEE802_15_4 = 0b01
 
-macShortAddrStruct = Struct(
-    'shortAddr'/Byte[2]
-)
-
-macExtAddrStruct = Struct(
-    'extAddr'/Byte[8]
-)
-
-macFrameControlStruct = BitStruct(
-    Padding(1),
-    'panCompression'/Bit,
-    'ackRequest'/Bit,
-    'framePending'/Bit,
-    'secEnable'/Bit,
-    'frameType'/BitsInteger(3),
-    'srcAddrMode'/BitsInteger(2),
-    'frameVersion'/BitsInteger(2),
-    'destAddrMode'/BitsInteger(2),
-    Padding(2)
-)
-
-macHeaderStruct = Struct(
-    'frameControl'/macFrameControlStruct,
-    'seqNumber'/Byte,
-    'destPAN'/Byte[lambda this: 2 if this.frameControl.destAddrMode & 0b10 else 0],
-    'destAddr'/Byte[lambda this: 8 if this.frameControl.destAddrMode == 0b11 else (2 if this.frameControl.destAddrMode == 0b10 else 0)],
-    'srcPAN'/Byte[lambda this: 2 if this.frameControl.srcAddrMode & 0b10 and this.frameControl.panCompression == 0 else 0],
-    'srcAddr'/Byte[lambda this: 8 if this.frameControl.srcAddrMode == 0b11 else (2 if this.frameControl.srcAddrMode == 0b10 else 0)],
-    'auxSecHdr'/Byte[lambda this: 14 if this.frameControl.secEnable else 0], # Spec says 0, 5, 6, 10, 14 but not used here
-    'dataOffset'/Tell # Get size of header to later extract data
-)
-
-# Beacon
-
-macGTSSpecStruct = BitStruct(
-    'gtsDescCnt'/BitsInteger(3),
-    Padding(4),
-    'gtsPermit'/Bit
-)
-
-macGTSDirStruct = BitStruct(
-    'gtsDirMask'/Bit[7],
-    Padding(1)
-)
-
-macGTSListElementStruct = BitStruct(
-    'devShortAddr'/BitsInteger(16),
-    'gtsStartSlot'/BitsInteger(4),
-    'gtsLen'/BitsInteger(4)
-)
-
-macGTSInfoStruct = Struct(
-    'gtsSpec'/macGTSSpecStruct,
-    'gtsDir'/macGTSDirStruct[lambda this: 0 if this.gtsSpec.gtsDescCnt == 0 else 1],
-    'gtsList'/macGTSListElementStruct[lambda this: this.gtsSpec.gtsDescCnt]
-)
-
-macPendAddrSpecStruct = BitStruct(
-    'numShortAddrPending'/BitsInteger(3),
-    Padding(1),
-    'numExtAddrPending'/BitsInteger(3),
-    Padding(1)
-)
-
-macPendAddrInfoStruct = Struct(
-    'pendAddrSpec'/macPendAddrSpecStruct,
-    'addrListShort'/macShortAddrStruct[lambda this: this.pendAddrSpec.numShortAddrPending],
-    'addrListExt'/macExtAddrStruct[lambda this: this.pendAddrSpec.numExtAddrPending]
-)
-
-macSuperFrameStruct = BitStruct(
-    'beaconOrder'/BitsInteger(4),
-    'superframeOrder'/BitsInteger(4),
-    'finalCAPSlot'/BitsInteger(4),
-    'ble'/Bit,
-    Padding(1),
-    'panCoordinator'/Bit,
-    'assocPermit'/Bit
-)
-
-macPayloadBeaconStruct = Struct(
-    'superframe'/macSuperFrameStruct,
-    'gts'/macGTSInfoStruct,
-    'pendAddr'/macPendAddrInfoStruct,
-    'macBeaconPayload'/Byte[0] # NOT USED NOW
-)
+# Position of the sequence number, after the frame control field
+SEQ_NUMBER_OFFSET = 2
+
+# Buffer slices kept by a Frame, the cache is cleared when full (frames of many different layouts)
+MAX_FRAME_VIEWS = 64
+
+_structs = None
+
+def structs():
+    """
+    Build the construct structures on first use.
+
+    Importing construct and building the structures takes a large part of the
+    startup time, the receive and transmit paths (Frame, MACHeader.encode) do
+    not need them. The structures are also available as module attributes,
+    e.g. MAC.macHeaderStruct.
+
+    Returns:
+        (dict): Structures by name
+    """
+    global _structs
+    if _structs is None:
+        from construct import Struct, BitStruct, BitsInteger, Bit, Padding, Embedded, Byte, Probe, If, IfThenElse, Tell
+
+        macShortAddrStruct = Struct(
+            'shortAddr'/Byte[2]
+        )
+
+        macExtAddrStruct = Struct(
+            'extAddr'/Byte[8]
+        )
+
+        macFrameControlStruct = BitStruct(
+            Padding(1),
+            'panCompression'/Bit,
+            'ackRequest'/Bit,
+            'framePending'/Bit,
+            'secEnable'/Bit,
+            'frameType'/BitsInteger(3),
+            'srcAddrMode'/BitsInteger(2),
+            'frameVersion'/BitsInteger(2),
+            'destAddrMode'/BitsInteger(2),
+            Padding(2)
+        )
+
+        macHeaderStruct = Struct(
+            'frameControl'/macFrameControlStruct,
+            'seqNumber'/Byte,
+            'destPAN'/Byte[lambda this: 2 if this.frameControl.destAddrMode & 0b10 else 0],
+            'destAddr'/Byte[lambda this: 8 if this.frameControl.destAddrMode == 0b11 else (2 if this.frameControl.destAddrMode == 0b10 else 0)],
+            'srcPAN'/Byte[lambda this: 2 if this.frameControl.srcAddrMode & 0b10 and this.frameControl.panCompression == 0 else 0],
+            'srcAddr'/Byte[lambda this: 8 if this.frameControl.srcAddrMode == 0b11 else (2 if this.frameControl.srcAddrMode == 0b10 else 0)],
+            'auxSecHdr'/Byte[lambda this: 14 if this.frameControl.secEnable else 0], # Spec says 0, 5, 6, 10, 14 but not used here
+            'dataOffset'/Tell # Get size of header to later extract data
+        )
+
+        # Beacon
+
+        macGTSSpecStruct = BitStruct(
+            'gtsDescCnt'/BitsInteger(3),
+            Padding(4),
+            'gtsPermit'/Bit
+        )
+
+        macGTSDirStruct = BitStruct(
+            'gtsDirMask'/Bit[7],
+            Padding(1)
+        )
+
+        macGTSListElementStruct = BitStruct(
+            'devShortAddr'/BitsInteger(16),
+            'gtsStartSlot'/BitsInteger(4),
+            'gtsLen'/BitsInteger(4)
+        )
+
+        macGTSInfoStruct = Struct(
+            'gtsSpec'/macGTSSpecStruct,
+            'gtsDir'/macGTSDirStruct[lambda this: 0 if this.gtsSpec.gtsDescCnt == 0 else 1],
+            'gtsList'/macGTSListElementStruct[lambda this: this.gtsSpec.gtsDescCnt]
+        )
+
+        macPendAddrSpecStruct = BitStruct(
+            'numShortAddrPending'/BitsInteger(3),
+            Padding(1),
+            'numExtAddrPending'/BitsInteger(3),
+            Padding(1)
+        )
+
+        macPendAddrInfoStruct = Struct(
+            'pendAddrSpec'/macPendAddrSpecStruct,
+            'addrListShort'/macShortAddrStruct[lambda this: this.pendAddrSpec.numShortAddrPending],
+            'addrListExt'/macExtAddrStruct[lambda this: this.pendAddrSpec.numExtAddrPending]
+        )
+
+        macSuperFrameStruct = BitStruct(
+            'beaconOrder'/BitsInteger(4),
+            'superframeOrder'/BitsInteger(4),
+            'finalCAPSlot'/BitsInteger(4),
+            'ble'/Bit,
+            Padding(1),
+            'panCoordinator'/Bit,
+            'assocPermit'/Bit
+        )
+
+        macPayloadBeaconStruct = Struct(
+            'superframe'/macSuperFrameStruct,
+            'gts'/macGTSInfoStruct,
+            'pendAddr'/macPendAddrInfoStruct,
+            'macBeaconPayload'/Byte[0] # NOT USED NOW
+        )
+
+        _structs = {name: value for name, value in locals().items() if name.startswith("mac")}
+    return _structs
+
+def __getattr__(name):
+    if name.startswith("mac") and name.endswith("Struct"):
+        return structs()[name]
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+def addressLength(mode):
+    """
+    Args:
+        mode: Addressing mode, AD_EAD | AD_SAD | AD_NOT
+
+    Returns:
+        Length of the address in bytes
+    """
+    return 8 if mode == AD_EAD else (2 if mode == AD_SAD else 0)
 
 class FrameControl:
     """
@@ -163,11 +203,26 @@ class MACHeader():
         Returns:
             (bytes): The encoded header
         """
-        global macHeaderStruct
-
-        machdrdict = vars(self)
-        machdrdict['frameControl'] = vars(machdrdict['frameControl'])
-        return macHeaderStruct.build(machdrdict)
+        fc = self.frameControl
+        control = ((fc.frameType & 0b111) | (fc.secEnable & 1) << 3 | (fc.framePending & 1) << 4 | (fc.ackRequest & 1) << 5 |
+                   (fc.panCompression & 1) << 6 | (fc.destAddrMode & 0b11) << 10 | (fc.frameVersion & 0b11) << 12 |
+                   (fc.srcAddrMode & 0b11) << 14)
+        header = bytearray(control.to_bytes(2, "little"))
+        header.append(self.seqNumber)
+
+        # Same layout as macHeaderStruct
+        fields = (
+            ("destPAN", self.destPAN, 2 if fc.destAddrMode & 0b10 else 0),
+            ("destAddr", self.destAddr, addressLength(fc.destAddrMode)),
+            ("srcPAN", self.srcPAN, 2 if fc.srcAddrMode & 0b10 and not fc.panCompression else 0),
+            ("srcAddr", self.srcAddr, addressLength(fc.srcAddrMode)),
+            ("auxSecHdr", self.auxSecHdr, 14 if fc.secEnable else 0)
+        )
+        for name, value, size in fields:
+            if len(value) != size:
+                raise ValueError("MAC header field {} has {} bytes, expected {}".format(name, len(value), size))
+            header += bytes(value)
+        return bytes(header)
 
     @staticmethod
     def decode(rawhdr):
@@ -179,11 +234,9 @@ class MACHeader():
         Returns:
             (MACHeader): MAC header of the message
         """
-        global macHeaderStruct
-
         macHeader = MACHeader()
 
-        con = macHeaderStruct.parse(rawhdr)
+        con = structs()["macHeaderStruct"].parse(rawhdr)
         for key, val in con.items():
             if key == "frameControl":
                 for key2, val2 in val.items():
@@ -211,16 +264,140 @@ class MACHeader():
 
         return ret
 
+class Frame():
+    """
+    Received 802.15.4a frame in a reusable receive buffer.
+
+    The buffer is filled by the driver (see DW1000.getFrame()) and load() parses the
+    header fields once. Addresses, payload and FCS are memoryview slices of the
+    buffer, so no bytes are copied. The slices are reused for frames with the same
+    layout (see slice()), so loading a frame allocates nothing in steady state. All of
+    them are only valid until the next frame is loaded, copy them (e.g.
+    bytes(frame.srcAddr)) to keep them longer.
+
+    Args:
+        size: Size of the receive buffer in bytes
+
+    Attributes:
+        buffer (bytearray): Receive buffer
+        view (memoryview): View of the whole buffer
+        length: Frame length including the FCS
+        frameType: FT_BEACON | FT_DATA | FT_ACK | FT_MAC, FT_INV if the header is truncated
+        ackRequest: Acknowledge frame requested by the sender
+        seqNumber: Sequence number of the frame
+        destPAN (memoryview): Destination private area network identifier
+        destAddr (memoryview): Destination address, either EID, SID or empty
+        srcPAN (memoryview): Source private area network identifier
+        srcAddr (memoryview): Source address, either EID, SID or empty
+        dataOffset: Index of start of payload
+        views (dict): Slices of the buffer by (start, end), see slice()
+    """
+    __slots__ = ("buffer", "view", "length", "frameType", "ackRequest", "seqNumber",
+                 "destPAN", "destAddr", "srcPAN", "srcAddr", "dataOffset", "views", "_header")
+
+    def __init__(self, size):
+        self.buffer = bytearray(size)
+        self.view = memoryview(self.buffer)
+        self.views = {}
+        self.load(0)
+
+    def slice(self, start, end):
+        """
+        Args:
+            start: Index of the first byte
+            end: Index after the last byte
+
+        Returns:
+            (memoryview): Slice of the buffer, created on the first use of the range
+        """
+        view = self.views.get((start, end))
+        if view is None:
+            if len(self.views) >= MAX_FRAME_VIEWS:
+                self.views.clear()
+            view = self.views[(start, end)] = self.view[start:end]
+        return view
+
+    def load(self, length):
+        """
+        Parse the header of a new frame in the buffer.
+
+        Args:
+            length: Frame length including the FCS
+        """
+        view = self.view
+        empty = self.slice(0, 0)
+        self.length = length
+        self._header = None
+        self.frameType = FT_INV
+        self.ackRequest = 0
+        self.seqNumber = 0
+        self.destPAN = self.destAddr = self.srcPAN = self.srcAddr = empty
+        self.dataOffset = max(length - 2, 0)
+        if length < 5:
+            return
+
+        # Same layout as macHeaderStruct
+        control = view[0] | (view[1] << 8)
+        destAddrMode = (control >> 10) & 0b11
+        srcAddrMode = (control >> 14) & 0b11
+        offset = 3
+        if destAddrMode & 0b10:
+            end = offset + 2 + (8 if destAddrMode == AD_EAD else 2)
+            self.destPAN = self.slice(offset, offset + 2)
+            self.destAddr = self.slice(offset + 2, end)
+            offset = end
+        if srcAddrMode & 0b10:
+            if not control & 0x40: # panCompression
+                self.srcPAN = self.slice(offset, offset + 2)
+                offset += 2
+            end = offset + (8 if srcAddrMode == AD_EAD else 2)
+            self.srcAddr = self.slice(offset, end)
+            offset = end
+        if control & 0x08: # secEnable
+            offset += 14
+        if offset > length - 2:
+            self.destPAN = self.destAddr = self.srcPAN = self.srcAddr = empty
+            return
+
+        self.frameType = control & 0b111
+        self.ackRequest = (control >> 5) & 1
+        self.seqNumber = view[2]
+        self.dataOffset = offset
+
+    @property
+    def data(self):
+        """ (memoryview): The whole frame including the FCS """
+        return self.slice(0, self.length)
+
+    @property
+    def payload(self):
+        """ (memoryview): Payload without header and FCS """
+        return self.slice(self.dataOffset, max(self.length - 2, 0))
+
+    @property
+    def fcs(self):
+        """ (memoryview): Frame check sequence """
+        return self.slice(max(self.length - 2, 0), self.length)
+
+    @property
+    def header(self):
+        """ (MACHeader): Full header, decoded on first access and cached until the next frame """
+        if self._header is None:
+            self._header = MACHeader.decode(self.data)
+        return self._header
+
 def getPayload(message):
     """
     Use to extract payload without header or crc.
 
     Args:
-        message (bytes): 802.15.4a message
+        message (bytes): 802.15.4a message or a Frame
 
     Returns:
-        (bytes): payload data
+        (bytes): payload data, a memoryview for a Frame or a memoryview message
     """
+    if isinstance(message, Frame):
+        return message.payload
     try:
         header = MACHeader.decode(message)
         return message[header.dataOffset:-2]
@@ -8,19 +8,22 @@ import logging
 
 import node
 import DW1000Constants as C
-import config
+from logsetup import TRACE
 
 class Anchor(node.Node):
     """
     Anchor class.
 
+    Args:
+        config (configuration.Config): Configuration, see Node
+
     Attributes:
         time_recv: DWM1000 timestamp of last received frame
         address: Address of last sender
 
     """
-    def __init__(self):
-        super().__init__()
+    def __init__(self, config=None):
+        super().__init__(config)
 
         self.time_recv = 0 # Timestamp of receiving poll message
         self.address = 0 # TODO: Use this field to store address of last message sender
@@ -28,22 +31,22 @@ class Anchor(node.Node):
         # Callbacks, see interruptCB
         self.cb_rxfcg = self.cb_rxfcg_
         self.cb_txfrs = self.cb_txfrs_
-        self.cb_rxrfto = self.cb_rxrfto_
-        self.cb_rxerr = self.cb_rxerr_
 
         self.cb_reset = self.cb_reset_
 
-    def setup(self):
-        """ Anchor setup 
+    def setupRadio(self):
+        """ Anchor radio setup
 
-        Call after creation of a anchor. Set sysctrl and sysmask of DW1000.
+        Called by setup() and on recovery. Set sysctrl and sysmask of DW1000. The receiver
+        stays on with both receive buffers, see Node.interruptCB() for draining and overruns.
         """
-        super().setup()
+        super().setupRadio()
 
         self.dw1000.syscfg.setBits((C.DIS_STXP_BIT, C.RXAUTR_BIT, C.FFEN_BIT, C.FFAD_BIT, C.AUTOACK_BIT), True)
         self.dw1000.writeRegister(self.dw1000.syscfg)
 
         self.dw1000.enableDoubleBuffer()
+        self.dw1000.permanentReceive = True
 
         self.dw1000.sysmask.clear()
         self.dw1000.sysmask.setBits((C.MRXOVRR_BIT, C.MRXFCG_BIT, C.MTXFRS_BIT, C.MAAT_BIT), True)
@@ -54,29 +57,20 @@ class Anchor(node.Node):
     def cb_rxfcg_(self):
         """ Custom rxfcg callback """
         self.time_recv = self.dw1000.getReceiveTimestamp()
-        self.address = self.header.srcAddr
+        self.address = bytes(self.frame.srcAddr) # The frame buffer is reused by the next reception
 
     def cb_txfrs_(self):
         """ Custom txfrs callback """
         if self.status.getBit(C.AAT_BIT):
             time_send = self.dw1000.getTransmitTimestamp()
             reply_time = self.dw1000.wrapTimestamp(time_send - self.time_recv)
-            logging.debug("Sending reply time {}".format(reply_time))
-            self.dw1000.sendMessage(self.address, config.pan.to_bytes(2, byteorder='little'), (str(self.time_recv)+ " " + str(time_send)).encode(), ackReq=False, wait4resp=True, delay=0)
+            if __debug__ and TRACE:
+                logging.debug("Sending reply time %d", reply_time)
+            self.dw1000.sendMessage(self.address, self.config.pan_bytes, (str(self.time_recv)+ " " + str(time_send)).encode(), ackReq=False, wait4resp=True, delay=0)
             self.enableRx=False
 
-    def cb_rxrfto_(self):
-        """ Custom rxrfto callback """
-        self.enableRx = True
-
-    def cb_rxerr_(self):
-        """ Custom rxerr callback """
-        self.enableRx = True
-
     def cb_reset_(self):
-        """ Custom reset callback """
-        self.dw1000.rxreset()
-        self.dw1000.idle()
+        """ Custom reset callback, re-enables the receiver (see Node.recover()) """
         self.dw1000.newReceive()
         self.dw1000.startReceive()
 
@@ -89,5 +83,8 @@ def main():
     except KeyboardInterrupt:
         anchor.dw1000.stop()
 
+    logging.info("Received: {}\nOverruns: {}\nErrors: {}\nTimeouts: {}\n".format(
+        anchor.rx_frames, anchor.rx_overruns, anchor.rx_errors, anchor.timeouts))
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,640 @@
+"""@package benchmark
+Benchmarks of the driver, MAC, ranging and solver hot paths.
+
+Runs without hardware: the DW1000 is connected to FakeSpi, an in-memory register
+file, and FakeGpio. Every benchmark reports the best time per call over several
+repetitions. The results can be saved as JSON and compared with a previous run,
+a benchmark slower than the reference by more than the threshold fails the run.
+
+With --allocations the objects allocated per call are counted with tracemalloc
+instead (see allocations()). The per frame paths (FRAME_PATHS) must not allocate.
+
+With --imports the startup modules (STARTUP_MODULES) are imported in fresh
+interpreters with python -X importtime instead. They must not import any of
+HEAVY_MODULES, those are loaded on demand or in the background.
+
+Usage:
+    python benchmark.py [--filter spi] [--save results.json] [--compare reference.json] [--threshold 0.2]
+    python benchmark.py --allocations
+    python benchmark.py --imports [--save results.json] [--compare reference.json]
+"""
+
+import os
+import sys
+import json
+import time
+import timeit
+import platform
+import argparse
+import subprocess
+import tracemalloc
+
+import config
+import DW1000Constants as C
+from DW1000 import DW1000
+from DW1000Register import DW1000Register
+import MAC
+from node import Node
+from trilaterate import Trilaterator
+
+EID = "7D:00:22:EA:82:60:3B:00"
+PAN = 0xdeca
+
+# Startup imports of the roles (module, must not import HEAVY_MODULES)
+STARTUP_MODULES = (("main", True), ("anchor", True), ("tag", True), ("trilaterate", False))
+HEAVY_MODULES = ("numpy", "scipy", "construct")
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+TRACE_FRAMES = 32 # Traceback depth of the traced allocations, deep enough to reach the repository modules
+NUMBERS = (int, float, complex) # Not counted by allocations()
+
+# Benchmarks run once per received or sent frame, they must not allocate (see allocations())
+FRAME_PATHS = ("spi_read_status", "clear_status", "frame_load", "send_poll", "receive_timestamp", "clock_offset", "transmit_timestamp", "set_delay",
+               "interrupt_idle", "interrupt_rxfcg", "interrupt_rxfcg_double", "interrupt_rxovrr")
+
+class FakeGpio():
+    """
+    Stand-in for RPi.GPIO. Outputs on pins with a listener are forwarded to it.
+
+    Attributes:
+        listeners: Output listener per pin, called with the new level
+        levels: Last output level per pin
+        callbacks: Edge callback per pin with event detection, see edge()
+        released: Pins released by cleanup()
+    """
+    BCM = 11
+    IN = 1
+    OUT = 0
+    LOW = 0
+    HIGH = 1
+    PUD_DOWN = 21
+    RISING = 31
+
+    def __init__(self):
+        self.listeners = {}
+        self.levels = {}
+        self.callbacks = {}
+        self.released = []
+
+    def setwarnings(self, flag):
+        pass
+
+    def setmode(self, mode):
+        pass
+
+    def setup(self, pin, direction, initial=None, pull_up_down=None):
+        if initial is not None:
+            self.output(pin, initial)
+
+    def output(self, pin, level):
+        self.levels[pin] = level
+        listener = self.listeners.get(pin)
+        if listener is not None:
+            listener(level)
+
+    def input(self, pin):
+        return self.levels.get(pin, self.LOW)
+
+    def cleanup(self, pin=None):
+        self.released.extend([] if pin is None else [pin] if isinstance(pin, int) else pin)
+
+    def add_event_detect(self, pin, edge, callback=None):
+        self.callbacks[pin] = callback
+
+    def remove_event_detect(self, pin):
+        self.callbacks.pop(pin, None)
+
+    def edge(self, pin):
+        """ Rising edge on an input, calls the callback of the pin like the RPi.GPIO event thread """
+        self.callbacks[pin](pin)
+
+class FakeSpi():
+    """
+    Stand-in for spidev.SpiDev backed by a register file.
+
+    Decodes the transaction header of the DW1000 SPI protocol and reads or writes
+    the addressed register. As on the chip, writing SYS_STATUS clears the bits
+    written as 1. Transactions are framed by the chip select line, see select().
+
+    Attributes:
+        memory: Register contents, register address to bytearray
+        transfers: Number of xfer calls
+    """
+    def __init__(self):
+        self.memory = {C.DEV_ID: bytearray(C.DEV_ID_DW1000.to_bytes(4, "little"))}
+        self.transfers = 0
+        self.max_speed_hz = 0
+        self.no_cs = False
+        self.header = []
+        self.write = False
+        self.address = 0
+        self.offset = 0
+
+    def open(self, bus, device):
+        pass
+
+    def close(self):
+        pass
+
+    def select(self, level):
+        """ Chip select listener, a low level starts a new transaction """
+        if level == FakeGpio.LOW:
+            self.header = []
+
+    def register(self, address, size):
+        """
+        Args:
+            address: Register address
+            size: Minimum size in bytes
+
+        Returns:
+            (bytearray): Contents of the register
+        """
+        data = self.memory.setdefault(address, bytearray(size))
+        if len(data) < size:
+            data.extend(bytearray(size - len(data)))
+        return data
+
+    def xfer(self, values):
+        self.transfers += 1
+        result = []
+        for value in values:
+            if self.header is not None:
+                result.append(0)
+                self.decodeHeader(value)
+                continue
+            data = self.register(self.address, self.offset + 1)
+            if self.write:
+                if self.address == C.SYS_STATUS:
+                    data[self.offset] &= ~value & 0xFF
+                else:
+                    data[self.offset] = value
+                result.append(0)
+            else:
+                result.append(data[self.offset])
+            self.offset += 1
+        return result
+
+    xfer2 = xfer
+
+    def decodeHeader(self, value):
+        self.header.append(value)
+        first = self.header[0]
+        if not first & C.READ_SUB:
+            length = 1
+        elif len(self.header) < 2 or not self.header[1] & C.RW_SUB_EXT:
+            length = 2
+        else:
+            length = 3
+        if len(self.header) < length:
+            return
+        self.write = bool(first & C.WRITE)
+        self.address = first & 0x3F
+        self.offset = 0
+        if length == 2:
+            self.offset = self.header[1]
+        elif length == 3:
+            self.offset = (self.header[1] & 0x7F) | (self.header[2] << 7)
+        self.header = None
+
+def fakeDevice(spi=None):
+    """
+    Args:
+        spi: FakeSpi to connect, a new one if not given
+
+    Returns:
+        (DW1000): Configured device connected to a FakeSpi and FakeGpio
+    """
+    spi = spi if spi is not None else FakeSpi()
+    gpio = FakeGpio()
+    gpio.listeners[config.pin_cs] = spi.select
+    device = DW1000(config.pin_cs, config.pin_rst, config.pin_irq, spi=spi, gpio=gpio)
+    device.begin()
+    device.generalConfiguration(EID, PAN, C.MODE_STANDARD)
+    return device
+
+def dataFrame(seq=0x42, payload=b"1234567890 1234567890"):
+    """
+    Returns:
+        (bytes): Encoded data frame like the ones of Anchor and Tag, without CRC
+    """
+    header = MAC.MACHeader()
+    header.frameControl.frameType = MAC.FT_DATA
+    header.frameControl.ackRequest = 1
+    header.frameControl.panCompression = 1
+    header.frameControl.destAddrMode = MAC.AD_SAD
+    header.frameControl.frameVersion = MAC.IEEE802_15_4_2003
+    header.frameControl.srcAddrMode = MAC.AD_SAD
+    header.seqNumber = seq
+    header.destPAN = PAN.to_bytes(2, "little")
+    header.destAddr = b"\x00\x3b"
+    header.srcAddr = b"\x0a\x3b"
+    return header.encode() + payload
+
+def benchmarks():
+    """
+    Set up the benchmarks.
+
+    Returns:
+        (list): (name, function) pairs, every function runs one operation
+    """
+    device = fakeDevice()
+    spi = device.spi
+    data = bytearray(32)
+    frame = dataFrame()
+    status = spi.register(C.SYS_STATUS, 5)
+    status_bits = [bit for bit in range(0, 40) if C.SYS_STATUS_ALL_EVENTS >> bit & 1]
+
+    def readStatus():
+        device.readRegister(device.sysstatus)
+
+    def readFrame():
+        device.readBytes(C.RX_BUFFER, C.NO_SUB, data, len(data))
+
+    def writeFrame():
+        device.writeBytes(C.TX_BUFFER, C.NO_SUB, data, len(data))
+
+    def readSubExt():
+        device.readBytes(C.LDE_CTRL, C.LDE_RXANTD_SUB, data, 2)
+
+    register = DW1000Register(C.SYS_STATUS, C.NO_SUB, 5)
+    register.setBit(C.RXFCG_BIT, True)
+
+    def getBitsOr():
+        register.getBitsOr(C.SYS_STATUS_ALL_EVENTS)
+
+    def getBitsOrList():
+        register.getBitsOr(status_bits)
+
+    def setBits():
+        register.setBits(C.SYS_STATUS_ALL_RX_GOOD, True)
+
+    def clear():
+        register.clear()
+
+    def statusDecode():
+        # Condition and branches of one Node.interruptCB loop iteration
+        if register.getBitsOr(C.SYS_STATUS_ALL_EVENTS):
+            register.getBit(C.RXFCG_BIT)
+            register.getBit(C.TXFRS_BIT)
+            register.getBitsOr(C.SYS_STATUS_ALL_RX_TO)
+            register.getBitsOr(C.SYS_STATUS_ALL_RX_ERR)
+
+    def clearStatus():
+        device.clearStatus(C.SYS_STATUS_ALL_RX_GOOD)
+
+    def macEncode():
+        dataFrame()
+
+    def macDecode():
+        MAC.MACHeader.decode(frame)
+
+    rx = MAC.Frame(C.LEN_RX_BUFFER)
+    rx.buffer[0:len(frame)] = frame
+
+    def frameLoad():
+        rx.load(len(frame) + 2)
+        rx.payload
+
+    def sendMessage():
+        device.sendMessage(b"\x0a\x3b", PAN.to_bytes(2, "little"), b"1234567890 1234567890")
+
+    poll = device.buildFrame(b"\x0a\x3b", PAN.to_bytes(2, "little"), b"")
+
+    def sendPoll():
+        device.sendFrame(poll)
+
+    def correctTimestamp():
+        device.correctTimestamp(0x123456789, -85.3)
+
+    def receiveTimestamp():
+        device.getReceiveTimestamp()
+
+    def clockOffset():
+        device.getClockOffset()
+
+    def transmitTimestamp():
+        device.getTransmitTimestamp()
+
+    def setDelay():
+        device.setDelay(0, C.MICROSECONDS, "tx")
+
+    snapshot = device.takeSnapshot()
+
+    def configureFull():
+        device.generalConfiguration(EID, PAN, C.MODE_STANDARD)
+
+    def configureSnapshot():
+        device.restoreSnapshot(snapshot)
+
+    node = Node()
+    node.dw1000 = device
+    spi.register(C.RX_FINFO, 4)[0:2] = (len(frame) + 2).to_bytes(2, "little")
+    spi.register(C.RX_BUFFER, len(frame))[0:len(frame)] = frame
+
+    def interruptIdle():
+        node.interruptCB()
+
+    def interruptRxfcg():
+        status[1] = 1 << (C.RXFCG_BIT - 8) | 1 << (C.RXDFR_BIT - 8)
+        node.interruptCB()
+
+    # Permanent receive with both receive buffers like the anchor
+    anchor = Node()
+    anchor.dw1000 = fakeDevice()
+    anchor.dw1000.enableDoubleBuffer()
+    anchor.dw1000.permanentReceive = True
+    anchor_status = anchor.dw1000.spi.register(C.SYS_STATUS, 5)
+    anchor.dw1000.spi.register(C.RX_FINFO, 4)[0:2] = (len(frame) + 2).to_bytes(2, "little")
+    anchor.dw1000.spi.register(C.RX_BUFFER, len(frame))[0:len(frame)] = frame
+
+    def interruptRxfcgDouble():
+        anchor_status[1] = 1 << (C.RXFCG_BIT - 8) | 1 << (C.RXDFR_BIT - 8)
+        anchor.interruptCB()
+
+    def interruptRxovrr():
+        anchor_status[1] = 1 << (C.RXFCG_BIT - 8) | 1 << (C.RXDFR_BIT - 8)
+        anchor_status[2] = 1 << (C.RXOVRR_BIT - 16)
+        anchor.interruptCB()
+
+    beacons = [[0., 0., 0.], [10., 0., 0.], [10., 10., 0.], [0., 10., 0.]]
+    position = [3., 4., 1.]
+    distances = [sum((p - b) ** 2 for p, b in zip(position, beacon)) ** 0.5 for beacon in beacons]
+    solver = Trilaterator()
+    warm = Trilaterator()
+    robust = Trilaterator(loss="soft_l1", f_scale=0.2)
+    batch_beacons = [beacons] * 128
+    batch_distances = [distances] * 128
+    current = list(distances)
+    counter = [0]
+
+    def trilaterate():
+        # Cold start, full solve
+        solver.reset()
+        solver.trilaterate(beacons, distances)
+
+    def trilaterateWarm():
+        # One changed distance per call, answered by an incremental step
+        counter[0] += 1
+        i = counter[0] % 4
+        current[i] = distances[i] + 0.01 * (counter[0] % 3)
+        warm.trilaterate(beacons, current, key=b"\x00\x3b")
+
+    def trilaterateRobust():
+        robust.reset()
+        robust.trilaterate(beacons, distances)
+
+    def trilaterateBatch():
+        solver.trilaterateBatch(batch_beacons, batch_distances)
+
+    return [
+        ("spi_read_status", readStatus),
+        ("spi_read_frame_32", readFrame),
+        ("spi_write_frame_32", writeFrame),
+        ("spi_read_sub_ext", readSubExt),
+        ("register_get_bits_or", getBitsOr),
+        ("register_get_bits_or_list", getBitsOrList),
+        ("register_set_bits", setBits),
+        ("register_clear", clear),
+        ("register_status_decode", statusDecode),
+        ("clear_status", clearStatus),
+        ("mac_encode", macEncode),
+        ("mac_decode", macDecode),
+        ("frame_load", frameLoad),
+        ("send_message", sendMessage),
+        ("send_poll", sendPoll),
+        ("correct_timestamp", correctTimestamp),
+        ("receive_timestamp", receiveTimestamp),
+        ("clock_offset", clockOffset),
+        ("transmit_timestamp", transmitTimestamp),
+        ("set_delay", setDelay),
+        ("configure_full", configureFull),
+        ("configure_snapshot", configureSnapshot),
+        ("interrupt_idle", interruptIdle),
+        ("interrupt_rxfcg", interruptRxfcg),
+        ("interrupt_rxfcg_double", interruptRxfcgDouble),
+        ("interrupt_rxovrr", interruptRxovrr),
+        ("trilaterate", trilaterate),
+        ("trilaterate_warm", trilaterateWarm),
+        ("trilaterate_robust", trilaterateRobust),
+        ("trilaterate_batch_128", trilaterateBatch),
+    ]
+
+def measure(function, repeat=5, min_time=0.05):
+    """
+    Time a function.
+
+    Args:
+        function: Function without arguments
+        repeat: Number of repetitions, the best is reported
+        min_time: Minimum duration of one repetition in seconds
+
+    Returns:
+        (float): Best time per call in seconds
+    """
+    timer = timeit.Timer(function)
+    number = 1
+    while timer.timeit(number) < min_time:
+        number *= 2
+    return min(timer.repeat(repeat, number)) / number
+
+def tracedAllocations(function, number):
+    """
+    Trace the allocations of number calls, see allocations().
+
+    Args:
+        function: Function without arguments
+        number: Number of calls
+
+    Returns:
+        (int, int): Blocks and bytes allocated within the repository modules and kept alive
+    """
+    kept = []
+    def keep(frame, event, arg):
+        if event == "return":
+            kept.extend(value for value in frame.f_locals.values() if not isinstance(value, NUMBERS))
+            if not isinstance(arg, NUMBERS):
+                kept.append(arg)
+
+    tracemalloc.start(TRACE_FRAMES)
+    try:
+        before = tracemalloc.take_snapshot()
+        sys.setprofile(keep)
+        try:
+            for i in range(0, number):
+                function()
+        finally:
+            sys.setprofile(None)
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+
+    filters = [tracemalloc.Filter(True, os.path.join(REPO_DIR, "*"), all_frames=True),
+               tracemalloc.Filter(False, os.path.abspath(__file__))]
+    stats = after.filter_traces(filters).compare_to(before.filter_traces(filters), "traceback")
+    return sum(max(0, s.count_diff) for s in stats), sum(max(0, s.size_diff) for s in stats)
+
+def allocations(function, number=100, warmup=100):
+    """
+    Count the objects allocated by a function per call.
+
+    Memory freed before the call returns is invisible to a comparison of two
+    tracemalloc snapshots. So while the function runs, a profile hook keeps the
+    local variables and the return value of every returning Python function alive,
+    the objects bound to a name or returned show up in the snapshot comparison.
+    Counted are the memory blocks allocated within the repository modules. Not counted:
+    - temporaries never bound to a name
+    - allocations by this module, which holds FakeSpi, FakeGpio and the hook
+    - numbers, Python allocates them for every arithmetic result
+
+    The hook itself, replaced counters and the interpreter specializing code leave
+    a few blocks independent of the number of calls, so the calls are traced twice,
+    number and 2 * number times, and the difference is taken. A single left over
+    block still shows as 1 / number blocks per call, an allocation in every call
+    as at least one.
+
+    Args:
+        function: Function without arguments
+        number: Number of traced calls of the first run
+        warmup: Number of calls before, to fill caches and free lists
+
+    Returns:
+        (float, float): Allocated blocks and bytes per call
+    """
+    for i in range(0, warmup):
+        function()
+    blocks, size = tracedAllocations(function, number)
+    blocks2, size2 = tracedAllocations(function, 2 * number)
+    return max(0, blocks2 - blocks) / number, max(0, size2 - size) / number
+
+def checkAllocations(functions, paths=FRAME_PATHS, filter=""):
+    """
+    Count the allocations of benchmarks and print them.
+
+    Args:
+        functions: (name, function) pairs, see benchmarks()
+        paths: Names of the benchmarks that must not allocate
+        filter: Only run benchmarks containing this string
+
+    Returns:
+        (list): Names of the benchmarks in paths allocating per call
+    """
+    allocating = []
+    for name, function in functions:
+        if filter not in name:
+            continue
+        blocks, size = allocations(function)
+        flag = ""
+        if name in paths and round(blocks) > 0:
+            allocating.append(name)
+            flag = "  ALLOCATES"
+        print("{:26} {:8.2f} blocks/call {:10.1f} B/call{}".format(name, blocks, size, flag))
+    return allocating
+
+def importTimes(module):
+    """
+    Import a module in a fresh interpreter with python -X importtime.
+
+    Args:
+        module: Module name
+
+    Returns:
+        (dict): Cumulative import time in seconds by module name
+    """
+    process = subprocess.run([sys.executable, "-X", "importtime", "-c", "import " + module],
+                             capture_output=True, text=True, cwd=sys.path[0] or None)
+    if process.returncode != 0:
+        raise RuntimeError("Importing {} failed:\n{}".format(module, process.stderr))
+    times = {}
+    for line in process.stderr.splitlines():
+        fields = line.split("|")
+        if line.startswith("import time:") and len(fields) == 3 and fields[1].strip().isdigit():
+            times[fields[2].strip()] = int(fields[1]) / 1e6
+    return times
+
+def compare(results, reference, threshold):
+    """
+    Compare results with a reference run.
+
+    Args:
+        results: Time per call by benchmark name
+        reference: Time per call by benchmark name of the reference run
+        threshold: Relative slowdown above which a benchmark regressed
+
+    Returns:
+        (list): Names of the regressed benchmarks
+    """
+    regressions = []
+    for name, t in results.items():
+        if name not in reference:
+            continue
+        change = t / reference[name] - 1.
+        flag = ""
+        if change > threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print("{:24} {:12.2f} us {:12.2f} us {:+8.1f} %{}".format(name, reference[name] * 1e6, t * 1e6, change * 100, flag))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks of the driver, MAC, ranging and solver hot paths")
+    parser.add_argument("--filter", default="", help="Only run benchmarks containing this string")
+    parser.add_argument("--repeat", type=int, default=5, help="Repetitions per benchmark, the best is reported")
+    parser.add_argument("--min-time", type=float, default=0.05, help="Minimum duration of one repetition in seconds")
+    parser.add_argument("--save", help="Save the results to this JSON file")
+    parser.add_argument("--compare", help="Compare with the results in this JSON file")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Relative slowdown counted as regression")
+    parser.add_argument("--allocations", action="store_true", help="Trace allocations instead of timing")
+    parser.add_argument("--imports", action="store_true", help="Measure the startup imports instead of timing")
+    args = parser.parse_args()
+
+    if args.allocations:
+        allocating = checkAllocations(benchmarks(), FRAME_PATHS, args.filter)
+        if allocating:
+            print("\nPer frame paths allocating: {}".format(", ".join(allocating)))
+            sys.exit(1)
+        return
+
+    results = {}
+    if args.imports:
+        heavy = []
+        for module, light in STARTUP_MODULES:
+            if args.filter not in module:
+                continue
+            # Best of several runs, the first one also writes the bytecode cache
+            runs = [importTimes(module) for i in range(0, args.repeat)]
+            times = min(runs, key=lambda t: t[module])
+            loaded = [m for m in HEAVY_MODULES if m in times]
+            flag = ""
+            if light and loaded:
+                heavy.append(module)
+                flag = "  HEAVY"
+            results["import_" + module] = times[module]
+            print("{:24} {:12.2f} ms {:5} modules  {}{}".format("import_" + module, times[module] * 1e3, len(times),
+                                                               ", ".join(loaded) or "-", flag))
+        if heavy:
+            print("\nStartup modules importing {}: {}".format("/".join(HEAVY_MODULES), ", ".join(heavy)))
+            sys.exit(1)
+    else:
+        for name, function in benchmarks():
+            if args.filter not in name:
+                continue
+            results[name] = measure(function, args.repeat, args.min_time)
+            print("{:24} {:12.2f} us {:14.0f} /s".format(name, results[name] * 1e6, 1. / results[name]))
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"time": time.time(), "python": platform.python_version(), "machine": platform.machine(),
+                       "results": results}, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            reference = json.load(f)["results"]
+        print("\n{:24} {:>15} {:>15} {:>10}".format("benchmark", "reference", "current", "change"))
+        regressions = compare(results, reference, args.threshold)
+        if regressions:
+            print("\nRegressions above {:.0f} %: {}".format(args.threshold * 100, ", ".join(regressions)))
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
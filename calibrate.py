@@ -0,0 +1,367 @@
+"""@package calibrate
+Antenna delay calibration.
+
+The configured antenna delay (config.antenna_delay, see DW1000.setAntennaDelay())
+is subtracted from every TX and RX timestamp. If the true delay of device i
+deviates by x_i device time units, every time of flight measured between the
+devices i and j is off by the sum of both deviations:
+
+    tof_ij = distance_ij / DISTANCE_OF_RADIO + x_i + x_j
+
+The calibration takes SS-TWR exchanges between nodes at known positions from the
+R records of tag logs (the four timestamps, see Tag), uses the median bias per
+pair of devices and solves the pair equations for x with least squares. The
+calibrated delay of a device is its configured delay plus x.
+
+Ranging among three or more nodes pairwise determines every delay, for example
+a tag ranging to two anchors and one of the anchors, running as tag, ranging to
+the other. A single tag ranging to anchors only determines the sums x_tag + x_anchor,
+the minimum norm solution is reported then and the rank is below the number of devices.
+The reply times are corrected with the clock offset of the anchor if the records
+contain it (see drift.py).
+
+Usage:
+    Offline on recorded tag logs, with the address and position of the recording tag:
+        python calibrate.py --record uwb.log 0040 2.5,1,0 [--record ...]
+    Live, ranging as tag to the configured anchors, together with any recorded logs:
+        python calibrate.py --live 2.5,1,0 [--exchanges 100] [--record ...]
+    Against simulated devices with random true delays:
+        python calibrate.py --simulate
+
+Anchor positions are taken from the configuration (see configuration.py).
+--config FILE --node ADDRESS=NAME uses the configured delay of the node NAME of the
+JSON configuration file and with --save writes the calibrated delay into its
+entry of the "nodes" table. Live, the calibrated delay of the tag is also set on
+its DW1000.
+"""
+
+import os
+import sys
+import json
+import math
+import logging
+import argparse
+
+import numpy as np
+
+import config
+import configuration
+import DW1000Constants as C
+
+def timeOfFlight(poll_send, poll_recv, resp_send, resp_recv, offset=0.):
+    """
+    SS-TWR time of flight, see Tag.computeRange().
+
+    Args:
+        offset: Clock offset ratio of the anchor, see drift.py
+
+    Returns:
+        Time of flight in device time units
+    """
+    round_time = (resp_recv - poll_send) % C.TIME_OVERFLOW
+    reply_time = (resp_send - poll_recv) % C.TIME_OVERFLOW
+    return 0.5 * (round_time - reply_time / (1. + offset))
+
+def readRecords(path, offset=0):
+    """
+    Read the ranging exchanges of a tag log.
+
+    Args:
+        path: Tag log
+        offset: File position to start at
+
+    Returns:
+        (list): Anchor address and time of flight per R record
+    """
+    records = []
+    with open(path) as f:
+        f.seek(offset)
+        for line in f:
+            fields = line.split()
+            if len(fields) < 8 or fields[1] != "R":
+                continue
+            try:
+                offset = float(fields[12]) * 1e-6 if len(fields) > 12 else 0.
+                records.append((bytes.fromhex(fields[2]), timeOfFlight(*[int(i) for i in fields[4:8]], offset)))
+            except ValueError:
+                logging.warning("Invalid record in {}: {}".format(path, line.strip()))
+    return records
+
+def parsePosition(value):
+    """
+    Returns:
+        (list): Position from "x,y,z"
+    """
+    position = [float(c) for c in value.split(",")]
+    if len(position) != 3:
+        raise ValueError("position needs 3 coordinates: {}".format(value))
+    return position
+
+class Calibration():
+    """
+    Antenna delay deviations from exchanges between devices at known positions.
+
+    Args:
+        positions (dict): Position per device address
+
+    Attributes:
+        positions: Position per device address
+        biases: Time of flight biases in device time units per pair of addresses
+        unknown: Number of exchanges with a device without position
+    """
+    def __init__(self, positions):
+        self.positions = dict(positions)
+        self.biases = {}
+        self.unknown = 0
+
+    def add(self, tag, anchor, tof):
+        """
+        Add an exchange.
+
+        Args:
+            tag: Address of the tag
+            anchor: Address of the anchor
+            tof: Measured time of flight in device time units
+        """
+        if tag not in self.positions or anchor not in self.positions:
+            self.unknown += 1
+            return
+        distance = math.dist(self.positions[tag], self.positions[anchor])
+        pair = tuple(sorted((tag, anchor)))
+        self.biases.setdefault(pair, []).append(tof - distance / C.DISTANCE_OF_RADIO)
+
+    def addRecords(self, tag, records):
+        """
+        Args:
+            tag: Address of the tag that recorded the exchanges
+            records: Exchanges from readRecords()
+        """
+        for anchor, tof in records:
+            self.add(tag, anchor, tof)
+
+    def solve(self):
+        """
+        Solve the pair equations.
+
+        Returns:
+            (dict): Deviation per device in device time units ("deviations"), rank of the
+                    equations, RMS residual in device time units and median bias and count per pair
+        """
+        pairs = sorted(self.biases)
+        if not pairs:
+            raise ValueError("No exchanges between devices with known positions")
+        devices = sorted({device for pair in pairs for device in pair})
+        index = {device: i for i, device in enumerate(devices)}
+
+        A = np.zeros((len(pairs), len(devices)))
+        b = np.empty(len(pairs))
+        for row, (i, j) in enumerate(pairs):
+            A[row, index[i]] = 1.
+            A[row, index[j]] = 1.
+            b[row] = np.median(self.biases[(i, j)])
+        x, _, rank, _ = np.linalg.lstsq(A, b, rcond=None)
+        residuals = b - A @ x
+
+        return {
+            "deviations": {device: float(x[index[device]]) for device in devices},
+            "rank": int(rank),
+            "residual": float(np.sqrt(np.mean(residuals ** 2))),
+            "pairs": {pair: (float(median), len(self.biases[pair])) for pair, median in zip(pairs, b)}
+        }
+
+def calibratedDelays(deviations, configured):
+    """
+    Args:
+        deviations (dict): Deviation per device from Calibration.solve()
+        configured (dict): Configured delay per device, config.antenna_delay for the others
+
+    Returns:
+        (dict): Calibrated delay per device
+    """
+    delays = {}
+    for device, deviation in deviations.items():
+        delay = round(configured.get(device, config.antenna_delay) + deviation)
+        if not 0 <= delay <= 0xFFFF:
+            raise ValueError("Calibrated delay of {} out of range: {}".format(device.hex(), delay))
+        delays[device] = delay
+    return delays
+
+def saveDelays(path, delays, names):
+    """
+    Write calibrated delays into the "nodes" table of a JSON configuration file.
+
+    Args:
+        path: Configuration file
+        delays (dict): Delay per device
+        names (dict): Node name per device, devices without a name are skipped
+    """
+    if path.endswith(".toml"):
+        raise ValueError("Configuration {}: TOML files are not written, set antenna_delay by hand".format(path))
+    contents = configuration.readFile(path) if os.path.exists(path) else {}
+    nodes = contents.setdefault("nodes", {})
+    for device, delay in delays.items():
+        if device in names:
+            nodes.setdefault(names[device], {})["antenna_delay"] = delay
+    # Atomically, a node may read the file at any time
+    with open(path + ".tmp", "w") as f:
+        json.dump(contents, f, indent=4)
+    os.replace(path + ".tmp", path)
+
+def recordLive(settings, position, exchanges, timeout):
+    """
+    Range as tag to the configured anchors.
+
+    Args:
+        settings (configuration.Config): Configuration of the node
+        position: Position of the node
+        exchanges: Exchanges per anchor to record
+        timeout: Maximum recording time in seconds
+
+    Returns:
+        (tuple): The running tag and its exchanges from readRecords()
+    """
+    from tag import Tag
+
+    open(settings.logfile, "a").close()
+    offset = os.path.getsize(settings.logfile)
+    tag = Tag(settings.replace(webui_enable=False, uplink_enable=False, tracker_enable=False))
+    tag.setup()
+    logging.info("Calibration: recording {} exchanges per anchor from {} at {}".format(exchanges, tag.address.hex(), position))
+    tag.start()
+    start = tag.clock()
+    while tag.ranges < exchanges * len(settings.anchor_list) and tag.clock() - start < timeout:
+        tag.step()
+    tag.logfile.flush()
+    return tag, readRecords(settings.logfile, offset)
+
+def simulate(seed=1, antenna_delay_std=0.05, duration=10.):
+    """
+    Calibrate simulated devices, a tag ranging to three anchors and one of the anchors ranging to the others.
+
+    Args:
+        seed: Random seed
+        antenna_delay_std: Standard deviation of the true delays from the configured one in meter
+        duration: Simulated time per tag in seconds
+
+    Returns:
+        (tuple): True and calibrated delay per device, solution of Calibration.solve()
+    """
+    import tempfile
+    from anchor import Anchor
+    from simulator import Simulator, SimTag, Trajectory
+
+    positions = {b"\x0a\x3b": [0., 0., 0.], b"\x0b\x3b": [6., 0., 0.], b"\x0c\x3b": [6., 4., 0.], b"\x00\x40": [2., 3., 0.5]}
+    rng = np.random.default_rng(seed)
+    true = {device: config.antenna_delay + rng.normal(0., antenna_delay_std / C.DISTANCE_OF_RADIO) for device in positions}
+    calibration = Calibration(positions)
+
+    with tempfile.TemporaryDirectory() as directory:
+        for tag, anchors in ((b"\x00\x40", [b"\x0a\x3b", b"\x0b\x3b", b"\x0c\x3b"]), (b"\x0a\x3b", [b"\x0b\x3b", b"\x0c\x3b"])):
+            sim = Simulator(seed, antenna_delay_std=0.)
+            logfile = os.path.join(directory, tag.hex() + ".log")
+            settings = configuration.fromModule(anchor_list=anchors, anchor_positions=[positions[a] for a in anchors], logfile=logfile)
+            nodes = [(Anchor(settings), address) for address in anchors]
+            nodes.append((SimTag(sim, Trajectory(positions[tag]), settings), tag))
+            for node, address in nodes:
+                sim.addNode(node, "7D:00:22:EA:82:60:{:02X}:{:02X}".format(address[1], address[0]), Trajectory(positions[address]))
+                sim.medium.devices[-1].antenna_delay = true[address]
+            try:
+                sim.run(duration)
+            finally:
+                sim.close()
+            nodes[-1][0].logfile.close()
+            calibration.addRecords(tag, readRecords(logfile))
+
+    solution = calibration.solve()
+    delays = calibratedDelays(solution["deviations"], {})
+    return {device: (true[device], delays[device]) for device in delays}, solution
+
+def main():
+    parser = argparse.ArgumentParser(description="Antenna delay calibration")
+    parser.add_argument("--record", nargs=3, action="append", default=[], metavar=("LOG", "ADDRESS", "POSITION"),
+                        help="Tag log with the address and x,y,z position of the tag")
+    parser.add_argument("--live", metavar="POSITION", help="Range as tag from this x,y,z position")
+    parser.add_argument("--exchanges", type=int, default=100, help="Live exchanges per anchor")
+    parser.add_argument("--timeout", type=float, default=120., help="Maximum live recording time in seconds")
+    parser.add_argument("--config", help="Configuration file, UWB_CONFIG or the default file if not given")
+    parser.add_argument("--node", action="append", default=[], metavar="ADDRESS=NAME", help="Node name of a device in the configuration file")
+    parser.add_argument("--save", action="store_true", help="Write the calibrated delays into the configuration file")
+    parser.add_argument("--simulate", action="store_true", help="Calibrate simulated devices and compare with their true delays")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed of the simulation")
+    parser.add_argument("--duration", type=float, default=10., help="Simulated time per tag in seconds")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.CRITICAL if args.simulate else logging.INFO, format="%(asctime)s %(levelname)s: %(message)s")
+
+    if args.simulate:
+        config.webui_enable = False
+        config.uplink_enable = False
+        config.profiling_enable = False
+        config.snapshot_enable = False
+        delays, solution = simulate(args.seed, duration=args.duration)
+        print("device     true  calibrated")
+        for device, (true, delay) in delays.items():
+            print("{}  {:7.1f}  {:10}".format(device.hex(), true, delay))
+        print("rank {} of {}, residual {:.2f}".format(solution["rank"], len(delays), solution["residual"]))
+        return
+
+    try:
+        settings = configuration.load(args.config)
+        names = {}
+        for entry in args.node:
+            address, _, name = entry.partition("=")
+            names[configuration.parseAddress(address)] = name
+        positions = dict(zip(settings.anchor_list, settings.anchor_positions))
+        recordings = []
+        for path, address, position in args.record:
+            address, position = configuration.parseAddress(address), parsePosition(position)
+            positions[address] = position
+            recordings.append((address, readRecords(path)))
+        live_position = parsePosition(args.live) if args.live else None
+    except (OSError, ValueError) as e:
+        logging.error(e)
+        sys.exit(1)
+    if not recordings and live_position is None:
+        parser.error("nothing to calibrate, give --record or --live")
+
+    tag = None
+    if live_position is not None:
+        tag, records = recordLive(settings, live_position, args.exchanges, args.timeout)
+        positions[tag.address] = live_position
+        recordings.append((tag.address, records))
+
+    try:
+        calibration = Calibration(positions)
+        for address, records in recordings:
+            calibration.addRecords(address, records)
+        if calibration.unknown:
+            logging.warning("Calibration: {} exchanges with devices without position skipped".format(calibration.unknown))
+        solution = calibration.solve()
+        configured = {device: configuration.load(args.config, node=name).antenna_delay for device, name in names.items()}
+        delays = calibratedDelays(solution["deviations"], configured)
+
+        print("device  pairs  deviation     cm  configured  calibrated")
+        for device, deviation in solution["deviations"].items():
+            pairs = sum(count for pair, (median, count) in solution["pairs"].items() if device in pair)
+            print("{}  {:5}  {:9.1f}  {:5.1f}  {:10}  {:10}".format(device.hex(), pairs, deviation, deviation * C.DISTANCE_OF_RADIO * 100,
+                                                                    configured.get(device, config.antenna_delay), delays[device]))
+        print("rank {} of {}, residual {:.2f} device time units".format(solution["rank"], len(delays), solution["residual"]))
+        if solution["rank"] < len(delays):
+            logging.warning("Calibration: the exchanges do not determine every delay, range among three or more nodes pairwise")
+
+        if args.save:
+            path = args.config or os.environ.get(configuration.ENV_PREFIX + "CONFIG", configuration.DEFAULT_FILE)
+            saveDelays(path, delays, names)
+            logging.info("Calibration: delays of {} saved to {}".format(", ".join(sorted(names[d] for d in delays if d in names)), path))
+        if tag is not None and tag.address in delays:
+            tag.dw1000.setAntennaDelay(delays[tag.address])
+            logging.info("Calibration: antenna delay of {} set to {}".format(tag.address.hex(), delays[tag.address]))
+    except (OSError, ValueError) as e:
+        logging.error(e)
+        sys.exit(1)
+    finally:
+        if tag is not None:
+            tag.stop()
+
+if __name__ == "__main__":
+    main()
@@ -7,8 +7,11 @@ mode = "tag"
 pin_irq = 16
 pin_cs = 8
 pin_rst = 12
+spi_bus = 0
+spi_device = 0 # The chip select line is pin_cs, the SPI device only selects the spidev node
 eid = "7D:00:22:EA:82:60:3B:00"
 pan = 0xdeca
+antenna_delay = 16390 # TX and RX antenna delay in device time units, measured per node with calibrate.py
 
 # Tag specific
 anchor_list = [b"\x0a\x3b", b"\x0b\x3b", b"\x0c\x3b", b"\x0d\x3b"]
@@ -16,4 +19,64 @@ anchor_positions = [[0., 0., 0.], [1., 0., 0.], [1., 1., 0.], [0., 1., 0.]]
 logfile = "/home/pi/uwb.log"
 rxrfto_limit = 2
 tries_limit = 10
+poll_backoff = 0 # Maximum random delay in microseconds of a retried poll, e.g. 10000 with several tags on one channel, 0 disables it
 webui_enable=True
+webui_port = 8080
+snapshot_enable = True # Restore the tuned register set from snapshot_file at startup instead of a full configuration
+snapshot_file = "/home/pi/uwb_snapshot.json" # Delete after replacing the DWM1000 module, it caches the crystal trim from the OTP
+profiling_enable = False # Stage latency profiling, can be switched at runtime via the web UI (/profile?enable=1)
+profiling_dump_interval = 60. # Seconds between profile dumps to the log, 0 disables the dump
+recovery_error_limit = 8 # Receiver errors and timeouts without activity that start a recovery with an RX soft reset
+
+# Logging (see logsetup.py)
+log_level = "INFO" # DEBUG, INFO, WARNING, ERROR or CRITICAL
+log_trace = False # Debug records of every status bit and frame, python -O removes them completely
+log_rate = 10. # Records per second and call site, 0 disables the limit
+log_burst = 20 # Records a call site may log at once before the rate limit applies
+log_queue = 1000 # Records waiting for the writer thread, further records are dropped
+
+# Several radios on one host (see radio.py), started instead of mode if not empty. Every radio is a dict with
+# eid, pin_cs, pin_irq, pin_rst and optionally role (default mode), spi_bus, spi_device, channel, preamble_code,
+# antenna_delay and snapshot_file. The tag settings above are shared, so use at most one tag radio per host.
+radios = []
+radio_poll_interval = 0.01 # Seconds after which a radio is checked without an interrupt
+
+# Burst ranging, the ranges of a burst are combined to one range of the anchor (see tag.burstRange())
+burst_length = 1 # Back to back polls per anchor and round
+burst_trim = 0.25 # Fraction of the ranges of a burst dropped at each end before averaging, 0.5 takes the median
+
+# Clock drift compensation of the ranges (see drift.py)
+drift_enable = True
+drift_filter_gain = 0.1 # Weight of a new clock offset sample in the per anchor filter
+drift_limit = 100. # Maximum clock offset in ppm, larger samples are rejected
+
+# Range based position tracker (see tracker.py)
+tracker_enable = True # Without tracker the latest range of every anchor is trilaterated range by range
+tracker_range_std = 0.1 # Range measurement noise in meter
+tracker_accel_std = 1.0 # Acceleration noise in m/s^2
+tracker_gate = 9.0 # Innovation gate (normalized squared innovation)
+
+# Trilateration solver (see trilaterate.py)
+solver_loss = "soft_l1" # least_squares loss: linear, soft_l1, huber, cauchy, arctan
+solver_f_scale = 0.2 # Inlier/outlier margin in meter
+solver_ransac = False # RANSAC over anchor subsets
+solver_ransac_threshold = 0.3 # Maximum inlier residual in meter
+solver_weighting = True # Weight ranges by receive quality and first path power
+solver_quality_ref = 10.0 # Receive quality with full weight
+solver_fp_power_ref = -95.0 # First path power in dBm with full weight
+
+# Central positioning server (see server.py)
+server_host = "127.0.0.1" # Address of the server, used by the tags
+server_port = 9000 # UDP port for range records
+server_http_port = 8081 # HTTP port for results
+server_workers = 2 # Solver threads
+server_batch = 128 # Maximum number of ranging rounds solved in one batch
+server_round_timeout = 0.5 # Seconds after which an incomplete ranging round is solved
+server_history = 100 # Positions kept per tag
+server_max_age = 1.0 # Seconds after which a queued round is dropped (overload)
+
+# Uplink of ranges and positions to the positioning server (see uplink.py)
+uplink_enable = False
+uplink_policy = "drop_oldest" # Queue overflow policy: drop_oldest, drop_newest, aggregate
+uplink_queue = 1024 # Maximum number of queued records
+uplink_linger = 0. # Seconds to wait for more records before sending, 0 sends immediately
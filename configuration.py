@@ -0,0 +1,338 @@
+"""@package configuration
+Layered configuration with a schema.
+
+The defaults are the globals of config.py. They are overridden in this order:
+
+    1. Configuration file, JSON or TOML (Python 3.11), top level keys
+    2. Entry of the "nodes" table of the file named like the node (UWB_NODE, the host name by default)
+    3. Environment variables UWB_<NAME>, for example UWB_MODE=anchor or UWB_PAN=0xdeca
+    4. Overrides passed to load() or fromModule(), for example per simulated node
+
+So one file can be copied to every Raspberry Pi of a deployment. Every value is
+checked against the type of its default and the constraints below, the result
+is a Config with the attribute names of config.py and precomputed derived values.
+Node, Tag and Anchor take a Config, without one they use fromModule().
+
+Example file:
+
+    {"anchor_list": ["0a3b", "0b3b", "0c3b"],
+     "anchor_positions": [[0, 0, 0], [4, 0, 0], [4, 3, 0]],
+     "nodes": {"uwb-anchor-1": {"mode": "anchor", "eid": "7D:00:22:EA:82:60:3B:0A"}}}
+"""
+
+import os
+import json
+import logging
+
+import config
+import DW1000Constants as C
+from uplink import POLICIES
+
+DEFAULT_FILE = "/home/pi/uwb.json" # Used if it exists and UWB_CONFIG is not set
+ENV_PREFIX = "UWB_"
+
+# Constraints in addition to the type of the default
+CHOICES = {
+    "mode": ("tag", "anchor"),
+    "log_level": ("DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"),
+    "uplink_policy": POLICIES,
+    "solver_loss": ("linear", "soft_l1", "huber", "cauchy", "arctan"),
+    "channel": (1, 2, 3, 4, 5, 7)
+}
+LIMITS = {
+    "pan": (0, 0xFFFF),
+    "antenna_delay": (0, 0xFFFF),
+    "webui_port": (1, 0xFFFF),
+    "server_port": (1, 0xFFFF),
+    "server_http_port": (1, 0xFFFF),
+    "spi_bus": (0, None),
+    "spi_device": (0, None),
+    "rxrfto_limit": (1, None),
+    "tries_limit": (1, None),
+    "poll_backoff": (0, None),
+    "recovery_error_limit": (1, None),
+    "log_rate": (0., None),
+    "log_burst": (1, None),
+    "log_queue": (1, None),
+    "radio_poll_interval": (0., None),
+    "profiling_dump_interval": (0., None),
+    "burst_length": (1, None),
+    "burst_trim": (0., 0.5),
+    "drift_filter_gain": (0., 1.),
+    "drift_limit": (0., None),
+    "tracker_range_std": (0., None),
+    "tracker_accel_std": (0., None),
+    "tracker_gate": (0., None),
+    "solver_f_scale": (0., None),
+    "solver_ransac_threshold": (0., None),
+    "server_workers": (1, None),
+    "server_batch": (1, None),
+    "server_round_timeout": (0., None),
+    "server_history": (1, None),
+    "server_max_age": (0., None),
+    "uplink_queue": (1, None),
+    "uplink_linger": (0., None),
+    "preamble_code": (1, 24)
+}
+
+# Entries of radios (see radio.py): settings of a radio replacing the host configuration, the role replaces mode
+RADIO_SETTINGS = ("eid", "pin_cs", "pin_irq", "pin_rst", "spi_bus", "spi_device", "antenna_delay", "snapshot_file")
+RADIO_KEYS = ("role", "channel", "preamble_code") + RADIO_SETTINGS
+RADIO_REQUIRED = ("eid", "pin_cs", "pin_irq", "pin_rst")
+
+def defaults():
+    """
+    Returns:
+        (dict): Current globals of config.py
+    """
+    return {name: value for name, value in vars(config).items()
+            if not name.startswith("_") and isinstance(value, (bool, int, float, str, bytes, list, tuple, dict))}
+
+def parseAddress(value):
+    """
+    Parse a short address, given as bytes, hex string ("0a3b" or "0a:3b") or list of two integers.
+
+    Returns:
+        (bytes): Address as sent in frames
+    """
+    if isinstance(value, str):
+        value = bytes.fromhex(value.replace(":", ""))
+    address = bytes(value)
+    if len(address) != 2:
+        raise ValueError("short address needs 2 bytes: {}".format(value))
+    return address
+
+def parseValue(name, value, default):
+    """
+    Check a value against the schema and convert it to the type of the default.
+
+    Args:
+        name: Configuration name
+        value: Value from a file, the environment (str) or an override
+        default: Value in config.py
+
+    Returns:
+        Converted value
+    """
+    if isinstance(default, (list, dict)) and isinstance(value, str):
+        value = json.loads(value)
+
+    if name == "anchor_list":
+        return [parseAddress(a) for a in value]
+    if name == "anchor_positions":
+        positions = [[float(c) for c in p] for p in value]
+        if any(len(p) != 3 for p in positions):
+            raise ValueError("anchor positions need 3 coordinates")
+        return positions
+    if name == "eid":
+        if len(bytes.fromhex(value.replace(":", ""))) != 8:
+            raise ValueError("extended unique identifier needs 8 bytes: {}".format(value))
+        return value
+
+    if isinstance(default, bool):
+        if isinstance(value, str):
+            if value.lower() not in ("1", "true", "yes", "on", "0", "false", "no", "off"):
+                raise ValueError("not a boolean: {}".format(value))
+            value = value.lower() in ("1", "true", "yes", "on")
+        if not isinstance(value, bool):
+            raise ValueError("not a boolean: {!r}".format(value))
+    elif isinstance(default, int):
+        value = int(value, 0) if isinstance(value, str) else value
+        if isinstance(value, bool) or not isinstance(value, int):
+            raise ValueError("not an integer: {!r}".format(value))
+    elif isinstance(default, float):
+        value = float(value) if isinstance(value, (str, int)) and not isinstance(value, bool) else value
+        if not isinstance(value, float):
+            raise ValueError("not a number: {!r}".format(value))
+    elif isinstance(default, str):
+        if not isinstance(value, str):
+            raise ValueError("not a string: {!r}".format(value))
+    elif isinstance(default, (list, dict)):
+        if not isinstance(value, type(default)):
+            raise ValueError("not a {}: {!r}".format(type(default).__name__, value))
+    if name == "radios":
+        value = [parseRadio(radio, index) for index, radio in enumerate(value)]
+
+    if name in CHOICES and value not in CHOICES[name]:
+        raise ValueError("{} is not one of {}".format(value, ", ".join(CHOICES[name])))
+    if name in LIMITS:
+        low, high = LIMITS[name]
+        if (low is not None and value < low) or (high is not None and value > high):
+            raise ValueError("{} is out of range [{}, {}]".format(value, low, "" if high is None else high))
+    return value
+
+def parseRadio(radio, index):
+    """
+    Check an entry of radios, its settings are checked like the host configuration.
+
+    Args:
+        radio (dict): Radio configuration, see config.radios
+        index: Number of the radio for error messages
+
+    Returns:
+        (dict): Converted radio configuration
+    """
+    if not isinstance(radio, dict):
+        raise ValueError("radio {} is not a table: {!r}".format(index, radio))
+    unknown = set(radio) - set(RADIO_KEYS)
+    if unknown:
+        raise ValueError("radio {}: unknown settings {}".format(index, ", ".join(sorted(unknown))))
+    missing = [key for key in RADIO_REQUIRED if key not in radio]
+    if missing:
+        raise ValueError("radio {} without {}".format(index, ", ".join(missing)))
+    known = defaults()
+    parsed = {}
+    for key, value in radio.items():
+        default = known["mode"] if key == "role" else known.get(key, 0)
+        try:
+            parsed[key] = parseValue("mode" if key == "role" else key, value, default)
+        except (TypeError, ValueError) as e:
+            raise ValueError("radio {}: {}: {}".format(index, key, e))
+    # Nodes run C.MODE_STANDARD with the channel and preamble code of the radio
+    channel = parsed.get("channel", C.MODE_STANDARD[C.CHANNEL_BIT])
+    code = parsed.get("preamble_code", C.MODE_STANDARD[C.PREAMBLE_CODE_BIT])
+    codes = C.PREAMBLE_CODES[C.MODE_STANDARD[C.PULSE_FREQUENCY_BIT]][channel]
+    if code not in codes:
+        raise ValueError("radio {}: preamble_code {} is not supported on channel {}, use one of {}".format(
+            index, code, channel, ", ".join(str(c) for c in codes)))
+    return parsed
+
+class Config():
+    """
+    Validated configuration, read like the config module.
+
+    Args:
+        values (dict): Configuration values, checked by load() or fromModule()
+
+    Attributes:
+        pan_bytes (bytes): PAN identifier as sent in frames
+        anchor_index (dict): Index in anchor_list per anchor address
+        (all names of config.py)
+    """
+    def __init__(self, values):
+        self.__dict__.update(values)
+        if len(self.anchor_list) != len(self.anchor_positions):
+            raise ValueError("Configuration: {} anchors but {} anchor positions".format(len(self.anchor_list), len(self.anchor_positions)))
+
+        # Derived values
+        self.pan_bytes = self.pan.to_bytes(2, "little")
+        self.anchor_index = {address: index for index, address in enumerate(self.anchor_list)}
+        self._anchor_array = None
+
+    @property
+    def anchor_array(self):
+        """ (numpy.ndarray): anchor_positions as float array of shape (anchors, 3), NumPy is imported on first use """
+        if self._anchor_array is None:
+            import numpy as np
+            self._anchor_array = np.array(self.anchor_positions, dtype=float).reshape(-1, 3)
+        return self._anchor_array
+
+    def values(self):
+        """
+        Returns:
+            (dict): Configuration values without the derived ones
+        """
+        return {name: value for name, value in self.__dict__.items() if name in defaults()}
+
+    def replace(self, **overrides):
+        """
+        Returns:
+            (Config): Copy with checked overrides, for example for one node of a simulation
+        """
+        return Config(merge(self.values(), overrides, "overrides"))
+
+def merge(values, overrides, source):
+    """
+    Check overrides and merge them into values.
+
+    Args:
+        values (dict): Checked values
+        overrides (dict): Values to check
+        source: Origin of the overrides for error messages
+
+    Returns:
+        (dict): Merged values
+    """
+    known = defaults()
+    merged = dict(values)
+    for name, value in overrides.items():
+        if name not in known:
+            raise ValueError("Configuration {}: unknown name {}".format(source, name))
+        try:
+            merged[name] = parseValue(name, value, known[name])
+        except (TypeError, ValueError) as e:
+            raise ValueError("Configuration {}: {}: {}".format(source, name, e))
+    return merged
+
+def readFile(path):
+    """
+    Args:
+        path: JSON or TOML (.toml) file
+
+    Returns:
+        (dict): File contents
+    """
+    if path.endswith(".toml"):
+        try:
+            import tomllib
+        except ImportError:
+            raise ValueError("Configuration {}: TOML needs Python 3.11".format(path))
+        with open(path, "rb") as f:
+            return tomllib.load(f)
+    with open(path) as f:
+        return json.load(f)
+
+def fromModule(**overrides):
+    """
+    Configuration from the current globals of config.py, without file and environment.
+
+    Args:
+        overrides: Values replacing the ones of config.py
+
+    Returns:
+        (Config): Checked configuration
+    """
+    return Config(merge(defaults(), overrides, "overrides"))
+
+def load(path=None, node=None, environ=None, **overrides):
+    """
+    Load the layered configuration, see the module description.
+
+    Args:
+        path: Configuration file, UWB_CONFIG or DEFAULT_FILE if it exists if not given
+        node: Name of the node in the "nodes" table of the file, UWB_NODE or the host name if not given
+        environ: Environment, os.environ if not given
+        overrides: Values replacing all others
+
+    Returns:
+        (Config): Checked configuration
+    """
+    environ = os.environ if environ is None else environ
+    values = merge(defaults(), {}, "defaults")
+
+    if path is None:
+        path = environ.get(ENV_PREFIX + "CONFIG")
+        if path is None and os.path.exists(DEFAULT_FILE):
+            path = DEFAULT_FILE
+    if path is not None:
+        contents = readFile(path)
+        nodes = contents.pop("nodes", {})
+        values = merge(values, contents, path)
+        node = node or environ.get(ENV_PREFIX + "NODE") or os.uname().nodename
+        if node in nodes:
+            values = merge(values, nodes[node], "{} node {}".format(path, node))
+        logging.info("Configuration {} loaded{}".format(path, ", node {}".format(node) if node in nodes else ""))
+
+    environment = {name: environ[ENV_PREFIX + name.upper()] for name in values if ENV_PREFIX + name.upper() in environ}
+    values = merge(values, environment, "environment")
+    return Config(merge(values, overrides, "overrides"))
+
+def apply(settings):
+    """
+    Write a configuration to the globals of config.py, for the modules reading them directly.
+
+    Args:
+        settings (Config): Configuration
+    """
+    for name, value in settings.values().items():
+        setattr(config, name, value)
@@ -0,0 +1,75 @@
+"""@package drift
+Clock drift compensation of single sided two way ranging.
+
+The anchor measures its reply time with its own clock. If the anchor clock runs
+faster than the tag clock by the ratio c (f_anchor / f_tag - 1), the reply time
+is too long by c * reply_time in tag clock units and the time of flight of
+0.5 * (round_time - reply_time) is off by 0.5 * c * reply_time, decimetres per
+ppm at the reply times of the auto acknowledgement. Corrected:
+
+    tof = 0.5 * (round_time - reply_time / (1 + c))
+
+The DW1000 estimates c of every received frame with its receiver time tracking
+(DW1000.getClockOffset()). The estimates are noisy and the crystals drift only
+slowly with temperature, so they are filtered per anchor: the first samples are
+averaged, afterwards every sample moves the estimate by the filter gain.
+Samples beyond the limit are rejected.
+"""
+
+class DriftEstimator():
+    """
+    Clock offsets of the anchors relative to the tag.
+
+    Args:
+        anchors: Number of anchors
+        gain: Weight of a new sample once more than 1 / gain samples are averaged
+        limit: Maximum absolute clock offset in ppm
+
+    Attributes:
+        offsets: Filtered clock offset ratio per anchor index, 0 before the first sample
+        samples: Number of accepted samples per anchor index
+        rejected: Number of rejected samples
+    """
+    def __init__(self, anchors, gain=0.1, limit=100.):
+        self.gain = gain
+        self.limit = limit * 1e-6
+        self.offsets = [0.] * anchors
+        self.samples = [0] * anchors
+        self.rejected = 0
+
+    def update(self, index, offset):
+        """
+        Add the clock offset of a frame of an anchor.
+
+        Args:
+            index: Anchor index
+            offset: Clock offset ratio, see DW1000.getClockOffset()
+
+        Returns:
+            (bool): True if the sample was accepted
+        """
+        if not -self.limit <= offset <= self.limit:
+            self.rejected += 1
+            return False
+        n = self.samples[index] + 1
+        self.offsets[index] += max(self.gain, 1. / n) * (offset - self.offsets[index])
+        self.samples[index] = n
+        return True
+
+    def correct(self, index, reply_time):
+        """
+        Args:
+            index: Anchor index
+            reply_time: Reply time of the anchor in anchor clock units
+
+        Returns:
+            (float): Reply time in tag clock units
+        """
+        return reply_time / (1. + self.offsets[index])
+
+    def ppm(self):
+        """
+        Returns:
+            (list): Filtered clock offset in ppm per anchor index, None without samples
+        """
+        return [offset * 1e6 if n else None for offset, n in zip(self.offsets, self.samples)]
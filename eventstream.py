@@ -0,0 +1,124 @@
+"""@package eventstream
+
+This module provides a broadcaster that pushes events to many Server-Sent Events clients.
+"""
+
+import json
+from collections import deque
+from threading import Event, Lock
+
+class Subscriber():
+    """
+    Event queue of one client.
+
+    Old events are dropped if the client does not keep up, the publisher never blocks.
+
+    Args:
+        maxlen: Maximum number of queued events
+
+    Attributes:
+        queue: Encoded events
+        event: Set when new events are queued
+        dropped: Number of dropped events
+        closed: Set when the broadcaster is closed
+    """
+    def __init__(self, maxlen):
+        self.queue = deque(maxlen=maxlen)
+        self.event = Event()
+        self.dropped = 0
+        self.closed = False
+
+    def get(self, timeout):
+        """
+        Wait for events.
+
+        Args:
+            timeout: Maximum waiting time in seconds
+
+        Returns:
+            (list): Queued encoded events, empty on timeout
+        """
+        if not self.queue:
+            self.event.wait(timeout)
+        self.event.clear()
+        events = []
+        while self.queue:
+            events.append(self.queue.popleft())
+        return events
+
+class EventBroadcaster():
+    """
+    Publishes events to all subscribers in the Server-Sent Events format.
+
+    Args:
+        maxlen: Maximum number of queued events per subscriber
+
+    Attributes:
+        subscribers: List of current subscribers
+        lock: Protects the subscriber list
+        published: Number of published events
+    """
+    def __init__(self, maxlen=256):
+        self.maxlen = maxlen
+        self.subscribers = []
+        self.lock = Lock()
+        self.published = 0
+
+    @staticmethod
+    def encode(event, data):
+        """
+        Encode an event.
+
+        Args:
+            event: Event name
+            data: JSON serializable data
+
+        Returns:
+            (bytes): Server-Sent Events message
+        """
+        return "event: {}\ndata: {}\n\n".format(event, json.dumps(data)).encode()
+
+    def publish(self, event, data):
+        """
+        Queue an event for all subscribers, never blocks.
+
+        Callers on a hot path should check subscribers first to avoid the encoding cost.
+
+        Args:
+            event: Event name
+            data: JSON serializable data
+        """
+        message = self.encode(event, data)
+        for subscriber in self.subscribers:
+            if len(subscriber.queue) == self.maxlen:
+                subscriber.dropped += 1
+            subscriber.queue.append(message)
+            subscriber.event.set()
+        self.published += 1
+
+    def subscribe(self):
+        """
+        Returns:
+            (Subscriber): New subscriber
+        """
+        subscriber = Subscriber(self.maxlen)
+        with self.lock:
+            # Replace the list, publish() iterates without holding the lock
+            self.subscribers = self.subscribers + [subscriber]
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        """
+        Args:
+            subscriber (Subscriber): Subscriber to remove
+        """
+        with self.lock:
+            self.subscribers = [s for s in self.subscribers if s is not subscriber]
+
+    def close(self):
+        """ Wake up and close all subscribers """
+        with self.lock:
+            for subscriber in self.subscribers:
+                subscriber.closed = True
+                subscriber.event.set()
+            self.subscribers = []
@@ -0,0 +1,165 @@
+"""@package loadgen
+Load generator for the central positioning server.
+
+Simulates many tags moving on circles between the configured anchors. Every tag
+sends one datagram of noisy range records per ranging round. At the end the
+achieved fixes per second, the end-to-end latency, the position error and
+(for the local server) the CPU time of the server are reported.
+
+Usage:
+    python loadgen.py [--host 127.0.0.1 --port 9000 --http-port 8081] [--tags 300] [--rate 10] [--duration 10]
+
+Without --host a server is started in a subprocess.
+"""
+
+import sys
+import time
+import json
+import math
+import heapq
+import random
+import signal
+import socket
+import argparse
+import subprocess
+import http.client
+
+import config
+import rangerecord as R
+
+class SimulatedTag():
+    """
+    Tag moving on a circle around the center of the anchors.
+
+    Args:
+        index: Tag number, also selects the short address
+        center: Center of the circle
+        radius: Radius of the circle in meter
+        speed: Angular speed in rad/s
+    """
+    def __init__(self, index, center, radius, speed):
+        self.address = (0x1000 + index).to_bytes(2, "little")
+        self.center = center
+        self.radius = radius
+        self.speed = speed
+        self.phase = random.uniform(0, 2 * math.pi)
+        self.round = 0
+
+    def position(self, t):
+        angle = self.phase + self.speed * t
+        return [self.center[0] + self.radius * math.cos(angle), self.center[1] + self.radius * math.sin(angle), self.center[2]]
+
+    def records(self, t, noise):
+        """
+        Ranges of the next ranging round.
+
+        Args:
+            t: Unix time
+            noise: Standard deviation of the range noise in meter
+
+        Returns:
+            (list): RangeRecord for every anchor
+        """
+        position = self.position(t)
+        records = []
+        for anchor, anchor_position in zip(config.anchor_list, config.anchor_positions):
+            distance = math.dist(position, anchor_position) + random.gauss(0., noise)
+            records.append(R.RangeRecord(self.address, anchor, self.round, t, distance))
+        self.round += 1
+        return records
+
+def getJson(host, port, path):
+    conn = http.client.HTTPConnection(host, port, timeout=5)
+    try:
+        conn.request("GET", path)
+        return json.loads(conn.getresponse().read())
+    finally:
+        conn.close()
+
+def waitServer(host, port, timeout=10.):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            return getJson(host, port, "/stats")
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.1)
+
+def main():
+    parser = argparse.ArgumentParser(description="Positioning server load generator")
+    parser.add_argument("--host", help="Server address, a local server is started if not given")
+    parser.add_argument("--port", type=int, default=config.server_port, help="UDP port of the server")
+    parser.add_argument("--http-port", type=int, default=config.server_http_port, help="HTTP port of the server")
+    parser.add_argument("--tags", type=int, default=300, help="Number of simulated tags")
+    parser.add_argument("--rate", type=float, default=10., help="Ranging rounds per second and tag")
+    parser.add_argument("--duration", type=float, default=10., help="Test duration in seconds")
+    parser.add_argument("--noise", type=float, default=0.05, help="Range noise in meter")
+    parser.add_argument("--workers", type=int, default=config.server_workers, help="Solver threads of the local server")
+    args = parser.parse_args()
+
+    server = None
+    host = args.host
+    if host is None:
+        host = "127.0.0.1"
+        args.port = random.randint(20000, 30000)
+        args.http_port = args.port + 1
+        server = subprocess.Popen([sys.executable, "server.py", "--host", host, "--port", str(args.port),
+                                   "--http-port", str(args.http_port), "--workers", str(args.workers)],
+                                  cwd=sys.path[0] or None)
+    before = waitServer(host, args.http_port)
+
+    center = [sum(p[i] for p in config.anchor_positions) / len(config.anchor_positions) for i in range(0, 3)]
+    size = min(max(p[i] for p in config.anchor_positions) - min(p[i] for p in config.anchor_positions) for i in range(0, 2))
+    tags = [SimulatedTag(i, center, random.uniform(0.1, 0.4) * size, random.uniform(0.2, 1.)) for i in range(0, args.tags)]
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    period = 1. / args.rate
+    start = time.time()
+    # (send time, tag index), tags are spread evenly over one period
+    schedule = [(start + i * period / len(tags), i) for i in range(0, len(tags))]
+    heapq.heapify(schedule)
+    sent = 0
+    late = 0.
+    while schedule[0][0] < start + args.duration:
+        t, i = heapq.heappop(schedule)
+        delay = t - time.time()
+        if delay > 0:
+            time.sleep(delay)
+        else:
+            late = max(late, -delay)
+        now = time.time()
+        sock.sendto(R.encodeDatagram(tags[i].records(now, args.noise)), (host, args.port))
+        sent += 1
+        heapq.heappush(schedule, (t + period, i))
+    elapsed = time.time() - start
+
+    time.sleep(2 * config.server_round_timeout)
+    after = getJson(host, args.http_port, "/stats")
+    positions = getJson(host, args.http_port, "/tags")
+
+    errors = []
+    for tag in tags:
+        fix = positions.get(tag.address.hex())
+        if fix is not None:
+            errors.append(math.dist(fix["position"], tag.position(fix["time"])))
+
+    if server:
+        server.send_signal(signal.SIGINT)
+        server.wait()
+
+    fixes = after["fixes"] - before["fixes"]
+    print("Tags: {}, rate: {} Hz, duration: {:.1f} s, sent: {} rounds ({:.0f}/s, max send delay {:.1f} ms)".format(
+        args.tags, args.rate, elapsed, sent, sent / elapsed, late * 1e3))
+    print("Fixes: {} ({:.0f}/s), rejected: {}, incomplete: {}, stale: {}, batches: {}".format(
+        fixes, fixes / elapsed, after["rejected"] - before["rejected"], after["incomplete"] - before["incomplete"],
+        after["stale"] - before["stale"], after["batches"] - before["batches"]))
+    print("Latency end-to-end p50 {:.2f} ms, p99 {:.2f} ms, in server p50 {:.2f} ms, p99 {:.2f} ms".format(
+        after["latency_p50"] * 1e3, after["latency_p99"] * 1e3, after["server_latency_p50"] * 1e3, after["server_latency_p99"] * 1e3))
+    if errors:
+        print("Position error of the last fix: mean {:.3f} m, max {:.3f} m".format(sum(errors) / len(errors), max(errors)))
+    cpu = after["cpu"] - before["cpu"]
+    print("Server CPU: {:.2f} s ({:.1f} %), solver {:.2f} s".format(cpu, cpu / elapsed * 100, after["solve_time"] - before["solve_time"]))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""@package logsetup
+Logging of the nodes.
+
+Records are handed to a queue and written by a listener thread, so a node
+never waits for the journal. The queue is bounded, records that do not fit
+are dropped and counted. Callers pass the arguments instead of formatted strings:
+
+    logging.debug("Range to %s: %.3f", anchor, range_)
+
+so records below the level or over the rate limit are never formatted. The
+message of a passed record is formatted in the calling thread, like the stock
+QueueHandler does, the arguments may change before the listener writes it.
+Level, logger name and layout are added by the listener thread.
+
+Every call site (file and line) may log log_rate records per second with
+bursts of log_burst, further records are dropped until the site has tokens
+again. The next record of the site tells how many were suppressed.
+
+The debug records of the radio loop (every status bit and frame) are guarded by
+
+    if __debug__ and TRACE:
+
+TRACE is config.log_trace when this module is first imported, main.py sets it up
+before the node modules are imported. With TRACE off a guarded call costs one
+global lookup, running python -O removes the guarded calls from the bytecode.
+"""
+
+import sys
+import time
+import queue
+import atexit
+import logging
+import logging.handlers
+
+import config
+
+TRACE = config.log_trace # Debug records of the radio loop, read by the modules at import
+FORMAT = "%(levelname)s %(name)s: %(message)s" # The journal adds the time
+
+class RateLimitFilter(logging.Filter):
+    """
+    Token bucket per call site.
+
+    Args:
+        rate: Records per second and call site, 0 disables the limit
+        burst: Records a call site may log at once
+
+    Attributes:
+        sites: Tokens, time of the last update and suppressed records per call site
+        suppressed: Number of suppressed records
+    """
+    def __init__(self, rate=10., burst=20):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst
+        self.sites = {}
+        self.suppressed = 0
+        self.clock = time.monotonic
+
+    def filter(self, record):
+        if not self.rate:
+            return True
+        now = self.clock()
+        key = (record.pathname, record.lineno)
+        site = self.sites.get(key)
+        if site is None:
+            site = self.sites[key] = [float(self.burst), now, 0]
+        site[0] = min(self.burst, site[0] + (now - site[1]) * self.rate)
+        site[1] = now
+        if site[0] < 1.:
+            site[2] += 1
+            self.suppressed += 1
+            return False
+        site[0] -= 1.
+        if site[2]:
+            record.msg = "{} ({} similar records suppressed)".format(record.getMessage(), site[2])
+            record.args = None
+            site[2] = 0
+        return True
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    Queue handler leaving the layout to the listener thread, drops records if the queue is full.
+
+    Attributes:
+        dropped: Number of records dropped because the queue was full
+    """
+    def __init__(self, records):
+        super().__init__(records)
+        self.setFormatter(logging.Formatter())
+        self.dropped = 0
+
+    def prepare(self, record):
+        """
+        Merge the arguments into the message and render the exception, without copying the record.
+        The arguments and the traceback are not kept alive until the listener writes the record.
+        """
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = self.formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+class BlockingQueueListener(logging.handlers.QueueListener):
+    """ Queue listener waiting for room for its stop sentinel, the queue may be full """
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)
+
+_handler = None
+_listener = None
+
+def setup(level=None, rate=None, burst=None, size=None, stream=None):
+    """
+    Route all records through the rate limit and the queue to a stream handler thread.
+
+    Calling it again replaces the previous setup, queued records are written first.
+
+    Args:
+        level: Level name, config.log_level if not given
+        rate: Records per second and call site, config.log_rate if not given
+        burst: Burst per call site, config.log_burst if not given
+        size: Queue size, config.log_queue if not given
+        stream: Output stream, stderr if not given
+    """
+    global _handler, _listener
+    stop()
+
+    handler = DeferredQueueHandler(queue.Queue(config.log_queue if size is None else size))
+    handler.addFilter(RateLimitFilter(config.log_rate if rate is None else rate, config.log_burst if burst is None else burst))
+    output = logging.StreamHandler(sys.stderr if stream is None else stream)
+    output.setFormatter(logging.Formatter(FORMAT))
+
+    root = logging.getLogger()
+    for h in list(root.handlers):
+        root.removeHandler(h)
+    root.addHandler(handler)
+    root.setLevel(config.log_level if level is None else level)
+
+    _handler = handler
+    _listener = BlockingQueueListener(handler.queue, output)
+    _listener.start()
+
+def stop():
+    """ Write the queued records and stop the listener thread """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+def counters():
+    """
+    Returns:
+        (dict): Records suppressed by the rate limit and dropped because the queue was full
+    """
+    if _handler is None:
+        return {"suppressed": 0, "dropped": 0}
+    return {"suppressed": sum(f.suppressed for f in _handler.filters), "dropped": _handler.dropped}
+
+atexit.register(stop)
@@ -2,22 +2,37 @@
 Main module responsible for startup.
 
 This module reads the mode variable from config and
-starts the responsible module.
-It also sets the logging level for the application.
+starts the responsible module, or the radio host if
+several radios are configured (see radio.py).
+It also sets up the logging for the application (see logsetup.py).
 """
 
+import sys
 import logging
+import importlib
 
 import config
-import anchor
-import tag
+import configuration
+import logsetup
 
-modes = {"tag": tag.main, "anchor": anchor.main}
+# Role modules, only the configured one is imported
+modes = {"tag": "tag", "anchor": "anchor"}
 
 if __name__ == "__main__":
-    logging.basicConfig(level=logging.DEBUG)
-
+    # Configuration file and environment overrides of config.py, see configuration.py
     try:
-        modes[config.mode]()
-    except KeyError:
+        configuration.apply(configuration.load())
+    except (OSError, ValueError) as e:
+        # Not set up yet, logging.error() falls back to a basic stderr handler
+        logging.error(str(e))
+        sys.exit(1)
+    # Once with the loaded settings, before the role modules are imported, they read TRACE at import
+    logsetup.TRACE = config.log_trace
+    logsetup.setup()
+
+    if config.radios:
+        importlib.import_module("radio").main()
+    elif config.mode in modes:
+        importlib.import_module(modes[config.mode]).main()
+    else:
         logging.error("Unknown mode: {}".format(config.mode))
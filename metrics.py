@@ -0,0 +1,112 @@
+"""@package metrics
+
+This module provides helpers to export metrics in the Prometheus text exposition format.
+"""
+
+import profiler as P
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+class MetricsWriter():
+    """
+    Builds a Prometheus text exposition.
+
+    Args:
+        prefix: Prefix for all metric names
+
+    Attributes:
+        prefix: Prefix for all metric names
+        lines: Exposition lines
+    """
+    def __init__(self, prefix="uwb_"):
+        self.prefix = prefix
+        self.lines = []
+
+    @staticmethod
+    def labelString(labels):
+        """
+        Format a label set.
+
+        Args:
+            labels (dict): Label names and values
+
+        Returns:
+            (string): {name="value",...} or an empty string
+        """
+        if not labels:
+            return ""
+        return "{" + ",".join("{}=\"{}\"".format(k, v) for k, v in labels.items()) + "}"
+
+    def header(self, name, kind, help):
+        self.lines.append("# HELP {}{} {}".format(self.prefix, name, help))
+        self.lines.append("# TYPE {}{} {}".format(self.prefix, name, kind))
+
+    def sample(self, name, value, labels=None):
+        self.lines.append("{}{}{} {}".format(self.prefix, name, self.labelString(labels), value))
+
+    def counter(self, name, help, value, labels=None):
+        """
+        Add a single counter.
+
+        Args:
+            name: Metric name without prefix, should end with _total
+            help: Description
+            value: Counter value
+            labels (dict): Optional labels
+        """
+        self.header(name, "counter", help)
+        self.sample(name, value, labels)
+
+    def gauge(self, name, help, value, labels=None):
+        """
+        Add a single gauge.
+
+        Args:
+            name: Metric name without prefix
+            help: Description
+            value: Gauge value
+            labels (dict): Optional labels
+        """
+        self.header(name, "gauge", help)
+        self.sample(name, value, labels)
+
+    def family(self, name, kind, help, samples):
+        """
+        Add a metric with several label sets.
+
+        Args:
+            name: Metric name without prefix
+            kind: "counter" or "gauge"
+            help: Description
+            samples: Iterable of (labels, value)
+        """
+        self.header(name, kind, help)
+        for labels, value in samples:
+            self.sample(name, value, labels)
+
+    def profile(self, prof, name="stage_latency_seconds", help="Latency of pipeline stages"):
+        """
+        Add the log2 histograms of a profiler as one histogram per stage.
+
+        Args:
+            prof (profiler.Profiler): Profiler
+            name: Metric name without prefix
+            help: Description
+        """
+        self.header(name, "histogram", help)
+        for stage, stage_name in enumerate(P.STAGE_NAMES):
+            count = 0
+            offset = stage * P.BUCKETS
+            for i in range(0, P.BUCKETS - 1):
+                count += prof.histogram[offset + i]
+                self.sample(name + "_bucket", count, {"stage": stage_name, "le": "{:g}".format((1 << i) / 1e9)})
+            self.sample(name + "_bucket", prof.calls[stage], {"stage": stage_name, "le": "+Inf"})
+            self.sample(name + "_sum", prof.total_ns[stage] / 1e9, {"stage": stage_name})
+            self.sample(name + "_count", prof.calls[stage], {"stage": stage_name})
+
+    def render(self):
+        """
+        Returns:
+            (bytes): Encoded exposition
+        """
+        return ("\n".join(self.lines) + "\n").encode()
@@ -4,45 +4,121 @@ Node superclass for parts of SS-TWR system.
 This module provides a superclass for tags and anchors.
 """
 
+import os
 import time
+import json
 import logging
-import copy
 import faulthandler
 from datetime import datetime, timedelta
 
 from DW1000 import DW1000
+from DW1000Register import DW1000Register
 import DW1000Constants as C
-import MAC
-import config
+import configuration
+import profiler as P
+from profiler import profiler
+import recovery as R
+from logsetup import TRACE
+
+SNAPSHOT_VERSION = 1 # Increase if generalConfiguration() or tune() write different values
+
+def loadSnapshot(path, key):
+    """
+    Load a configuration snapshot (see DW1000.takeSnapshot()) from disk.
+
+    Args:
+        path: Snapshot file
+        key (dict): Configuration the snapshot must have been taken with
+
+    Returns:
+        (dict): Snapshot, None if the file is missing, invalid or was taken with another configuration
+    """
+    try:
+        with open(path) as f:
+            snapshot = json.load(f)
+    except (OSError, ValueError) as e:
+        logging.debug("No configuration snapshot: {}".format(e))
+        return None
+    if not isinstance(snapshot, dict) or snapshot.get("key") != key:
+        logging.info("Configuration snapshot does not match the configuration")
+        return None
+    return snapshot
+
+def saveSnapshot(path, key, snapshot):
+    """
+    Store a configuration snapshot atomically.
+
+    Args:
+        path: Snapshot file
+        key (dict): Configuration the snapshot was taken with
+        snapshot (dict): Snapshot from DW1000.takeSnapshot()
+    """
+    snapshot = dict(snapshot, key=key)
+    try:
+        with open(path + ".tmp", "w") as f:
+            json.dump(snapshot, f)
+        os.replace(path + ".tmp", path)
+    except OSError as e:
+        logging.warning("Could not store configuration snapshot: {}".format(e))
 
 class Node:
     """
     Super class for tag and anchor
 
+    Args:
+        config (configuration.Config): Configuration, configuration.fromModule() if not given
+
     Attributes:
-        dw1000 (DW1000): DW1000 device object
+        config (configuration.Config): Configuration
+        dw1000 (DW1000): DW1000 device object, created by setup() unless set before
+        eid: Extended unique identifier of the DW1000
+        mode: Operation mode from DW1000Constants
+        snapshot_file: Configuration snapshot file, see configure()
+        clock: Monotonic clock in seconds used for timeouts
+        time_start: Clock value at the start of setup()
         timeout: Current time to check for timeouts
-        timeout_old: Last timestamp for valid activity
+        timeout_old: Clock value of the last activity (good or sent frame) or recovery
         timeout_limit: Maximum time between timeout and timeout_old
-        timeouts: Number of timeouts that occurred
+        timeouts: Number of inactivity timeouts that occurred
+        rx_frames: Number of received good frames
+        tx_frames: Number of sent frames
+        rx_errors: Number of receiver errors
+        rx_timeouts: Number of receiver frame wait timeouts
+        rx_overruns: Number of receiver overruns, each discards the frames in both receive buffers
+        rx_rejected: Number of frames for other nodes rejected by frame filtering
         cb_rxfcg: Callback on good frame reception
         cb_txfrs: Callback after frame send
         cb_rxrfto: Callback after receiver timeout
         cb_rxerr: Callback after receiver error
         cb_irq_while: Callback at the beginning of the interruptCB while loop
-        cb_reset: Callback if a timeout occurs
+        cb_reset: Callback restarting the role after an inactivity timeout, see recover()
+        recovery (Recovery): Recovery tier selection and statistics
         enableRx: Enable receiver at end of interruptCB
-        status: Temporary stores a copy of the status register
-        message: Stores last message
-        header: Storess header of last message
+        status: Copy of the status register, updated in place by interruptCB
+        frame (MAC.Frame): Last received frame, only valid until the next reception
     """
-    def __init__(self):
+    def __init__(self, config=None):
+        self.config = config if config is not None else configuration.fromModule()
         self.dw1000 = None
-
-        self.timeout = time.monotonic() # Current time
-        self.timeout_old = time.monotonic() # Last valid timestamp
+        self.eid = self.config.eid
+        self.mode = C.MODE_STANDARD
+        self.snapshot_file = self.config.snapshot_file
+        self.clock = time.monotonic
+        self.time_start = None
+
+        self.timeout = self.clock() # Current time
+        self.timeout_old = self.clock() # Last valid timestamp
         self.timeout_limit = 0.5 # Maximum time between timeout and timeout_old
         self.timeouts = 0 # Stores number of timeouts
+        self.recovery = R.Recovery(self.config.recovery_error_limit)
+
+        # Statistics
+        self.rx_frames = 0
+        self.tx_frames = 0
+        self.rx_errors = 0
+        self.rx_timeouts = 0
+        self.rx_overruns = 0
+        self.rx_rejected = 0
 
         # Callbacks to be set by subclasses
         self.cb_rxfcg = lambda: None
@@ -55,10 +131,19 @@ class Node:
 
         self.enableRx = False # Enable receiver at end of interruptCB?
 
-        self.status = None # Store status register of dw1000
+        self.status = DW1000Register(C.SYS_STATUS, C.NO_SUB, 5) # Store status register of dw1000
+
+        self.frame = None # Last received frame
+
+    @property
+    def message(self):
+        """ (memoryview): Last received message including the CRC """
+        return self.frame.data if self.frame is not None else None
 
-        self.message = None # Store last message
-        self.header = None # Store header of last message
+    @property
+    def header(self):
+        """ (MAC.MACHeader): Fully decoded header of the last received message """
+        return self.frame.header if self.frame is not None else None
 
     def setup(self):
         """
@@ -66,15 +151,56 @@ class Node:
 
         Normally called by setup function inside subclass.
         """
-        self.dw1000 = DW1000(config.pin_cs, config.pin_rst, config.pin_irq)
+        self.time_start = self.clock()
+        profiler.enabled = self.config.profiling_enable
+        profiler.dump_interval = self.config.profiling_dump_interval
+
+        if self.dw1000 is None:
+            self.dw1000 = DW1000(self.config.pin_cs, self.config.pin_rst, self.config.pin_irq,
+                                 bus=self.config.spi_bus, device=self.config.spi_device)
+        self.setupRadio()
+
+        logging.info(self.dw1000.getDeviceInfoString())
+
+    def setupRadio(self):
+        """
+        Reset and configure the DW1000
+
+        Called by setup() and to reinitialize the DW1000 during recovery.
+        Subclasses extend it with their register settings.
+        """
         self.dw1000.begin()
         logging.info("DW1000 initialized")
 
-        self.dw1000.generalConfiguration(config.eid, config.pan, C.MODE_STANDARD)
-        self.dw1000.setAntennaDelay(C.ANTENNA_DELAY_RASPI)
+        self.configure()
         self.dw1000.interruptCallback = self.interruptCB
 
-        logging.info(self.dw1000.getDeviceInfoString())
+    def configure(self):
+        """
+        Configure address, network and mode of the DW1000
+
+        If enabled, the configured registers are cached in snapshot_file and restored on the next
+        start instead of the full configuration with tuning and OTP read. A snapshot that does not read
+        back correctly is replaced.
+        """
+        t = self.clock()
+        key = {"version": SNAPSHOT_VERSION, "eid": self.eid, "pan": self.config.pan, "mode": list(self.mode),
+               "antenna_delay": self.config.antenna_delay}
+        snapshot = loadSnapshot(self.snapshot_file, key) if self.config.snapshot_enable else None
+        if snapshot is not None:
+            try:
+                if self.dw1000.restoreSnapshot(snapshot):
+                    logging.info("Restored configuration snapshot in {:.3f} s".format(self.clock() - t))
+                    return
+                logging.warning("Configuration snapshot read back mismatch")
+            except (KeyError, TypeError, ValueError) as e:
+                logging.warning("Invalid configuration snapshot: {}".format(e))
+
+        self.dw1000.generalConfiguration(self.eid, self.config.pan, self.mode)
+        self.dw1000.setAntennaDelay(self.config.antenna_delay)
+        if self.config.snapshot_enable:
+            saveSnapshot(self.snapshot_file, key, self.dw1000.takeSnapshot())
+        logging.info("Configured DW1000 in {:.3f} s".format(self.clock() - t))
 
     def run(self):
         """
@@ -84,20 +210,61 @@ class Node:
         It runs the main loop and checks for inactivity of the DW1000.
         If a timeout occurs, a custom callback can be called.
         """
+        self.start()
+
+        while True:
+            self.step()
+
+    def start(self):
+        """
+        Start the role after setup(), call step() afterwards
+        """
         self.dw1000.newReceive()
         self.dw1000.startReceive()
+        self.timeout_old = self.clock()
 
-        while True:
-            # Currently not using irq
-            self.interruptCB()
+    def step(self):
+        """
+        One iteration of the main loop
+
+        Handles the pending status events and checks for inactivity of the DW1000.
+        A recovery starts after timeout_limit without activity, or as soon as
+        recovery.error_limit receiver errors and timeouts happened without activity.
+        """
+        # Currently not using irq
+        self.interruptCB()
+
+        self.timeout = self.clock()
+        dt = self.timeout - self.timeout_old
+        if dt > self.timeout_limit:
+            self.timeouts += 1
+            self.recover("inactive")
+            self.timeout_old = self.clock()
+        elif self.recovery.errors >= self.recovery.error_limit:
+            self.recover("receiver errors")
+            self.timeout_old = self.clock()
+
+        if profiler.enabled:
+            profiler.dumpIfDue(self.timeout)
+
+    def recover(self, reason="inactive"):
+        """
+        Recover from an inactivity timeout or a series of receiver errors
+
+        The tier is selected by the recovery statistics, see recovery.py.
+        Every tier ends with cb_reset restarting the role.
 
-            self.timeout = time.monotonic()
-            dt = self.timeout - self.timeout_old
-            if dt > self.timeout_limit:
-                logging.error("Reset inactive")
-                self.cb_reset()
-                self.timeout_old = self.timeout
-                self.timeouts += 1
+        Args:
+            reason: Cause for the log
+        """
+        tier = self.recovery.select(self.timeout_old)
+        logging.error("Reset %s, recovery %s", reason, R.TIER_NAMES[tier])
+        if tier == R.REINIT:
+            self.setupRadio()
+        elif tier == R.RX_RESET:
+            self.dw1000.forceTRxOff()
+            self.dw1000.rxreset()
+        self.cb_reset()
 
     def stop(self):
         """
@@ -111,26 +278,41 @@ class Node:
 
         Subclasses use this functionality by setting their own callback functions.
         """
+        t_irq = profiler.start()
         self.enableRx = False
 
         # Read and store the status register
         self.dw1000.readRegister(self.dw1000.sysstatus)
-        self.status = copy.deepcopy(self.dw1000.sysstatus)
+        self.status.data[:] = self.dw1000.sysstatus.data
 
         # Loop over status register, status is queries again at the end of the loop
-        while(self.status.getBitsOr(C.SYS_STATUS_ALL_TX + C.SYS_STATUS_ALL_RX_TO + C.SYS_STATUS_ALL_RX_GOOD + C.SYS_STATUS_ALL_RX_ERR)):
+        while(self.status.getBitsOr(C.SYS_STATUS_ALL_EVENTS)):
 
             self.cb_irq_while()
+            active = False
+
+            if self.status.getBit(C.RXOVRR_BIT):
+                # Both receive buffers were full, the receiver has to be reset and the buffered frames are lost
+                if __debug__ and TRACE:
+                    logging.debug("RXOVRR")
+                self.rx_overruns += 1
+                self.recovery.error()
+
+                self.dw1000.abortReceive()
+                self.status.clear()
+                self.enableRx = True
 
             if self.status.getBit(C.RXFCG_BIT):
-                logging.debug("RXFCG")
+                if __debug__ and TRACE:
+                    logging.debug("RXFCG")
+                self.rx_frames += 1
+                active = True
                 self.dw1000.clearStatus(C.SYS_STATUS_ALL_RX_GOOD)
 
-                self.message = self.dw1000.getMessage()
-                self.header = MAC.MACHeader.decode(self.message)
+                self.frame = self.dw1000.getFrame()
 
-                if self.status.getBit(C.AAT_BIT) and self.header.frameControl.ackRequest == 0:
-                    self.dw1000.clearStatus([C.AAT_BIT])
+                if self.status.getBit(C.AAT_BIT) and self.frame.ackRequest == 0:
+                    self.dw1000.clearStatus(1 << C.AAT_BIT)
                     self.enableRx = True
 
                 # User CB
@@ -139,7 +321,10 @@ class Node:
                 self.dw1000.toggleHSRBP()
 
             if self.status.getBit(C.TXFRS_BIT):
-                logging.debug("TXFRS")
+                if __debug__ and TRACE:
+                    logging.debug("TXFRS")
+                self.tx_frames += 1
+                active = True
                 self.dw1000.clearStatus(C.SYS_STATUS_ALL_TX)
                 self.enableRx = True
 
@@ -151,34 +336,58 @@ class Node:
                 self.cb_txfrs()
 
             if self.status.getBitsOr(C.SYS_STATUS_ALL_RX_TO):
-                logging.debug("RXRFTO")
-                self.dw1000.clearStatus([C.RXRFTO_BIT])
+                if __debug__ and TRACE:
+                    logging.debug("RXRFTO")
+                self.rx_timeouts += 1
+                self.recovery.error()
+                self.dw1000.clearStatus(1 << C.RXRFTO_BIT)
                 self.dw1000.sysctrl.setBit(C.WAIT4RESP_BIT, False)
 
-                self.dw1000.forceTRxOff()
-                self.dw1000.rxreset()
+                self.dw1000.abortReceive()
+                if self.dw1000.permanentReceive:
+                    self.enableRx = True
 
                 # User CB
                 self.cb_rxrfto()
 
+            if self.status.getBit(C.AFFREJ_BIT):
+                # A good frame for another node, no receiver error, the receiver re-enables itself and keeps waiting
+                if __debug__ and TRACE:
+                    logging.debug("AFFREJ")
+                self.rx_rejected += 1
+                self.dw1000.clearStatus(1 << C.AFFREJ_BIT)
+                self.status.setBit(C.AFFREJ_BIT, False)
+
             if self.status.getBitsOr(C.SYS_STATUS_ALL_RX_ERR):
-                logging.debug("RXERR")
+                if __debug__ and TRACE:
+                    logging.debug("RXERR")
+                self.rx_errors += 1
+                self.recovery.error()
                 self.dw1000.clearStatus(C.SYS_STATUS_ALL_RX_ERR)
                 self.dw1000.sysctrl.setBit(C.WAIT4RESP_BIT, False)
 
-                self.dw1000.forceTRxOff()
-                self.dw1000.rxreset()
+                self.dw1000.abortReceive()
+                if self.dw1000.permanentReceive:
+                    self.enableRx = True
 
                 # User CB
                 self.cb_rxerr()
 
             self.dw1000.readRegister(self.dw1000.sysstatus)
-            self.status = copy.deepcopy(self.dw1000.sysstatus)
+            self.status.data[:] = self.dw1000.sysstatus.data
 
-            self.timeout_old = time.monotonic()
+            if active:
+                # Errors and timeouts are no activity, they must not postpone a recovery
+                self.timeout_old = self.clock()
+                self.recovery.activity(self.timeout_old)
 
         if self.enableRx:
-            self.dw1000.newReceive()
-            self.dw1000.startReceive()
+            if self.dw1000.permanentReceive:
+                self.dw1000.resumeReceive()
+            else:
+                self.dw1000.newReceive()
+                self.dw1000.startReceive()
+
+        profiler.stop(P.IRQ, t_irq)
 
 
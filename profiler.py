@@ -0,0 +1,170 @@
+"""@package profiler
+
+This module provides a low overhead latency profiler for the ranging pipeline.
+
+Stages are timed with time.perf_counter_ns() and aggregated into fixed size
+log2 histograms, nothing is allocated per event. The profiler can be switched
+on and off at runtime and is cheap enough to stay enabled in production.
+
+Usage:
+    t = profiler.start()
+    ...
+    profiler.stop(SPI_READ, t)
+"""
+
+import time
+import logging
+from array import array
+
+# Stages
+SPI_READ = 0
+SPI_WRITE = 1
+MAC_DECODE = 2
+CORRECT_TIMESTAMP = 3
+SEND_MESSAGE = 4
+IRQ = 5
+SOLVE = 6
+LOG_WRITE = 7
+BURST_TURNAROUND = 8 # Handling of a response up to the next poll of a burst
+
+STAGE_NAMES = ["spi_read", "spi_write", "mac_decode", "correct_timestamp", "send_message", "irq", "solve", "log_write",
+               "burst_turnaround"]
+
+# Bucket i counts durations d with 2^(i-1) <= d < 2^i ns, the last bucket is open ended (> 1 s)
+BUCKETS = 32
+
+class Profiler():
+    """
+    Stage latency profiler.
+
+    Args:
+        enabled: Initial state
+        dump_interval: Interval of the periodic log dump in seconds, 0 disables the dump
+
+    Attributes:
+        enabled: Profiling state, switch at runtime with enable()/disable()
+        dump_interval: Interval of the periodic log dump in seconds
+        dump_last: Time of the last dump (time.monotonic())
+        histogram: Flat array of STAGES x BUCKETS event counts
+        calls: Number of events per stage
+        total_ns: Accumulated duration per stage
+        max_ns: Maximum duration per stage
+    """
+    def __init__(self, enabled=False, dump_interval=60.):
+        self.enabled = enabled
+        self.dump_interval = dump_interval
+        self.dump_last = time.monotonic()
+
+        stages = len(STAGE_NAMES)
+        self.histogram = array('Q', bytes(8 * stages * BUCKETS))
+        self.calls = array('Q', bytes(8 * stages))
+        self.total_ns = array('Q', bytes(8 * stages))
+        self.max_ns = array('Q', bytes(8 * stages))
+
+    def enable(self):
+        """ Start collecting events """
+        self.enabled = True
+
+    def disable(self):
+        """ Stop collecting events, collected data is kept """
+        self.enabled = False
+
+    def reset(self):
+        """ Clear all collected data """
+        for arr in (self.histogram, self.calls, self.total_ns, self.max_ns):
+            for i in range(0, len(arr)):
+                arr[i] = 0
+
+    def start(self):
+        """
+        Start a span.
+
+        Returns:
+            Start time in nanoseconds, 0 if the profiler is disabled
+        """
+        if self.enabled:
+            return time.perf_counter_ns()
+        return 0
+
+    def stop(self, stage, start):
+        """
+        End a span and record its duration.
+
+        Args:
+            stage: Stage identifier
+            start: Return value of start()
+        """
+        if not start:
+            return
+        dt = time.perf_counter_ns() - start
+        self.histogram[stage * BUCKETS + min(dt.bit_length(), BUCKETS - 1)] += 1
+        self.calls[stage] += 1
+        self.total_ns[stage] += dt
+        if dt > self.max_ns[stage]:
+            self.max_ns[stage] = dt
+
+    def percentile(self, stage, p):
+        """
+        Approximate percentile of a stage from its histogram.
+
+        Args:
+            stage: Stage identifier
+            p: Percentile in range [0, 100]
+
+        Returns:
+            Upper bound of the histogram bucket containing the percentile in nanoseconds
+        """
+        calls = self.calls[stage]
+        if not calls:
+            return 0
+        limit = calls * p / 100.
+        count = 0
+        offset = stage * BUCKETS
+        for i in range(0, BUCKETS):
+            count += self.histogram[offset + i]
+            if count >= limit:
+                return 1 << i
+        return 1 << (BUCKETS - 1)
+
+    def summary(self):
+        """
+        Summary of all stages.
+
+        Returns:
+            (dict): Per stage dict with calls, mean, p50, p99, max (nanoseconds) and histogram buckets
+        """
+        result = {}
+        for stage, name in enumerate(STAGE_NAMES):
+            calls = self.calls[stage]
+            result[name] = {
+                "calls": calls,
+                "mean_ns": self.total_ns[stage] // calls if calls else 0,
+                "p50_ns": self.percentile(stage, 50),
+                "p99_ns": self.percentile(stage, 99),
+                "max_ns": self.max_ns[stage],
+                "buckets": self.histogram[stage * BUCKETS:(stage + 1) * BUCKETS].tolist()
+            }
+        return result
+
+    def dump(self):
+        """ Write the summary to the log """
+        lines = ["Profile (calls, mean, p50, p99, max in us):"]
+        for name, stats in self.summary().items():
+            if stats["calls"]:
+                lines.append("{:18} {:8} {:10.1f} {:10.1f} {:10.1f} {:10.1f}".format(
+                    name, stats["calls"], stats["mean_ns"] / 1e3, stats["p50_ns"] / 1e3,
+                    stats["p99_ns"] / 1e3, stats["max_ns"] / 1e3))
+        logging.info("\n".join(lines))
+
+    def dumpIfDue(self, now):
+        """
+        Periodic dump, call regularly from a main loop.
+
+        Args:
+            now: Current time (time.monotonic())
+        """
+        if self.dump_interval and now - self.dump_last >= self.dump_interval:
+            self.dump_last = now
+            self.dump()
+
+profiler = Profiler()
@@ -0,0 +1,171 @@
+"""@package radio
+Several DW1000 radios driven from one host process.
+
+Every radio (see config.radios) is a node, an anchor or a tag, with its own DW1000
+on its own SPI bus or chip select line, its own configuration (the host configuration
+with the settings of the radio, see configuration.py), channel and snapshot file and
+its own loop (Node.step()). The loops are scheduled by one RadioDispatcher:
+the interrupt lines of all radios share one GPIO callback that queues the radio of
+the pin, and a single thread steps the queued radios. Every radio is also stepped
+after poll_interval, for the inactivity recovery and in case an edge was missed.
+
+Only the dispatcher thread accesses the radios, so radios on the same SPI bus never
+interleave their transfers.
+"""
+
+import os
+import time
+import logging
+import importlib
+from collections import deque
+from threading import Thread, Event
+
+import config
+import configuration
+import DW1000Constants as C
+from DW1000 import DW1000
+
+# Role of a radio, module and class
+ROLES = {"anchor": ("anchor", "Anchor"), "tag": ("tag", "Tag")}
+
+def createNode(radio, index, gpio=None):
+    """
+    Create the node of a radio.
+
+    Args:
+        radio (dict): Radio configuration, see config.radios
+        index: Number of the radio, used for the default snapshot file
+        gpio: GPIO module, RPi.GPIO if not given
+
+    Returns:
+        (Node): Node of the configured role, setup() is not called yet
+    """
+    radio = configuration.parseRadio(radio, index)
+    role = radio.get("role", config.mode)
+
+    root, extension = os.path.splitext(config.snapshot_file)
+    settings = {"mode": role, "snapshot_file": "{}_{}{}".format(root, index, extension)}
+    settings.update((key, radio[key]) for key in configuration.RADIO_SETTINGS if key in radio)
+
+    module, name = ROLES[role]
+    node = getattr(importlib.import_module(module), name)(configuration.fromModule(**settings))
+    node.mode = list(node.mode)
+    node.mode[C.CHANNEL_BIT] = radio.get("channel", node.mode[C.CHANNEL_BIT])
+    node.mode[C.PREAMBLE_CODE_BIT] = radio.get("preamble_code", node.mode[C.PREAMBLE_CODE_BIT])
+    node.dw1000 = DW1000(node.config.pin_cs, node.config.pin_rst, node.config.pin_irq, gpio=gpio,
+                         bus=node.config.spi_bus, device=node.config.spi_device)
+    return node
+
+class RadioDispatcher():
+    """
+    Schedules the loops of several nodes on one thread.
+
+    Args:
+        nodes: Nodes after setup()
+        poll_interval: Seconds after which a node is stepped without an interrupt
+
+    Attributes:
+        nodes: Scheduled nodes
+        pins: Node index per interrupt pin
+        pending: Indices of the nodes with an interrupt to handle
+        event: Set on an interrupt
+        interrupts: Number of interrupts per node
+        steps: Number of steps per node
+    """
+    def __init__(self, nodes, poll_interval=0.01):
+        self.nodes = list(nodes)
+        self.poll_interval = poll_interval
+        self.pins = {node.dw1000.irq: index for index, node in enumerate(self.nodes)}
+        if len(self.pins) != len(self.nodes):
+            raise ValueError("Radios must not share an interrupt pin")
+
+        self.pending = deque()
+        self.event = Event()
+        self.running = False
+        self.thread = None
+        self.clock = time.monotonic
+        self.polled = self.clock()
+
+        self.interrupts = [0] * len(self.nodes)
+        self.steps = [0] * len(self.nodes)
+
+    def notify(self, pin):
+        """
+        Shared GPIO callback of the interrupt lines, only queues the node.
+
+        Args:
+            pin: Interrupt pin with a rising edge
+        """
+        index = self.pins.get(pin)
+        if index is not None:
+            self.pending.append(index)
+            self.event.set()
+
+    def dispatch(self):
+        """ Step the nodes with pending interrupts, and all nodes once poll_interval is over """
+        while self.pending:
+            index = self.pending.popleft()
+            self.interrupts[index] += 1
+            self.steps[index] += 1
+            self.nodes[index].step()
+
+        now = self.clock()
+        if now - self.polled >= self.poll_interval:
+            self.polled = now
+            for index, node in enumerate(self.nodes):
+                self.steps[index] += 1
+                node.step()
+
+    def start(self):
+        """ Start the roles of all nodes and the dispatcher thread """
+        for node in self.nodes:
+            node.start()
+            node.dw1000.enableInterrupt(self.notify)
+        self.running = True
+        self.thread = Thread(target=self.dispatchFunc, daemon=True)
+        self.thread.start()
+
+    def dispatchFunc(self):
+        """ Dispatcher thread """
+        while self.running:
+            self.event.wait(self.poll_interval)
+            self.event.clear()
+            self.dispatch()
+
+    def stop(self):
+        """ Stop the dispatcher thread and all nodes """
+        self.running = False
+        self.event.set()
+        if self.thread is not None:
+            self.thread.join()
+        for node in self.nodes:
+            node.stop()
+
+    def counters(self):
+        """
+        Returns:
+            (list): Interrupts, steps and frame counters per node
+        """
+        return [{"eid": node.eid, "interrupts": interrupts, "steps": steps, "rx_frames": node.rx_frames,
+                 "tx_frames": node.tx_frames, "rx_overruns": node.rx_overruns,
+                 "rx_rejected": node.rx_rejected, "timeouts": node.timeouts}
+                for node, interrupts, steps in zip(self.nodes, self.interrupts, self.steps)]
+
+def main():
+    nodes = [createNode(radio, index) for index, radio in enumerate(config.radios)]
+    for node in nodes:
+        node.setup()
+    dispatcher = RadioDispatcher(nodes, config.radio_poll_interval)
+    dispatcher.start()
+
+    try:
+        while True:
+            time.sleep(1.)
+    except KeyboardInterrupt:
+        dispatcher.stop()
+
+    for counters in dispatcher.counters():
+        logging.info("Radio: {}".format(counters))
+
+if __name__ == "__main__":
+    main()
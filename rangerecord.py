@@ -0,0 +1,140 @@
+"""@package rangerecord
+Compact binary records exchanged between tags and the positioning server.
+
+A datagram consists of a header followed by a number of records:
+
+    header:   magic "UW" | version (uint8) | record count (uint8)
+    range:    kind=1 | tag (2 bytes) | anchor (2 bytes) | round (uint16) | unix time (double) | range (float) | weight (float)
+    position: kind=2 | tag (2 bytes) | round (uint16) | unix time (double) | x, y, z (float)
+
+All values are little endian. Tag and anchor ids are the 2 byte short addresses.
+"""
+
+import struct
+
+MAGIC = b"UW"
+VERSION = 1
+
+KIND_RANGE = 1
+KIND_POSITION = 2
+
+headerStruct = struct.Struct("<2sBB")
+rangeStruct = struct.Struct("<B2s2sHdff")
+positionStruct = struct.Struct("<B2sHdfff")
+
+# Maximum datagram size that fits into one ethernet frame without fragmentation
+MAX_DATAGRAM = 1472
+
+class RangeRecord():
+    """
+    Range between a tag and an anchor.
+
+    Attributes:
+        tag: Tag short address (2 bytes)
+        anchor: Anchor short address (2 bytes)
+        round: Ranging round counter of the tag (wraps at 2^16)
+        time: Unix time of the measurement
+        range: Range in meter
+        weight: Weight of the range, e.g. from the receive quality
+    """
+    __slots__ = ("tag", "anchor", "round", "time", "range", "weight")
+    kind = KIND_RANGE
+    size = rangeStruct.size
+
+    def __init__(self, tag, anchor, round, time, range, weight=1.):
+        self.tag = bytes(tag)
+        self.anchor = bytes(anchor)
+        self.round = round & 0xFFFF
+        self.time = time
+        self.range = range
+        self.weight = weight
+
+    def pack(self):
+        return rangeStruct.pack(KIND_RANGE, self.tag, self.anchor, self.round, self.time, self.range, self.weight)
+
+    @staticmethod
+    def unpack(data, offset):
+        _, tag, anchor, round, time, range, weight = rangeStruct.unpack_from(data, offset)
+        return RangeRecord(tag, anchor, round, time, range, weight)
+
+class PositionRecord():
+    """
+    Position calculated by a tag.
+
+    Attributes:
+        tag: Tag short address (2 bytes)
+        round: Ranging round counter of the tag (wraps at 2^16)
+        time: Unix time of the position
+        position: [x, y, z] in meter
+    """
+    __slots__ = ("tag", "round", "time", "position")
+    kind = KIND_POSITION
+    size = positionStruct.size
+
+    def __init__(self, tag, round, time, position):
+        self.tag = bytes(tag)
+        self.round = round & 0xFFFF
+        self.time = time
+        self.position = [float(i) for i in position[0:3]]
+
+    def pack(self):
+        return positionStruct.pack(KIND_POSITION, self.tag, self.round, self.time, *self.position)
+
+    @staticmethod
+    def unpack(data, offset):
+        _, tag, round, time, x, y, z = positionStruct.unpack_from(data, offset)
+        return PositionRecord(tag, round, time, [x, y, z])
+
+RECORD_TYPES = {KIND_RANGE: RangeRecord, KIND_POSITION: PositionRecord}
+
+def encodeDatagram(records):
+    """
+    Encode records into one datagram.
+
+    Args:
+        records: Records, at most 255 and encodedSize(records) <= MAX_DATAGRAM
+
+    Returns:
+        (bytes): Datagram
+    """
+    return headerStruct.pack(MAGIC, VERSION, len(records)) + b"".join(r.pack() for r in records)
+
+def encodedSize(records):
+    """
+    Args:
+        records: Records
+
+    Returns:
+        Size of the datagram containing the records in bytes
+    """
+    return headerStruct.size + sum(r.size for r in records)
+
+def decodeDatagram(data):
+    """
+    Decode a datagram.
+
+    Args:
+        data (bytes): Datagram
+
+    Returns:
+        (list): Records
+
+    Raises:
+        ValueError: Invalid datagram
+    """
+    try:
+        magic, version, count = headerStruct.unpack_from(data, 0)
+    except struct.error:
+        raise ValueError("Datagram shorter than the header")
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("Invalid datagram header")
+    records = []
+    offset = headerStruct.size
+    for i in range(0, count):
+        try:
+            record = RECORD_TYPES[data[offset]].unpack(data, offset)
+        except (KeyError, IndexError, struct.error):
+            raise ValueError("Invalid record")
+        records.append(record)
+        offset += record.size
+    return records
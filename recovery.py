@@ -0,0 +1,101 @@
+"""@package recovery
+Tiered recovery of a node after an inactivity timeout or a series of receiver errors.
+
+Recoveries get more expensive the longer a node stays inactive:
+
+    REENABLE: Restart the role (anchor: receiver re-enable, tag: new poll)
+    RX_RESET: Force the transceiver off and soft reset the receiver, then restart the role
+    REINIT: Hard reset and reconfigure the DW1000 (see Node.setupRadio()), then restart the role
+
+A recovery starts after timeout_limit without activity (a good or a sent frame),
+or as soon as error_limit receiver errors and timeouts happened without activity
+(see Node.step()). The first recovery after activity uses REENABLE, or RX_RESET if
+it was started by the errors. Every further recovery before activity escalates to
+the next tier, so a radio producing nothing but errors reaches REINIT after three
+times error_limit errors. The time to recover is measured from the last activity
+before the first recovery to the first activity after it.
+"""
+
+REENABLE = 0
+RX_RESET = 1
+REINIT = 2
+TIER_NAMES = ["reenable", "rx_reset", "reinit"]
+
+class Recovery():
+    """
+    Recovery tier selection and statistics.
+
+    Args:
+        error_limit: Receiver errors and timeouts without activity that start a recovery
+
+    Attributes:
+        tier: Tier of the current or last recovery
+        pending: Clock value of the last activity before the current recovery, None if the node is active
+        errors: Receiver errors and timeouts since the last activity or recovery
+        counts: Number of recoveries per tier
+        escalations: Number of recoveries escalated because the previous one failed
+        recovered: Number of recoveries that got the node back to activity
+        time_total: Sum of the times to recover in seconds
+        time_max: Longest time to recover in seconds
+        time_last: Last time to recover in seconds
+    """
+    def __init__(self, error_limit=8):
+        self.error_limit = error_limit
+        self.tier = REENABLE
+        self.pending = None
+        self.errors = 0
+        self.counts = [0] * len(TIER_NAMES)
+        self.escalations = 0
+        self.recovered = 0
+        self.time_total = 0.
+        self.time_max = 0.
+        self.time_last = 0.
+
+    def select(self, last_activity):
+        """
+        Select the tier of a recovery starting now.
+
+        Args:
+            last_activity: Clock value of the last activity
+
+        Returns:
+            Recovery tier
+        """
+        if self.pending is None:
+            self.pending = last_activity
+            self.tier = RX_RESET if self.errors >= self.error_limit else REENABLE
+        elif self.tier < REINIT:
+            self.tier += 1
+            self.escalations += 1
+        self.counts[self.tier] += 1
+        self.errors = 0
+        return self.tier
+
+    def error(self):
+        """ Count a receiver error or timeout """
+        self.errors += 1
+
+    def activity(self, now):
+        """
+        Record activity, ends a pending recovery.
+
+        Args:
+            now: Clock value
+        """
+        self.errors = 0
+        if self.pending is not None:
+            self.time_last = now - self.pending
+            self.time_total += self.time_last
+            self.time_max = max(self.time_max, self.time_last)
+            self.recovered += 1
+            self.pending = None
+
+    def counters(self):
+        """
+        Returns:
+            (dict): Recoveries per tier and the time to recover statistics
+        """
+        counters = {name: count for name, count in zip(TIER_NAMES, self.counts)}
+        counters.update({"escalations": self.escalations, "recovered": self.recovered, "time_total": self.time_total,
+                         "time_max": self.time_max, "time_last": self.time_last})
+        return counters
@@ -0,0 +1,487 @@
+"""@package server
+Central positioning server.
+
+Tags send their raw ranges as binary records (see rangerecord.py) over UDP.
+The server groups the ranges of each tag into ranging rounds, solves the rounds
+of many tags at once in a pool of solver threads with the batched trilateration
+of the Trilaterator, keeps a track per tag and serves the results over HTTP.
+
+Usage:
+    python server.py [--port 9000] [--http-port 8081] [--workers 2] [--batch 128]
+
+HTTP paths:
+    /tags: Latest position of all tags
+    /tags/<id>: Latest position and history of one tag, id is the hex short address
+    /stats: Server statistics
+    /metrics: Prometheus metrics
+"""
+
+import time
+import struct
+import json
+import socket
+import logging
+import argparse
+from queue import Queue, Empty
+from collections import deque
+from threading import Thread, Lock
+from urllib.parse import urlparse
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import numpy as np
+
+import config
+import configuration
+import rangerecord as R
+from trilaterate import Trilaterator
+from tracker import PositionTracker
+from metrics import MetricsWriter, CONTENT_TYPE
+
+def percentile(values, p):
+    if not values:
+        return 0.
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100.))]
+
+class Round():
+    """
+    Ranges of one ranging round of a tag.
+
+    Attributes:
+        tag: Tag short address
+        round: Round counter of the tag
+        received: Arrival time of the first range (time.monotonic())
+        ranges: Range records by anchor short address
+    """
+    def __init__(self, tag, round, received):
+        self.tag = tag
+        self.round = round
+        self.received = received
+        self.ranges = {}
+
+class TagTrack():
+    """
+    Position track of one tag.
+
+    Args:
+        tag: Tag short address
+        history: Number of kept positions
+        config (configuration.Config): Configuration of the tracker
+
+    Attributes:
+        tag: Tag short address
+        tracker: Range based position tracker, None if disabled in config
+        position: Latest position
+        time: Unix time of the latest position
+        round: Round counter of the latest position
+        fixes: Number of positions
+        history: Recent (time, x, y, z) tuples
+    """
+    def __init__(self, tag, history, config):
+        self.tag = tag
+        self.tracker = None
+        if config.tracker_enable:
+            self.tracker = PositionTracker(config.tracker_range_std, config.tracker_accel_std, config.tracker_gate)
+        self.position = None
+        self.time = 0.
+        self.round = None
+        self.fixes = 0
+        self.history = deque(maxlen=history)
+
+    def update(self, position, t, round):
+        self.position = position
+        self.time = t
+        self.round = round
+        self.fixes += 1
+        self.history.append((t, float(position[0]), float(position[1]), float(position[2])))
+
+    def summary(self, history=False):
+        """
+        Returns:
+            (dict): JSON serializable state of the track
+        """
+        result = {"position": [float(i) for i in self.position], "time": self.time, "round": self.round, "fixes": self.fixes}
+        if history:
+            result["history"] = list(self.history)
+        return result
+
+class ServerRequestHandler(BaseHTTPRequestHandler):
+    """
+    Request handler of the positioning server, the server is accessed through self.server.positioning.
+    """
+    def do_GET(self):
+        positioning = self.server.positioning
+        path = urlparse(self.path).path
+        if path == "/tags":
+            self.sendJson(positioning.tagSummary())
+        elif path.startswith("/tags/"):
+            try:
+                tag = bytes.fromhex(path[6:])
+            except ValueError:
+                tag = None
+            track = positioning.tracks.get(tag)
+            if track is None or track.position is None:
+                self.send_error(404)
+            else:
+                self.sendJson(track.summary(history=True))
+        elif path == "/stats":
+            self.sendJson(positioning.statistics())
+        elif path == "/metrics":
+            self.sendBody(positioning.metrics(), CONTENT_TYPE)
+        else:
+            self.send_error(404)
+
+    def log_message(self, format, *args):
+        """ Do not log every request """
+        pass
+
+    def sendJson(self, data):
+        self.sendBody(json.dumps(data).encode(), "application/json")
+
+    def sendBody(self, body, content_type):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+class PositionServer():
+    """
+    Receives range records, solves positions and keeps the tag tracks.
+
+    The receive thread groups the ranges of each tag by round counter. A round is
+    queued for solving as soon as all anchors reported, the next round of the tag
+    starts or round_timeout expires. Each solver thread takes up to batch queued
+    rounds, solves rounds with the same number of ranges in one vectorized call
+    and updates the tracks.
+
+    Args:
+        anchors (dict): Anchor positions by anchor short address
+        address: UDP address for range records
+        http_address: HTTP address, None disables the web server
+        workers: Number of solver threads
+        batch: Maximum number of rounds per batch
+        round_timeout: Seconds after which an incomplete round is solved
+        history: Number of positions kept per tag
+        max_residual: Maximum RMS range residual of an accepted solution in meter
+        max_age: Rounds waiting longer than this in seconds are dropped when the solvers are overloaded
+        config (configuration.Config): Configuration, configuration.fromModule() if not given
+
+    Attributes:
+        anchors: Anchor positions by anchor short address
+        config (configuration.Config): Configuration
+        tracks: TagTrack by tag short address
+        pending: Incomplete Round by tag short address, only used by the receive thread
+        queue: Rounds waiting for a solver
+        lock: Protects the tracks and statistics
+        solvers: Trilaterator of each solver thread
+        counters: Statistics counters
+        latency: Recent end-to-end latencies (range measurement to position) in seconds
+        server_latency: Recent latencies from arrival of a round to its position in seconds
+    """
+    def __init__(self, anchors, address, http_address=None, workers=2, batch=128, round_timeout=0.5, history=100, max_residual=1.0, max_age=1.0, config=None):
+        self.anchors = {bytes(a): np.asarray(p, dtype=float) for a, p in anchors.items()}
+        self.config = config if config is not None else configuration.fromModule()
+        self.batch = batch
+        self.round_timeout = round_timeout
+        self.history = history
+        self.max_residual = max_residual
+        self.max_age = max_age
+
+        self.tracks = {}
+        self.pending = {}
+        self.queue = Queue()
+        self.lock = Lock()
+        self.solvers = [Trilaterator() for i in range(0, workers)]
+        self.counters = {"datagrams": 0, "invalid": 0, "ranges": 0, "unknown_anchor": 0, "rounds": 0,
+                         "incomplete": 0, "stale": 0, "batches": 0, "fixes": 0, "rejected": 0, "positions": 0}
+        self.latency = deque(maxlen=10000)
+        self.server_latency = deque(maxlen=10000)
+        self.running = True
+        self.started = time.monotonic()
+
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+        self.socket.bind(address)
+        self.socket.settimeout(round_timeout / 2)
+
+        self.threads = [Thread(target=self.receiveFunc, daemon=True)]
+        self.threads += [Thread(target=self.solveFunc, args=(solver,), daemon=True) for solver in self.solvers]
+
+        self.httpd = None
+        if http_address is not None:
+            self.httpd = ThreadingHTTPServer(http_address, ServerRequestHandler)
+            self.httpd.daemon_threads = True
+            self.httpd.positioning = self
+            self.threads.append(Thread(target=self.httpd.serve_forever, daemon=True))
+
+    def start(self):
+        for thread in self.threads:
+            thread.start()
+
+    def stop(self):
+        self.running = False
+        for solver in self.solvers:
+            self.queue.put(None)
+        if self.httpd is not None:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+        for thread in self.threads:
+            thread.join()
+        self.socket.close()
+
+    def receiveFunc(self):
+        """ Receive thread, decodes datagrams and assembles rounds """
+        last_flush = time.monotonic()
+        while self.running:
+            try:
+                data = self.socket.recv(R.MAX_DATAGRAM)
+                now = time.monotonic()
+                records = R.decodeDatagram(data)
+            except socket.timeout:
+                records = []
+                now = time.monotonic()
+            except (ValueError, IndexError, struct.error, OSError) as e:
+                if not self.running:
+                    break
+                logging.debug("Invalid datagram: {}".format(e))
+                self.counters["invalid"] += 1
+                continue
+
+            if records:
+                self.counters["datagrams"] += 1
+            for record in records:
+                if record.kind == R.KIND_RANGE:
+                    self.addRange(record, now)
+                else:
+                    self.addPosition(record)
+
+            if now - last_flush >= self.round_timeout / 2:
+                last_flush = now
+                self.flushPending(now)
+
+    def addRange(self, record, now):
+        """
+        Add a range to the pending round of its tag.
+
+        Args:
+            record (rangerecord.RangeRecord): Range
+            now: Arrival time (time.monotonic())
+        """
+        self.counters["ranges"] += 1
+        if record.anchor not in self.anchors:
+            self.counters["unknown_anchor"] += 1
+            return
+        pending = self.pending.get(record.tag)
+        if pending is not None and pending.round != record.round:
+            del self.pending[record.tag]
+            self.submit(pending)
+            pending = None
+        if pending is None:
+            pending = self.pending[record.tag] = Round(record.tag, record.round, now)
+        pending.ranges[record.anchor] = record
+        if len(pending.ranges) == len(self.anchors):
+            del self.pending[record.tag]
+            self.submit(pending)
+
+    def addPosition(self, record):
+        """
+        Store a position solved by the tag itself.
+
+        Args:
+            record (rangerecord.PositionRecord): Position
+        """
+        with self.lock:
+            track = self.getTrack(record.tag)
+            track.update(record.position, record.time, record.round)
+            self.counters["positions"] += 1
+
+    def flushPending(self, now):
+        """ Submit all rounds older than round_timeout """
+        for tag, pending in list(self.pending.items()):
+            if now - pending.received >= self.round_timeout:
+                del self.pending[tag]
+                self.submit(pending)
+
+    def submit(self, pending):
+        """ Queue a round for solving if it has enough ranges """
+        if len(pending.ranges) < 3:
+            self.counters["incomplete"] += 1
+            return
+        self.counters["rounds"] += 1
+        self.queue.put(pending)
+
+    def getTrack(self, tag):
+        track = self.tracks.get(tag)
+        if track is None:
+            track = self.tracks[tag] = TagTrack(tag, self.history, self.config)
+        return track
+
+    def solveFunc(self, trilaterator):
+        """
+        Solver thread, takes batches of rounds from the queue.
+
+        Args:
+            trilaterator (Trilaterator): Solver of this thread
+        """
+        stop = False
+        while not stop:
+            rounds = []
+            item = self.queue.get()
+            while item is not None:
+                rounds.append(item)
+                if len(rounds) == self.batch:
+                    break
+                try:
+                    item = self.queue.get_nowait()
+                except Empty:
+                    break
+            stop = item is None
+            # Shed load, a late position is of no use
+            deadline = time.monotonic() - self.max_age
+            fresh = [pending for pending in rounds if pending.received >= deadline]
+            if len(fresh) < len(rounds):
+                with self.lock:
+                    self.counters["stale"] += len(rounds) - len(fresh)
+            if fresh:
+                self.solveRounds(fresh, trilaterator)
+
+    def solveRounds(self, rounds, trilaterator):
+        """
+        Solve rounds, one vectorized solve per number of ranges.
+
+        Args:
+            rounds: List of Round
+            trilaterator (Trilaterator): Solver
+        """
+        groups = {}
+        for pending in rounds:
+            groups.setdefault(len(pending.ranges), []).append(pending)
+
+        for group in groups.values():
+            beacons = np.array([[self.anchors[a] for a in pending.ranges] for pending in group])
+            distances = np.array([[r.range for r in pending.ranges.values()] for pending in group])
+            weights = np.array([[r.weight for r in pending.ranges.values()] for pending in group])
+            estimates = np.mean(beacons, axis=1)
+            for i, pending in enumerate(group):
+                track = self.tracks.get(pending.tag)
+                if track is not None and track.position is not None:
+                    estimates[i] = track.position
+
+            positions = trilaterator.trilaterateBatch(beacons, distances, estimates, weights)
+            rms = np.sqrt(np.mean((distances - np.linalg.norm(positions[:, np.newaxis, :] - beacons, axis=2)) ** 2, axis=1))
+            self.updateTracks(group, positions, rms)
+
+        with self.lock:
+            self.counters["batches"] += 1
+
+    def updateTracks(self, group, positions, rms):
+        """
+        Fuse solved rounds into the tag tracks.
+
+        The first position bootstraps the tracker of a tag, later rounds are fused range by range.
+
+        Args:
+            group: List of Round
+            positions: Solved positions
+            rms: RMS range residual of each solution
+        """
+        with self.lock:
+            for pending, position, error in zip(group, positions, rms):
+                if not error <= self.max_residual:
+                    self.counters["rejected"] += 1
+                    continue
+                ranges = list(pending.ranges.values())
+                t = max(r.time for r in ranges)
+                track = self.getTrack(pending.tag)
+                tracker = track.tracker
+                if tracker is not None:
+                    if tracker.initialized and tracker.t <= t:
+                        for r in ranges:
+                            tracker.updateRange(self.anchors[r.anchor], r.range, r.time)
+                    else:
+                        tracker.reset(position, t)
+                    position = tracker.position.copy()
+                track.update(position, t, pending.round)
+                self.counters["fixes"] += 1
+                self.latency.append(time.time() - t)
+                self.server_latency.append(time.monotonic() - pending.received)
+
+    def tagSummary(self):
+        """
+        Returns:
+            (dict): Latest position of every tag by hex short address
+        """
+        with self.lock:
+            return {tag.hex(): track.summary() for tag, track in self.tracks.items() if track.position is not None}
+
+    def statistics(self):
+        """
+        Returns:
+            (dict): Counters, queue length, latency percentiles and CPU time
+        """
+        with self.lock:
+            latency = list(self.latency)
+            server_latency = list(self.server_latency)
+            stats = dict(self.counters)
+        stats["tags"] = len(self.tracks)
+        stats["queued"] = self.queue.qsize()
+        stats["uptime"] = time.monotonic() - self.started
+        stats["cpu"] = time.process_time()
+        stats["solve_time"] = sum(s.stats.time_ns for s in self.solvers) / 1e9
+        for p in (50, 99):
+            stats["latency_p{}".format(p)] = percentile(latency, p)
+            stats["server_latency_p{}".format(p)] = percentile(server_latency, p)
+        return stats
+
+    def metrics(self):
+        """
+        Returns:
+            (bytes): Prometheus metrics of the server
+        """
+        stats = self.statistics()
+        m = MetricsWriter("uwb_server_")
+        for name in self.counters:
+            m.counter(name + "_total", "Number of {}".format(name.replace("_", " ")), stats[name])
+        m.gauge("tags", "Number of tracked tags", stats["tags"])
+        m.gauge("queued_rounds", "Rounds waiting for a solver", stats["queued"])
+        m.counter("solve_seconds_total", "Time spent in the solver", stats["solve_time"])
+        m.family("latency_seconds", "gauge", "End-to-end latency from range to position",
+                 [({"quantile": "0.5"}, stats["latency_p50"]), ({"quantile": "0.99"}, stats["latency_p99"])])
+        return m.render()
+
+def main():
+    # Same configuration file as the nodes, see configuration.py
+    settings = configuration.load()
+    configuration.apply(settings)
+
+    parser = argparse.ArgumentParser(description="Central positioning server")
+    parser.add_argument("--host", default="", help="Listen address")
+    parser.add_argument("--port", type=int, default=config.server_port, help="UDP port for range records")
+    parser.add_argument("--http-port", type=int, default=config.server_http_port, help="HTTP port")
+    parser.add_argument("--workers", type=int, default=config.server_workers, help="Number of solver threads")
+    parser.add_argument("--batch", type=int, default=config.server_batch, help="Maximum rounds per batch")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    server = PositionServer(dict(zip(config.anchor_list, config.anchor_positions)),
+                            (args.host, args.port),
+                            (args.host, args.http_port),
+                            workers=args.workers,
+                            batch=args.batch,
+                            round_timeout=config.server_round_timeout,
+                            history=config.server_history,
+                            max_age=config.server_max_age,
+                            config=settings)
+    server.start()
+    logging.info("Positioning server on UDP port {}, HTTP port {}".format(args.port, args.http_port))
+    try:
+        while True:
+            time.sleep(60)
+            logging.info("Tags: {}, fixes: {}".format(len(server.tracks), server.counters["fixes"]))
+    except KeyboardInterrupt:
+        pass
+    server.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,1017 @@
+"""@package simulator
+Discrete-event simulator of a network of tags and anchors.
+
+Unmodified Tag and Anchor instances run against emulated DW1000 devices
+(SimDW1000) whose SPI transfers go to an in-memory register file instead of
+the hardware. The emulated devices share a radio channel which models:
+
+    Propagation delay from the node positions
+    Clock offset and frequency error (ppm) of every device and its receiver time tracking estimate
+    True antenna delays deviating from the configured value
+    Frame air time from TX_FCTRL (data rate, PRF, preamble length, Reed-Solomon parity)
+    Path loss, packet errors, NLOS links, collisions with capture and half duplex
+    Frame filtering, auto acknowledgement and the receive frame wait timeout
+    RX/TX timestamps in device time units with noise and the power dependent range bias
+
+The hosts run in simulated time as well: a node reacts to a status change after
+a polling latency and every register access advances the host time of its step
+by the SPI transfer time. Radio commands take effect at the host time and reading
+SYS_STATUS runs the simulation up to the host time, so a node waiting for a
+status bit sees it appear. Every node runs in its own thread, but only one thread
+runs at a time: a node busy waiting inside its step hands over to the simulation
+loop when a step of another node falls due, so the nodes interleave as on
+separate hosts. The computation time of the node code itself is not accounted.
+
+Usage:
+    python simulator.py [--tags 1,2,4] [--anchors 4] [--duration 10] [--mode standard]
+"""
+
+import os
+import math
+import time
+import heapq
+import random
+import logging
+import argparse
+from threading import Thread, Semaphore, current_thread
+
+import numpy as np
+
+import config
+import configuration
+import DW1000Constants as C
+from DW1000 import DW1000
+from DW1000Diagnostics import DW1000Diagnostics
+import MAC
+from anchor import Anchor
+from tag import Tag
+
+TICK = C.TIME_RES * 1e-6 # Device time unit in seconds
+SPEED_OF_LIGHT = C.DISTANCE_OF_RADIO / TICK
+FWTO_UNIT = 512 / 499.2e6 # Unit of RX_FWTO in seconds
+
+PREAMBLE_SYMBOLS = {C.TX_PREAMBLE_LEN_64: 64, C.TX_PREAMBLE_LEN_128: 128, C.TX_PREAMBLE_LEN_256: 256,
+                    C.TX_PREAMBLE_LEN_512: 512, C.TX_PREAMBLE_LEN_1024: 1024, C.TX_PREAMBLE_LEN_1536: 1536,
+                    C.TX_PREAMBLE_LEN_2048: 2048, C.TX_PREAMBLE_LEN_4096: 4096}
+SYMBOL_TIME = {C.TX_PULSE_FREQ_16MHZ: 993.59e-9, C.TX_PULSE_FREQ_64MHZ: 1017.63e-9}
+SFD_SYMBOLS = {C.TRX_RATE_110KBPS: 64, C.TRX_RATE_850KBPS: 16, C.TRX_RATE_6800KBPS: 8}
+BIT_TIME = {C.TRX_RATE_110KBPS: 8205.13e-9, C.TRX_RATE_850KBPS: 1025.64e-9, C.TRX_RATE_6800KBPS: 128.21e-9}
+SENSITIVITY = {C.TRX_RATE_110KBPS: -106., C.TRX_RATE_850KBPS: -102., C.TRX_RATE_6800KBPS: -94.} # dBm
+PHR_BITS = 21
+SYNC_SYMBOLS = 64 # Preamble symbols needed by a receiver to synchronize
+TX_STARTUP = 5e-6 # Transmitter start up time in seconds
+ACK_TURNAROUND = 10e-6 # Receive to auto acknowledge transmit turnaround without ACK_TIM in seconds
+TX_POWER = -14.3 # dBm, -41.3 dBm/MHz over 500 MHz
+PATH_LOSS_1M = 48.7 # Free space path loss at 1 m on channel 5 in dB
+NOISE_FLOOR = -105. # First path power in dBm with receive quality 1
+
+MODES = {
+    "standard": C.MODE_STANDARD,
+    "medium": [C.TRX_RATE_850KBPS, C.TX_PULSE_FREQ_64MHZ, C.PAC_SIZE_16, C.TX_PREAMBLE_LEN_256, C.CHANNEL_5, C.PREAMBLE_CODE_64MHZ_9],
+    "fast": [C.TRX_RATE_6800KBPS, C.TX_PULSE_FREQ_64MHZ, C.PAC_SIZE_8, C.TX_PREAMBLE_LEN_128, C.CHANNEL_5, C.PREAMBLE_CODE_64MHZ_9]
+}
+
+IDLE = 0
+RX = 1
+TX = 2
+
+PMSC_STATE = {IDLE: C.PMSC_STATE_IDLE, RX: C.PMSC_STATE_RX, TX: C.PMSC_STATE_TX}
+
+STATUS_TX_DONE = 1 << C.TXFRB_BIT | 1 << C.TXPRS_BIT | 1 << C.TXPHS_BIT | 1 << C.TXFRS_BIT
+STATUS_READ_ONLY = 1 << C.HSRBP_BIT | 1 << C.ICRBP_BIT
+
+def frameTiming(txfctrl):
+    """
+    Air time of a frame.
+
+    Args:
+        txfctrl: Contents of TX_FCTRL
+
+    Returns:
+        (tuple): Duration of preamble and SFD (up to the RMARKER) and duration of PHR and data in seconds
+    """
+    length = txfctrl[0] | (txfctrl[1] & 0x03) << 8
+    rate = (txfctrl[1] >> 5) & 0x03
+    prf = txfctrl[2] & 0x03
+    preamble = PREAMBLE_SYMBOLS.get((txfctrl[2] >> 2) & 0x0F, 128)
+    bits = length * 8
+    bits += 48 * math.ceil(bits / 330.) # Reed-Solomon parity
+    sync = (preamble + SFD_SYMBOLS[rate]) * SYMBOL_TIME[prf]
+    phr = PHR_BITS * BIT_TIME[C.TRX_RATE_110KBPS if rate == C.TRX_RATE_110KBPS else C.TRX_RATE_850KBPS]
+    return sync, phr + bits * BIT_TIME[rate]
+
+def destination(frame):
+    """
+    Destination short address of a data frame.
+
+    Args:
+        frame: Frame without CRC
+
+    Returns:
+        (bytes): Destination PAN and short address, None for other frames
+    """
+    if len(frame) < 7 or frame[0] & 0x07 != MAC.FT_DATA or (frame[1] >> 2) & 0x03 != MAC.AD_SAD:
+        return None
+    return bytes(frame[3:7])
+
+class Trajectory():
+    """
+    Position on a circle, a radius of 0 is a fixed position.
+
+    Args:
+        center: Center of the circle
+        radius: Radius in meter
+        phase: Angle at time 0 in rad
+        omega: Angular speed in rad/s
+    """
+    def __init__(self, center, radius=0., phase=0., omega=0.):
+        self.center = center
+        self.radius = radius
+        self.phase = phase
+        self.omega = omega
+
+    def __call__(self, t):
+        if self.radius == 0.:
+            return self.center
+        angle = self.phase + self.omega * t
+        return [self.center[0] + self.radius * math.cos(angle), self.center[1] + self.radius * math.sin(angle), self.center[2]]
+
+class Link():
+    """
+    Propagation conditions between two devices, the same in both directions.
+
+    Attributes:
+        nlos: Non line of sight link
+        excess: Excess path length of the first path in meter
+        fp_loss: First path power below the receive power in dB
+    """
+    def __init__(self, rng, nlos, excess, fp_loss):
+        self.nlos = rng.random() < nlos
+        self.excess = rng.expovariate(1. / excess) if self.nlos else 0.
+        self.fp_loss = fp_loss + rng.uniform(-2., 2.) if self.nlos else rng.uniform(0., 3.)
+
+class Transmission():
+    """
+    Frame on air, times are at the antenna of the transmitter.
+
+    Attributes:
+        source: Transmitting device
+        frame: Frame without CRC
+        start: Start of the preamble
+        rmarker: Time of the ranging marker (start of the PHR)
+        end: End of the frame
+        rate: Data rate identifier
+        lock: Latest time a receiver can start listening and still synchronize
+        aborted: The transmission was aborted by the host
+    """
+    def __init__(self, source, frame, start, rmarker, end, rate, lock):
+        self.source = source
+        self.frame = frame
+        self.start = start
+        self.rmarker = rmarker
+        self.end = end
+        self.rate = rate
+        self.lock = lock
+        self.aborted = False
+
+class Arrival():
+    """
+    Transmission as seen by one receiver, times are at the antenna of the receiver.
+
+    Attributes:
+        tx: Transmission
+        start, rmarker, end, lock: Times as in Transmission
+        power: Receive power in dBm
+        fp_power: First path power in dBm
+        lost: Not detected by the receiver (path loss, packet errors)
+        corrupted: Destroyed by an interfering frame
+    """
+    def __init__(self, tx, delay, power, fp_power, lost):
+        self.tx = tx
+        self.start = tx.start + delay
+        self.rmarker = tx.rmarker + delay
+        self.end = tx.end + delay
+        self.lock = tx.lock + delay
+        self.power = power
+        self.fp_power = fp_power
+        self.lost = lost
+        self.corrupted = False
+
+class Medium():
+    """
+    Shared radio channel.
+
+    Args:
+        sim: Simulator
+
+    Attributes:
+        devices: Attached devices
+        links: Link per pair of devices
+        transmissions: Number of transmitted frames
+        airtime: Sum of the frame durations in seconds
+        busy: Time with at least one frame on air in seconds
+        busy_until: End of the last frame on air
+    """
+    def __init__(self, sim):
+        self.sim = sim
+        self.devices = []
+        self.links = {}
+        self.transmissions = 0
+        self.airtime = 0.
+        self.busy = 0.
+        self.busy_until = 0.
+
+    def link(self, a, b):
+        key = (id(a), id(b)) if id(a) < id(b) else (id(b), id(a))
+        link = self.links.get(key)
+        if link is None:
+            link = self.links[key] = Link(self.sim.rng, self.sim.nlos, self.sim.nlos_excess, self.sim.nlos_fp_loss)
+        return link
+
+    def transmit(self, tx):
+        """
+        Put a frame on air and schedule its arrivals at all devices in range.
+
+        Args:
+            tx: Transmission
+        """
+        sim = self.sim
+        self.transmissions += 1
+        self.airtime += tx.end - tx.start
+        self.busy += max(0., tx.end - max(tx.start, self.busy_until))
+        self.busy_until = max(self.busy_until, tx.end)
+
+        position = tx.source.position(tx.start)
+        sensitivity = SENSITIVITY[tx.rate]
+        for device in self.devices:
+            if device is tx.source:
+                continue
+            distance = max(0.1, math.dist(position, device.position(tx.start)))
+            link = self.link(tx.source, device)
+            power = TX_POWER - PATH_LOSS_1M - 10. * sim.path_loss_exponent * math.log10(distance)
+            if link.nlos:
+                power -= sim.nlos_loss
+            if power < sensitivity - 20.:
+                continue # Neither received nor relevant as interference
+            detection = (1. - sim.per) / (1. + math.exp(sensitivity - power))
+            arrival = Arrival(tx, (distance + link.excess) / SPEED_OF_LIGHT, power, power - link.fp_loss, sim.rng.random() > detection)
+            sim.schedule(arrival.start, device.arrivalStart, arrival)
+            sim.schedule(arrival.end, device.arrivalEnd, arrival)
+
+class SimDW1000(DW1000):
+    """
+    Emulated DW1000.
+
+    Replaces the SPI transfers by accesses to a register file and the radio by the
+    simulated channel. Only the behaviour used by the nodes is emulated.
+
+    Args:
+        sim: Simulator
+        position: Function of the simulation time returning the antenna position
+        clock_ppm: Frequency error of the clock in ppm
+        antenna_delay: True antenna delay (each direction) in device time units
+
+    Attributes:
+        memory: Register file, register address to contents
+        status: SYS_STATUS as integer
+        state: IDLE, RX or TX
+        tx: Own transmission on air
+        locked: Arrival the receiver is synchronized to
+        arrivals: Frames currently arriving at the antenna
+        wait4resp: Enable the receiver after the current transmission
+        generation: Incremented on every receiver or transmitter state change, invalidates scheduled timeouts
+        listen: Time from which the enabled receiver listens
+        node: Node using the device
+        step_due: A step of the node is scheduled
+        stepping: A step of the node is running or waiting
+        rewake: A step became due while stepping
+        host_time: Host time of the running step
+        thread: Thread running the steps of the node
+        baton: Released to let the thread run
+    """
+    def __init__(self, sim, position, clock_ppm=0., antenna_delay=C.ANTENNA_DELAY_RASPI):
+        super().__init__(None, None, None)
+        self.sim = sim
+        self.position = position
+        self.clock_ppm = clock_ppm
+        self.clock_offset = sim.rng.randrange(0, C.TIME_OVERFLOW)
+        self.antenna_delay = antenna_delay
+
+        self.memory = {C.DEV_ID: bytearray(b"\x30\x01\xca\xde")}
+        self.status = 0
+        self.state = IDLE
+        self.tx = None
+        self.locked = None
+        self.arrivals = []
+        self.wait4resp = False
+        self.generation = 0
+        self.listen = 0.
+
+        self.node = None
+        self.step_due = False
+        self.stepping = False
+        self.rewake = False
+        self.host_time = 0.
+        self.thread = None
+        self.baton = Semaphore(0)
+
+    def begin(self):
+        """ Same register configuration as DW1000.begin() without the host GPIO and SPI setup """
+        self.enableClock(C.AUTO_CLOCK)
+        self.softReset()
+        self.syscfg.clear()
+        self.syscfg.setBits((C.HIRQ_POL_BIT, C.DIS_DRXB_BIT), True)
+        self.writeRegister(self.syscfg)
+        self.enableLeds()
+        self.sysmask.clear()
+        self.writeRegister(self.sysmask)
+        self.enableClock(C.XTI_CLOCK)
+        self.manageLDE()
+        self.enableClock(C.AUTO_CLOCK)
+
+    def stop(self):
+        self.transceiverOff()
+
+    def hardReset(self):
+        pass
+
+    def disableInterrupt(self):
+        pass
+
+    def enableInterrupt(self):
+        pass
+
+    def localTime(self, t):
+        """
+        Device time at a simulation time.
+
+        Args:
+            t: Simulation time in seconds
+
+        Returns:
+            (float): Device time in device time units, not wrapped
+        """
+        return self.clock_offset + t * (1. + self.clock_ppm * 1e-6) / TICK
+
+    def register(self, address, size):
+        memory = self.memory.get(address)
+        if memory is None:
+            memory = self.memory[address] = bytearray(size)
+        elif len(memory) < size:
+            memory.extend(bytes(size - len(memory)))
+        return memory
+
+    def getValue(self, address, offset, n):
+        return int.from_bytes(self.register(address, offset + n)[offset:offset + n], "little")
+
+    def setValue(self, address, offset, n, value):
+        self.register(address, offset + n)[offset:offset + n] = (int(value) % (1 << (8 * n))).to_bytes(n, "little")
+
+    def readBytes(self, cmd, offset, data, n):
+        headerLen = 1 if offset == C.NO_SUB else 2
+        offset = 0 if offset == C.NO_SUB else offset
+        self.sim.access(self, headerLen + n, cmd == C.SYS_STATUS)
+
+        if cmd == C.SYS_STATUS:
+            contents = self.status.to_bytes(8, "little")
+        elif cmd == C.SYS_STATE:
+            contents = bytes([0, 0, PMSC_STATE[self.state], 0, 0])
+        elif cmd == C.SYS_TIME:
+            contents = (int(self.localTime(self.sim.hostTime(self))) % C.TIME_OVERFLOW & ~0x1FF).to_bytes(5, "little")
+        else:
+            contents = self.register(cmd, offset + n)
+        data[0:n] = contents[offset:offset + n]
+
+        self.spiBytesRead += n
+
+    def writeBytes(self, cmd, offset, data, dataSize):
+        headerLen = 1 if offset == C.NO_SUB else 2
+        offset = 0 if offset == C.NO_SUB else offset
+        value = bytes(b for b in data[0:dataSize] if b is not None)
+        self.sim.access(self, headerLen + len(value), False)
+
+        if cmd == C.SYS_STATUS:
+            # Write one to clear
+            self.status &= ~((int.from_bytes(value, "little") << (8 * offset)) & ~STATUS_READ_ONLY)
+        elif cmd == C.SYS_CTRL:
+            self.control(int.from_bytes(value, "little") << (8 * offset))
+        else:
+            self.register(cmd, offset + len(value))[offset:offset + len(value)] = value
+            if cmd == C.PMSC and offset == C.PMSC_CTRL0_SUB + 3 and value[0] == C.SOFT_RESET_RX:
+                self.receiverOff()
+
+        self.spiBytesWritten += dataSize
+
+    def control(self, bits):
+        """
+        Execute a SYS_CTRL write.
+
+        Args:
+            bits: Written value
+        """
+        if bits & 1 << C.TRXOFF_BIT:
+            self.transceiverOff()
+        if bits & 1 << C.TXSTRT_BIT:
+            self.transmit(bool(bits & 1 << C.WAIT4RESP_BIT), bool(bits & 1 << C.TXDLYS_BIT))
+        if bits & 1 << C.RXENAB_BIT:
+            self.receiverOn()
+        if bits & 1 << C.HRBPT_BIT:
+            self.status ^= 1 << C.HSRBP_BIT
+
+    def setStatus(self, bits):
+        self.status |= bits
+        self.sim.wake(self)
+
+    def transmit(self, wait4resp, delayed):
+        """
+        Start a transmission of TX_BUFFER.
+
+        Args:
+            wait4resp: Enable the receiver after the transmission
+            delayed: Transmit at DX_TIME
+        """
+        if self.state == TX:
+            return
+        txfctrl = self.register(C.TX_FCTRL, 5)
+        length = txfctrl[0] | (txfctrl[1] & 0x03) << 8
+        frame = bytes(self.register(C.TX_BUFFER, length)[0:max(0, length - 2)])
+
+        rmarker = None
+        if delayed:
+            # The transmit time is DX_TIME, a time in the past wraps around (~17 s)
+            dx = self.getValue(C.DX_TIME, 0, 5) & ~0x1FF
+            now = self.sim.hostTime(self)
+            wait = (dx - self.localTime(now)) % C.TIME_OVERFLOW * TICK / (1. + self.clock_ppm * 1e-6)
+            if wait > C.TIME_OVERFLOW * TICK / 2:
+                self.status |= 1 << C.HPDWARN_BIT
+            rmarker = now + wait
+        self.startTransmission(frame, txfctrl, wait4resp, rmarker)
+
+    def startTransmission(self, frame, txfctrl, wait4resp, rmarker=None):
+        """
+        Put a frame on air.
+
+        Args:
+            frame: Frame without CRC
+            txfctrl: Contents of TX_FCTRL
+            wait4resp: Enable the receiver after the transmission
+            rmarker: Time of the ranging marker, None to transmit now
+        """
+        self.locked = None
+        self.generation += 1
+        sync, data = frameTiming(txfctrl)
+        if rmarker is None:
+            rmarker = self.sim.hostTime(self) + TX_STARTUP + sync
+        timestamp = self.localTime(rmarker)
+        self.setValue(C.TX_TIME, 0, 5, round(timestamp) + self.getValue(C.TX_ANTD, 0, 2))
+        self.setValue(C.TX_TIME, 5, 5, round(timestamp))
+
+        # Times on air are delayed by the true antenna delay
+        delay = self.antenna_delay * TICK
+        rate = (txfctrl[1] >> 5) & 0x03
+        symbol = SYMBOL_TIME[txfctrl[2] & 0x03]
+        tx = Transmission(self, frame, rmarker - sync + delay, rmarker + delay, rmarker + data + delay, rate,
+                          rmarker - (SFD_SYMBOLS[rate] + SYNC_SYMBOLS) * symbol + delay)
+        self.state = TX
+        self.tx = tx
+        self.wait4resp = wait4resp
+        self.sim.schedule(max(self.sim.now, tx.start), self.sim.medium.transmit, tx)
+        self.sim.schedule(tx.end, self.transmitDone, tx)
+
+    def transmitDone(self, tx):
+        if tx is not self.tx:
+            return
+        self.tx = None
+        self.state = IDLE
+        self.setStatus(STATUS_TX_DONE)
+        if self.wait4resp:
+            self.receiverOn()
+
+    def autoAck(self, sequence, generation):
+        """ Send the automatic acknowledgement of a received frame """
+        if generation != self.generation:
+            return
+        self.state = IDLE
+        # Frame control of an acknowledgement frame and the sequence number of the acknowledged frame
+        txfctrl = self.register(C.TX_FCTRL, 5)
+        self.startTransmission(bytes([MAC.FT_ACK, 0x00, sequence]), bytes([5, txfctrl[1] & ~0x03]) + txfctrl[2:5], False)
+
+    def transceiverOff(self):
+        if self.tx is not None:
+            self.tx.aborted = True
+            self.tx = None
+        self.state = IDLE
+        self.locked = None
+        self.generation += 1
+
+    def receiverOff(self):
+        if self.state == RX:
+            self.transceiverOff()
+
+    def receiverOn(self):
+        """ Enable the receiver, arms the frame wait timeout and synchronizes to a preamble on air """
+        if self.state != IDLE:
+            return
+        self.state = RX
+        self.generation += 1
+        self.listen = self.sim.hostTime(self)
+        syscfg = self.getValue(C.SYS_CFG, 0, 4)
+        fwto = self.getValue(C.RX_FWTO, 0, 2)
+        if syscfg & 1 << C.RXWTOE_BIT and fwto:
+            self.sim.schedule(self.listen + fwto * FWTO_UNIT, self.frameWaitTimeout, self.generation)
+
+        candidates = [a for a in self.arrivals if not a.lost and a.lock >= self.listen]
+        if candidates:
+            self.lock(max(candidates, key=lambda a: a.power))
+
+    def frameWaitTimeout(self, generation):
+        if generation != self.generation or self.state != RX:
+            return
+        if self.locked is not None:
+            # Timeout during a reception, check again when it is complete
+            self.sim.schedule(self.locked.end + 1e-9, self.frameWaitTimeout, generation)
+            return
+        self.state = IDLE
+        self.generation += 1
+        self.setStatus(1 << C.RXRFTO_BIT)
+
+    def lock(self, arrival):
+        self.locked = arrival
+        for other in self.arrivals:
+            if other is not arrival and other.power > arrival.power - self.sim.capture:
+                arrival.corrupted = True
+
+    def arrivalStart(self, arrival):
+        self.arrivals.append(arrival)
+        if self.locked is not None:
+            if arrival.power > self.locked.power - self.sim.capture:
+                self.locked.corrupted = True
+        elif self.state == RX and not arrival.lost and arrival.lock >= self.listen:
+            self.lock(arrival)
+
+    def arrivalEnd(self, arrival):
+        self.arrivals.remove(arrival)
+        frame = arrival.tx.frame
+        addressed = destination(frame) == bytes(self.register(C.PANADR, 4)[2:4] + self.register(C.PANADR, 4)[0:2])
+        if arrival is not self.locked:
+            if addressed:
+                if arrival.lost:
+                    self.sim.lost += 1
+                else:
+                    self.sim.missed += 1
+            return
+        self.locked = None
+
+        syscfg = self.getValue(C.SYS_CFG, 0, 4)
+        if arrival.corrupted or arrival.tx.aborted:
+            self.sim.collisions += 1
+            self.receiveError(1 << C.RXFCE_BIT, syscfg)
+            return
+        if not self.accept(frame, syscfg):
+            # Rejected frames always re-enable the receiver
+            self.sim.rejected += 1
+            self.setStatus(1 << C.AFFREJ_BIT)
+            return
+        self.receive(arrival)
+
+        if syscfg & 1 << C.AUTOACK_BIT and frame[0] & 0x07 == MAC.FT_DATA and frame[0] & 1 << 5:
+            self.state = TX
+            ackTim = self.register(C.ACK_RESP_T, 4)[3]
+            symbol = SYMBOL_TIME[self.register(C.TX_FCTRL, 5)[2] & 0x03]
+            self.sim.schedule(self.sim.now + ACK_TURNAROUND + ackTim * symbol, self.autoAck, frame[2], self.generation)
+            self.setStatus(1 << C.AAT_BIT)
+
+    def receiveError(self, bits, syscfg):
+        if not syscfg & 1 << C.RXAUTR_BIT:
+            self.state = IDLE
+            self.generation += 1
+        self.setStatus(bits)
+
+    def accept(self, frame, syscfg):
+        """
+        Frame filtering.
+
+        Args:
+            frame: Frame without CRC
+            syscfg: SYS_CFG as integer
+
+        Returns:
+            (bool): Frame passes the filter
+        """
+        if not syscfg & 1 << C.FFEN_BIT:
+            return True
+        frameType = frame[0] & 0x07
+        if frameType == MAC.FT_ACK:
+            return bool(syscfg & 1 << C.FFAA_BIT)
+        if frameType != MAC.FT_DATA or not syscfg & 1 << C.FFAD_BIT:
+            return False
+        panadr = self.register(C.PANADR, 4)
+        address = destination(frame)
+        return address is not None and address[0:2] in (panadr[2:4], b"\xff\xff") and address[2:4] in (panadr[0:2], b"\xff\xff")
+
+    def receive(self, arrival):
+        """
+        Store a good frame in the receive registers.
+
+        The diagnostics are synthesized to decode to the arrival powers with
+        DW1000Diagnostics and the timestamp is biased such that correctTimestamp()
+        removes the bias again.
+
+        Args:
+            arrival: Received frame
+        """
+        self.state = IDLE
+        self.generation += 1
+        frame = arrival.tx.frame
+        length = len(frame) + 2
+        self.register(C.RX_BUFFER, length)[0:length] = frame + b"\x00\x00"
+
+        prf = self.operationMode[C.PULSE_FREQUENCY_BIT]
+        A, corrFac = (C.A_16MHZ, C.CORRFAC_16MHZ) if prf == C.TX_PULSE_FREQ_16MHZ else (C.A_64MHZ, C.CORRFAC_64MHZ)
+        def uncorrected(power):
+            return power if power <= -C.PWR_COEFF else (power + C.PWR_COEFF * corrFac) / (1. + corrFac)
+        preambleCount = min(0xFFF, int(0.95 * PREAMBLE_SYMBOLS.get(self.operationMode[C.PREAMBLE_LENGTH_BIT], 128)))
+        N2 = float(preambleCount * preambleCount)
+        cirPower = min(0xFFFF, max(1, round(N2 * 10 ** ((uncorrected(arrival.power) + A) / 10.) / C.TWOPOWER17)))
+        fpAmpl = min(0xFFFF, max(1, round(math.sqrt(N2 * 10 ** ((uncorrected(arrival.fp_power) + A) / 10.) / 3.))))
+        noise = min(0xFFFF, max(1, round(fpAmpl / 10 ** ((arrival.fp_power - NOISE_FLOOR) / 20.))))
+
+        self.setValue(C.RX_FINFO, 0, 4, length | preambleCount << 20)
+        self.setValue(C.RX_FQUAL, 0, 8, noise | fpAmpl << 16 | fpAmpl << 32 | cirPower << 48)
+        self.setValue(C.RX_TIME, 7, 2, fpAmpl)
+        rxPower = DW1000Diagnostics(self.register(C.RX_FINFO, 4), self.register(C.RX_FQUAL, 8), self.register(C.RX_TIME, 14), prf).rxPower
+
+        raw = self.localTime(arrival.rmarker + self.antenna_delay * TICK)
+        timestamp = raw - self.getValue(C.LDE_CTRL, C.LDE_RXANTD_SUB, 2) - self.correctTimestamp(0., rxPower)
+        timestamp += self.sim.rng.gauss(0., self.sim.timestamp_std)
+        self.setValue(C.RX_TIME, 0, 5, round(timestamp))
+        self.setValue(C.RX_TIME, 9, 5, round(raw))
+
+        # Receiver time tracking of the frequency offset of the transmitter clock
+        interval = C.RXTTCKI_16MHZ if prf == C.TX_PULSE_FREQ_16MHZ else C.RXTTCKI_64MHZ
+        offset = (1. + arrival.tx.source.clock_ppm * 1e-6) / (1. + self.clock_ppm * 1e-6) - 1.
+        self.setValue(C.RX_TTCKI, 0, 4, interval)
+        self.setValue(C.RX_TTCKO, 0, 3, round(offset * interval) & C.RXTOFS_MASK)
+
+        self.setStatus(C.SYS_STATUS_ALL_RX_GOOD)
+
+class SimTag(Tag):
+    """
+    Tag recording its fixes and ranges against the true position.
+
+    Args:
+        sim: Simulator
+        truth: Function of the simulation time returning the true position
+        config (configuration.Config): Configuration, see Node
+
+    Attributes:
+        position_errors: Errors of the round solutions in meter
+        tracker_errors: Errors of the tracker positions in meter
+        range_errors: Errors of the valid ranges in meter
+    """
+    def __init__(self, sim, truth, config=None):
+        super().__init__(config)
+        self.sim = sim
+        self.truth = truth
+        self.position_errors = []
+        self.tracker_errors = []
+        self.range_errors = []
+        # Synchronously, a background load would make runs depend on the host timing
+        self.loadSolver()
+
+    def publishFix(self, position, source):
+        super().publishFix(position, source)
+        error = math.dist(position, self.truth(self.sim.now))
+        (self.position_errors if source == "P" else self.tracker_errors).append(error)
+
+    def updateTracker(self, range_):
+        self.range_errors.append(range_ - math.dist(self.truth(self.sim.now), self.anchor_positions[self.anchor_idx]))
+        super().updateTracker(range_)
+
+class StopSimulation(Exception):
+    """ Ends the thread of a node waiting inside its step when the simulator is closed """
+
+class Simulator():
+    """
+    Discrete-event simulator running nodes on emulated DW1000s.
+
+    Args:
+        seed: Random seed
+        mode: Operation mode from DW1000Constants
+        clock_ppm: Maximum clock frequency error in ppm, drawn uniformly per device
+        antenna_delay_std: Standard deviation of the true antenna delays from the configured value in meter
+        timestamp_std: Standard deviation of the receive timestamp noise in meter
+        per: Packet error rate above the sensitivity
+        path_loss_exponent: Path loss exponent
+        nlos: Probability of a link to be NLOS
+        nlos_excess: Mean excess path length of NLOS links in meter
+        nlos_loss: Additional attenuation of NLOS links in dB
+        nlos_fp_loss: First path power below the receive power of NLOS links in dB
+        capture: Power margin in dB above which a frame survives an interfering frame
+        poll_latency: Mean host reaction time to a status change in seconds, varies by +-50 %
+        spi_byte_time: Host time per transferred SPI byte in seconds
+        tick: Interval of the inactivity checks of idle nodes in seconds
+        power_on: The nodes are switched on at random times within this many seconds
+
+    Attributes:
+        now: Simulation time in seconds
+        events: Event heap of (time, sequence, function, arguments)
+        medium: Radio channel
+        nodes: Simulated nodes
+        collisions: Receptions destroyed by interference
+        lost: Frames addressed to a device that were not detected
+        missed: Frames addressed to a device that was not listening
+        rejected: Frames dropped by frame filtering
+    """
+    def __init__(self, seed=None, mode=C.MODE_STANDARD, clock_ppm=2., antenna_delay_std=0.02, timestamp_std=0.03, per=0.01,
+                 path_loss_exponent=2., nlos=0., nlos_excess=0.3, nlos_loss=5., nlos_fp_loss=10., capture=6.,
+                 poll_latency=100e-6, spi_byte_time=8e-6, tick=0.05, power_on=0.1):
+        self.rng = random.Random(seed)
+        self.mode = mode
+        self.clock_ppm = clock_ppm
+        self.antenna_delay_std = antenna_delay_std / C.DISTANCE_OF_RADIO
+        self.timestamp_std = timestamp_std / C.DISTANCE_OF_RADIO
+        self.per = per
+        self.path_loss_exponent = path_loss_exponent
+        self.nlos = nlos
+        self.nlos_excess = nlos_excess
+        self.nlos_loss = nlos_loss
+        self.nlos_fp_loss = nlos_fp_loss
+        self.capture = capture
+        self.poll_latency = poll_latency
+        self.spi_byte_time = spi_byte_time
+        self.tick = tick
+        self.power_on = power_on
+
+        self.now = 0.
+        self.events = []
+        self.sequence = 0
+        self.medium = Medium(self)
+        self.nodes = []
+
+        self.collisions = 0
+        self.lost = 0
+        self.missed = 0
+        self.rejected = 0
+
+        self.baton = Semaphore(0)
+        self.error = None
+        self.closed = False
+
+    def clock(self):
+        return self.now
+
+    def schedule(self, t, function, *args):
+        self.sequence += 1
+        heapq.heappush(self.events, (t, self.sequence, function, args))
+
+    def addNode(self, node, eid, position):
+        """
+        Attach a node with an emulated DW1000, it is set up at a random power on time.
+
+        Args:
+            node: Tag or Anchor
+            eid: Extended unique identifier
+            position: Function of the simulation time returning the antenna position
+        """
+        device = SimDW1000(self, position, self.rng.uniform(-self.clock_ppm, self.clock_ppm),
+                           node.config.antenna_delay + self.rng.gauss(0., self.antenna_delay_std))
+        node.dw1000 = device
+        node.eid = eid
+        node.mode = self.mode
+        node.clock = self.clock
+        device.node = node
+        self.nodes.append(node)
+        self.medium.devices.append(device)
+        self.schedule(self.now + self.rng.uniform(0., self.power_on), self.powerOn, device)
+
+    def powerOn(self, device):
+        """ Set up a node and start its main loop """
+        node = device.node
+        node.setup()
+        node.start()
+        self.schedule(self.now + self.rng.uniform(0., self.tick), self.tickNode, device)
+
+    def hostTime(self, device):
+        """ Host time of a device, ahead of now during a step of its node """
+        return max(device.host_time, self.now) if device.stepping else self.now
+
+    def wake(self, device):
+        """ Schedule a step of the node of a device after the polling latency """
+        if device.node is not None and not device.step_due:
+            device.step_due = True
+            self.schedule(self.hostTime(device) + self.poll_latency * self.rng.uniform(0.5, 1.5), self.step, device)
+
+    def tickNode(self, device):
+        self.wake(device)
+        self.schedule(self.now + self.tick, self.tickNode, device)
+
+    def step(self, device):
+        """ Run one main loop iteration of a node """
+        if device.stepping:
+            # Due while its step waits, runs again afterwards
+            device.rewake = True
+            return
+        device.step_due = False
+        device.stepping = True
+        device.host_time = self.now
+        if device.thread is None:
+            device.thread = Thread(target=self.nodeFunc, args=(device,), daemon=True)
+            device.thread.start()
+        self.switch(device)
+
+    def switch(self, device):
+        """ Let the thread of a node run until its step ends or waits for other nodes """
+        device.baton.release()
+        self.baton.acquire()
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def nodeFunc(self, device):
+        """ Thread running the steps of a node """
+        while True:
+            device.baton.acquire()
+            if self.closed:
+                return
+            try:
+                device.node.step()
+            except StopSimulation:
+                return
+            except BaseException as e:
+                self.error = e
+            device.stepping = False
+            if device.rewake:
+                device.rewake = False
+                device.step_due = False
+                self.wake(device)
+            self.baton.release()
+
+    def access(self, device, n, sync):
+        """
+        Account the host time of a register access, called from the thread of the node.
+
+        Args:
+            device: Accessed device
+            n: Number of transferred bytes
+            sync: Run the simulation up to the host time
+        """
+        if current_thread() is not device.thread:
+            # Setup or emulation internal access
+            return
+        device.host_time = max(device.host_time, self.now) + n * self.spi_byte_time
+        if sync:
+            while self.events and self.events[0][0] <= device.host_time:
+                if self.events[0][2] in (self.step, self.switch):
+                    if self.events[0][0] == device.host_time:
+                        # Concurrent with the other node
+                        break
+                    # Another node acts first, continue at the host time
+                    self.schedule(device.host_time, self.switch, device)
+                    self.baton.release()
+                    device.baton.acquire()
+                    if self.closed:
+                        raise StopSimulation()
+                    continue
+                t, _, function, args = heapq.heappop(self.events)
+                self.now = max(self.now, t)
+                function(*args)
+            self.now = max(self.now, device.host_time)
+
+    def run(self, duration):
+        """
+        Run the simulation.
+
+        Args:
+            duration: Simulated time in seconds
+        """
+        until = self.now + duration
+        while self.events and self.events[0][0] <= until:
+            t, _, function, args = heapq.heappop(self.events)
+            self.now = max(self.now, t)
+            function(*args)
+        self.now = max(self.now, until)
+
+    def close(self):
+        """ End the threads of the nodes """
+        self.closed = True
+        for device in self.medium.devices:
+            if device.thread is not None:
+                device.baton.release()
+                device.thread.join()
+
+def simulate(tags, anchors, duration, area=10., speed=0., seed=None, **kwargs):
+    """
+    Simulate a network with anchors on a circle and tags inside.
+
+    Args:
+        tags: Number of tags
+        anchors: Number of anchors
+        duration: Simulated time in seconds
+        area: Diameter of the anchor circle in meter
+        speed: Speed of the tags in m/s, tags move on circles around the center
+        seed: Random seed
+        kwargs: Further arguments of Simulator
+
+    Returns:
+        (dict): Results
+    """
+    sim = Simulator(seed, **kwargs)
+    # The tags draw their poll backoff from the module random generator
+    random.seed(seed)
+    center = [area / 2, area / 2, 0.]
+    # One configuration shared by all nodes, the process wide config module is not changed
+    settings = configuration.fromModule(
+        anchor_list=[bytes([0x0a + i, 0x3b]) for i in range(0, anchors)],
+        anchor_positions=[[center[0] + area / 2 * math.cos(2 * math.pi * i / anchors),
+                           center[1] + area / 2 * math.sin(2 * math.pi * i / anchors), 0.] for i in range(0, anchors)])
+    for i in range(0, anchors):
+        sim.addNode(Anchor(settings), "7D:00:22:EA:82:60:3B:{:02X}".format(0x0a + i), Trajectory(settings.anchor_positions[i]))
+    for i in range(0, tags):
+        radius = sim.rng.uniform(0.05, 0.35) * area
+        trajectory = Trajectory(center, radius, sim.rng.uniform(0., 2 * math.pi), speed / radius)
+        sim.addNode(SimTag(sim, trajectory, settings), "7D:00:22:EA:82:60:{:02X}:{:02X}".format(0x40 + (i >> 8), i & 0xFF), trajectory)
+
+    start = time.perf_counter()
+    try:
+        sim.run(duration)
+    finally:
+        sim.close()
+    wall = time.perf_counter() - start
+
+    tags = [node for node in sim.nodes if isinstance(node, SimTag)]
+    position_errors = np.concatenate([t.position_errors for t in tags] + [[]])
+    range_errors = np.concatenate([t.range_errors for t in tags] + [[]])
+    polls = sum(t.send for t in tags)
+    return {
+        "tags": len(tags),
+        "anchors": anchors,
+        "duration": duration,
+        "wall": wall,
+        "speedup": duration / wall,
+        "fix_rate": len(position_errors) / duration / len(tags),
+        "tracker_rate": sum(len(t.tracker_errors) for t in tags) / duration / len(tags),
+        "position_error_mean": float(np.mean(position_errors)) if len(position_errors) else math.nan,
+        "position_error_p95": float(np.percentile(position_errors, 95)) if len(position_errors) else math.nan,
+        "range_bias": float(np.mean(range_errors)) if len(range_errors) else math.nan,
+        "range_std": float(np.std(range_errors)) if len(range_errors) else math.nan,
+        "range_rate": len(range_errors) / duration / len(tags),
+        "retry_rate": sum(sum(t.anchor_retries) for t in tags) / duration / len(tags),
+        "ack_ratio": sum(t.acked for t in tags) / polls if polls else 0.,
+        "first_range": max((t.time_first_range for t in tags if t.time_first_range is not None), default=math.nan),
+        "rx_errors": sum(n.rx_errors for n in sim.nodes),
+        "resets": sum(sum(n.recovery.counts) for n in sim.nodes),
+        "escalations": sum(n.recovery.escalations for n in sim.nodes),
+        "recover_max": max(n.recovery.time_max for n in sim.nodes),
+        "utilization": sim.medium.busy / duration,
+        "offered_load": sim.medium.airtime / duration,
+        "frames": sim.medium.transmissions,
+        "collisions": sim.collisions,
+        "lost": sim.lost,
+        "missed": sim.missed,
+        "rejected": sim.rejected
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="UWB network simulator")
+    parser.add_argument("--tags", default="1,2,4", help="Comma separated numbers of tags")
+    parser.add_argument("--anchors", default="4", help="Comma separated numbers of anchors")
+    parser.add_argument("--duration", type=float, default=10., help="Simulated time per scenario in seconds")
+    parser.add_argument("--mode", choices=sorted(MODES), default="standard", help="Operation mode")
+    parser.add_argument("--area", type=float, default=10., help="Diameter of the anchor circle in meter")
+    parser.add_argument("--speed", type=float, default=0., help="Tag speed in m/s")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed")
+    parser.add_argument("--ppm", type=float, default=2., help="Maximum clock frequency error in ppm")
+    parser.add_argument("--antenna-delay-std", type=float, default=0.02, help="Antenna delay deviation in meter")
+    parser.add_argument("--timestamp-std", type=float, default=0.03, help="Timestamp noise in meter")
+    parser.add_argument("--per", type=float, default=0.01, help="Packet error rate")
+    parser.add_argument("--nlos", type=float, default=0., help="Probability of NLOS links")
+    parser.add_argument("--spi-byte-time", type=float, default=8e-6, help="Host time per SPI byte in seconds")
+    parser.add_argument("--poll-latency", type=float, default=100e-6, help="Host reaction time in seconds")
+    parser.add_argument("--burst", type=int, default=config.burst_length, help="Polls per anchor and round, see config.burst_length")
+    parser.add_argument("--poll-backoff", type=int, default=config.poll_backoff, help="Maximum random delay of retried polls in microseconds, see config.poll_backoff")
+    parser.add_argument("--verbose", action="store_true", help="Show the node logging")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.CRITICAL)
+    config.webui_enable = False
+    config.uplink_enable = False
+    config.profiling_enable = False
+    config.snapshot_enable = False
+    config.logfile = os.devnull
+    config.burst_length = args.burst
+    config.poll_backoff = args.poll_backoff
+
+    print("tags anchors speedup  fixes/s  trk/s  pos err  p95    range bias   std  retries/s  ack %  util %  load %  coll  lost  miss  rej  rxerr  first s  resets  esc  recover")
+    for anchors in [int(i) for i in args.anchors.split(",")]:
+        for tags in [int(i) for i in args.tags.split(",")]:
+            r = simulate(tags, anchors, args.duration, args.area, args.speed, args.seed, mode=MODES[args.mode],
+                         clock_ppm=args.ppm, antenna_delay_std=args.antenna_delay_std, timestamp_std=args.timestamp_std,
+                         per=args.per, nlos=args.nlos, poll_latency=args.poll_latency, spi_byte_time=args.spi_byte_time)
+            print("{tags:4} {anchors:7} {speedup:6.1f}x {fix_rate:8.2f} {tracker_rate:6.1f} {position_error_mean:7.3f} {position_error_p95:6.3f} "
+                  "{range_bias:10.3f} {range_std:6.3f} {retry_rate:10.2f} {ack:6.1f} {util:7.1f} {load:7.1f} "
+                  "{collisions:5} {lost:5} {missed:5} {rejected:4} {rx_errors:6} {first_range:8.3f} {resets:7} {escalations:4} {recover_max:8.3f}".format(
+                      ack=r["ack_ratio"] * 100, util=r["utilization"] * 100, load=r["offered_load"] * 100, **r))
+
+if __name__ == "__main__":
+    main()
@@ -2,43 +2,31 @@
 Tag part of SS-TWR system.
 
 This module provides a tag class that ranges to some anchors.
-The anchors are specified in the config module (config.py).
+The anchors are specified in the configuration (config.py, see configuration.py).
 """
 
+import random
 import logging
 from datetime import datetime
 from threading import Thread, Lock
-from http.server import HTTPServer, BaseHTTPRequestHandler
 
 import node
 import DW1000Constants as C
-from trilaterate import Trilaterator
-import config
+from DW1000Diagnostics import DW1000Diagnostics
 import MAC
-
-page = (""
-        "<!DOCTYPE html>"
-        "<html>"
-        "<head>"
-        "<meta charset=\"UTF-8\">"
-        "<meta http-equiv=\"refresh\" content=\"1\">"
-        "</head>"
-        "<body>"
-        "<canvas id=\"uwbmap\" width=\"{}\" height=\"{}\"></canvas>"
-        "<script>"
-        "var c = document.getElementById(\"uwbmap\");"
-        "var ctx = c.getContext(\"2d\");"
-        "ctx.fillStyle = \"#000000\";"
-        "ctx.fillRect({}, {}, 16, 16);"
-        "ctx.fillRect({}, {}, 16, 16);"
-        "ctx.fillRect({}, {}, 16, 16);"
-        "ctx.fillRect({}, {}, 16, 16);"
-        "ctx.fillStyle = \"#FF0000\";"
-        "ctx.fillRect({}, {}, 16, 16);"
-        "</script>"
-        "</body>"
-        "</html>"
-        "")
+import profiler as P
+from profiler import profiler
+from metrics import MetricsWriter
+from eventstream import EventBroadcaster
+from uplink import Uplink
+import rangerecord as R
+from recovery import TIER_NAMES
+from drift import DriftEstimator
+from logsetup import TRACE
+
+BACKOFF_MIN = 500 # Microseconds, a delayed poll has to start after the SPI transfers setting it up
+BACKOFF_EXPONENT_MAX = 3 # The backoff window doubles with every try to the same anchor, up to 2^3 * poll_backoff
+LATEST_KEY = "latest" # Trilaterator state of the range by range solutions, see solveLatest()
 
 def unixTimestamp():
     """
@@ -51,13 +39,64 @@ def unixTimestamp():
     """
     return datetime.timestamp(datetime.utcnow())
 
+def burstRange(ranges, trim):
+    """
+    Combine the ranges of a burst.
+
+    The ranges are sorted and the fraction trim is dropped at both ends, the rest is averaged.
+    With trim 0.5 the median is taken. The variance of the combined range is estimated from the
+    sample variance of the kept ranges (all ranges for the median, with the factor pi / 2). A trim
+    keeping a single range takes the median, its variance is estimated like for trim 0.5.
+
+    Args:
+        ranges: Ranges in meter
+        trim: Fraction of the ranges dropped at each end, in range [0, 0.5]
+
+    Returns:
+        (tuple): Combined range and its variance in square meter, None for a single range
+    """
+    ordered = sorted(ranges)
+    n = len(ordered)
+    if trim >= 0.5:
+        middle = n // 2
+        range_ = ordered[middle] if n % 2 else 0.5 * (ordered[middle - 1] + ordered[middle])
+        kept, factor = ordered, 1.5707963267948966
+    else:
+        k = int(trim * n)
+        kept, factor = ordered[k:n - k], 1.
+        range_ = sum(kept) / len(kept)
+        if len(kept) == 1:
+            kept, factor = ordered, 1.5707963267948966
+    if len(kept) < 2:
+        return range_, None
+    mean = sum(kept) / len(kept)
+    variance = sum((r - mean) ** 2 for r in kept) / (len(kept) - 1)
+    return range_, factor * variance / len(kept)
+
 class Tag(node.Node):
     """
     Tag class.
 
+    Args:
+        config (configuration.Config): Configuration, see Node
+
     Attributes:
         send: Number of send poll frames
         acked: Number of acked poll frames
+        foreign_acks: Number of ignored acknowledgements of other tags' polls
+        ranges: Number of valid ranges
+        fixes: Number of calculated positions (round solutions and range by range updates)
+        round: Ranging round counter, sent with the uplink records
+        time_first_range: Seconds from the start of setup() to the first valid range, None before
+        anchor_retries: Number of poll retries per anchor index
+        burst: Ranges of the current burst to the current anchor, see finishBurst()
+        burst_variances: Variance of the last combined range per anchor index, None before
+        bursts: Number of completed bursts
+        burst_exchanges: Number of polls sent right after a range of the same burst
+        burst_exchange_time: Sum of the times between these polls and the previous ones in seconds (device clock)
+        burst_retries: Number of polls within a burst re-sent after a timeout or an invalid range, not timed
+        burst_poll: The last poll was sent right after a range of the same burst, see sendPoll()
+        poll_frames: Poll frame per anchor index, built by setup()
         time_poll_send_ts: Timestamp of poll sending
         time_poll_recv_ts: Timestamp of poll receiving
         time_resp_send_ts: Timestamp of response sending
@@ -67,41 +106,75 @@ class Tag(node.Node):
         anchor_list: List of anchors used for ranging
         anchor_positions: List of anchor positions
         anchor_distances: Stores distances to anchors, cleared after each round
+        anchor_weights: Stores range weights derived from the receive quality, cleared after each round
+        latest_distances: Latest distance per anchor index ranged in the last round, see solveLatest()
+        latest_weights: Weights of latest_distances
+        rx_diagnostics: Receive diagnostics of the last response frame, attached to the range record
+        drift: Clock offsets of the anchors correcting the reply times, None if disabled
         anchor_idx: Index of current ranging anchor
         anchor_tries_limit: Maximum number of poll messages per anchor in one round
         anchor_tries: Current number of poll message to the current ranging anchor
         anchor_next: Flag signaling change to next anchor
-        trilaterator: Trilaterator object for position calculation
+        trilaterator: Trilaterator object for position calculation, None until loadSolver() finished
+        tracker: Position tracker fusing single ranges, bootstrapped by the trilaterator, None if disabled or not loaded
+        solver_thread: Thread running loadSolver() during startup
         logfile: Logfile path
         http_thread: Thread handle for the web visualization server
         httpd: Web server
         http_position: Position that is published to the client
+        events: Broadcaster pushing fixes and ranges to /stream clients
+        uplink: Sender of range and position records to the positioning server, None if disabled
+        address: Short address of the tag, set by setup()
     """
 
-    def __init__(self):
-        super().__init__()
+    def __init__(self, config=None):
+        super().__init__(config)
 
         # Statistics
         self.send = 0 # Number of send poll frames
         self.acked = 0 # Number of received acks for send polls
+        self.foreign_acks = 0 # Number of received acks for polls of other tags
+        self.ranges = 0 # Number of valid ranges
+        self.fixes = 0 # Number of positions
+        self.round = 0 # Ranging round counter
+        self.time_first_range = None # Startup time until the first valid range
+        self.anchor_retries = [0] * len(self.config.anchor_list) # Number of poll retries per anchor
+
+        # Burst ranging, burst_length polls per anchor and round
+        self.burst = []
+        self.burst_variances = [None] * len(self.config.anchor_list)
+        self.bursts = 0
+        self.burst_exchanges = 0
+        self.burst_exchange_time = 0.
+        self.burst_retries = 0
+        self.burst_poll = False
+        self.poll_frames = None
 
         self.time_poll_send_ts = None # Timestamp of poll sending
         self.time_poll_recv_ts = None # Timestamp of poll receiving
         self.time_resp_send_ts = None # Timestamp of response sending
         self.time_resp_recv_ts = None # Timestamp of response receiving
 
-        self.rxrfto_limit = config.rxrfto_limit
+        self.rxrfto_limit = self.config.rxrfto_limit
         self.rxrfto_count = 0 # Current number of receive frame wait timeouts
 
-        self.anchor_list = config.anchor_list # list of anchors to range to
-        self.anchor_positions = config.anchor_positions # list of anchor positions
+        self.anchor_list = self.config.anchor_list # list of anchors to range to
+        self.anchor_positions = self.config.anchor_positions # list of anchor positions
         self.anchor_distances = {} # measured distances
+        self.anchor_weights = {} # weights of measured distances
+        self.latest_distances = {} # latest distances, solved range by range without tracker
+        self.latest_weights = {} # weights of latest distances
+        self.rx_diagnostics = DW1000Diagnostics() # receive diagnostics of the last response
+        self.drift = DriftEstimator(len(self.anchor_list), self.config.drift_filter_gain, self.config.drift_limit) if self.config.drift_enable else None
         self.anchor_idx = 0 # current ranging anchor index
-        self.anchor_tries_limit = config.tries_limit # maximum number of poll message resends
+        self.anchor_tries_limit = self.config.tries_limit # maximum number of poll message resends
         self.anchor_tries = 0 # current number of poll message sends
         self.anchor_next = False # Indicate wanted change anchor_idx to next anchor_idx
 
-        self.trilaterator = Trilaterator() # Trilateror for position estimation
+        # Solver and tracker depend on NumPy and SciPy, loaded in the background by setup()
+        self.trilaterator = None # Trilaterator for position estimation
+        self.tracker = None
+        self.solver_thread = None
 
         self.logfile = None # logfile handle
 
@@ -117,15 +190,41 @@ class Tag(node.Node):
         self.http_thread = None
         self.httpd = None
         self.http_position = [0., 0., 0.]
+        self.events = EventBroadcaster()
+
+        self.uplink = None
+        if self.config.uplink_enable:
+            self.uplink = Uplink((self.config.server_host, self.config.server_port), self.config.uplink_policy, self.config.uplink_queue, linger=self.config.uplink_linger)
+        self.address = None
 
     def setup(self):
         """ Tag setup 
 
         Call after creation of a tag. Set sysctrl and sysmask of DW1000.
         """
+        if self.trilaterator is None:
+            self.solver_thread = Thread(target=self.loadSolver, daemon=True)
+            self.solver_thread.start()
+
         super().setup()
 
-        self.logfile = open(config.logfile, "a")
+        self.logfile = open(self.config.logfile, "a")
+
+        self.address = bytes(self.dw1000.panadr[0:2])
+        self.poll_frames = [self.dw1000.buildFrame(anchor, self.config.pan_bytes, b"", ackReq=True) for anchor in self.anchor_list]
+        if self.uplink:
+            self.uplink.start()
+
+        if self.config.webui_enable:
+            self.http_thread = Thread(target=self.webserveFunc)
+            self.http_thread.start()
+
+    def setupRadio(self):
+        """ Tag radio setup
+
+        Called by setup() and on recovery. Set sysctrl and sysmask of DW1000.
+        """
+        super().setupRadio()
 
         self.dw1000.syscfg.setBits((C.DIS_STXP_BIT, C.FFEN_BIT, C.FFAA_BIT, C.FFAD_BIT, C.RXWTOE_BIT, C.AAT_BIT, C.RXAUTR_BIT), True)
         self.dw1000.writeRegister(self.dw1000.syscfg)
@@ -142,18 +241,31 @@ class Tag(node.Node):
 
         self.dw1000.clearAllStatus()
 
-        if config.webui_enable:
-            self.http_thread = Thread(target=self.webserveFunc)
-            self.http_thread.start()
+    def loadSolver(self):
+        """ Import the solver and create trilaterator and tracker
+
+        Runs in the background during startup, the tag ranges while NumPy and
+        SciPy are imported. Rounds completed before are not solved.
+        """
+        t = self.clock()
+        from trilaterate import Trilaterator
+        from tracker import PositionTracker
+        if self.config.tracker_enable:
+            self.tracker = PositionTracker(self.config.tracker_range_std, self.config.tracker_accel_std, self.config.tracker_gate)
+        self.trilaterator = Trilaterator(self.config.solver_loss, self.config.solver_f_scale, self.config.solver_ransac, self.config.solver_ransac_threshold)
+        logging.info("Solver loaded in {:.3f} s".format(self.clock() - t))
 
     def stop(self):
         super().stop()
 
+        if self.uplink:
+            self.uplink.stop()
+
         # Shutdown server
+        self.events.close()
         if self.http_thread and self.http_thread.is_alive():
-            self.httpd.shutdown_request(None)
             self.httpd.shutdown()
-            self.httpd.socket.close()
+            self.httpd.server_close()
             self.http_thread.join()
 
     def computeRange(self):
@@ -164,6 +276,8 @@ class Tag(node.Node):
         """
         round_time = self.dw1000.wrapTimestamp(self.time_resp_recv_ts - self.time_poll_send_ts)
         reply_time = self.dw1000.wrapTimestamp(self.time_resp_send_ts - self.time_poll_recv_ts)
+        if self.drift:
+            reply_time = self.drift.correct(self.anchor_idx, reply_time)
         tmp_range_ = 0.5 * (round_time - reply_time)
         return (tmp_range_ % C.TIME_OVERFLOW) * C.DISTANCE_OF_RADIO
 
@@ -176,130 +290,358 @@ class Tag(node.Node):
         The position is written to the logfile.
         """
         if self.anchor_next or self.anchor_tries >= self.anchor_tries_limit:
+            # A burst cut short by failed polls keeps its ranges
+            self.finishBurst()
             self.anchor_idx = (self.anchor_idx + 1) % len(self.anchor_list)
             # Calculate position of anchor after trying to measure distance to all anchors
             if self.anchor_idx == 0:
-                logging.debug("End of round:\nNumber of distances: {}".format(len(self.anchor_distances)))
+                if __debug__ and TRACE:
+                    logging.debug("End of round, %d distances", len(self.anchor_distances))
                 # Extract valid positions and distances
-                if len(self.anchor_distances) >= 3:
-                    valid_positions = []
-                    valid_distances = []
-                    for k, v in self.anchor_distances.items():
-                        valid_positions.append(self.anchor_positions[k])
-                        valid_distances.append(v)
-                    # Calculate position
-                    position = self.trilaterator.trilaterate(valid_positions, valid_distances, valid_positions[0])
+                if self.trilaterator is None:
+                    if __debug__ and TRACE:
+                        logging.debug("Solver not loaded yet, round not solved")
+                elif len(self.anchor_distances) >= 3:
+                    valid_positions = self.config.anchor_array[list(self.anchor_distances.keys())]
+                    valid_distances = list(self.anchor_distances.values())
+                    valid_weights = [self.anchor_weights.get(k, 1.) for k in self.anchor_distances.keys()]
+                    # Calculate position, the previous solution is used as warm start
+                    t = profiler.start()
+                    position = self.trilaterator.trilaterate(valid_positions, valid_distances, valid_positions[0],
+                                                             weights=valid_weights if self.config.solver_weighting else None)
+                    profiler.stop(P.SOLVE, t)
                     self.http_position = position
+                    self.fixes += 1
+                    self.publishFix(position, "P")
                     logstring = "{} P {:2} {:2} {:2}\n".format(unixTimestamp(), *position)
-                    self.logfile.write(logstring)
+                    self.writeLog(logstring)
+                    # Per anchor residuals, outliers are marked with a trailing *
+                    residuals, inliers = self.trilaterator.getResiduals()
+                    logstring = "{} E".format(unixTimestamp())
+                    for k, residual, inlier in zip(self.anchor_distances.keys(), residuals, inliers):
+                        logstring += " {} {:.3f}{}".format(self.anchor_list[k].hex(), residual, "" if inlier else "*")
+                    self.writeLog(logstring + "\n")
+                    if self.uplink:
+                        self.uplink.push(R.PositionRecord(self.address, self.round, unixTimestamp(), position))
+                    # (Re)start the tracker from the round solution
+                    if self.tracker and not self.tracker.initialized:
+                        self.tracker.reset(position, self.clock())
+                # Anchors not ranged in this round are left out of the range by range solutions
+                for k in list(self.latest_distances):
+                    if k not in self.anchor_distances:
+                        del self.latest_distances[k]
+                        del self.latest_weights[k]
                 self.anchor_distances.clear()
+                self.anchor_weights.clear()
+                self.round += 1
             # Reset state variables
             self.anchor_tries = 0
             self.anchor_next = False
             self.rxrfto_count = 0
 
+    def metrics(self):
+        """ Render the tag metrics in the Prometheus text format
+
+        Only reads counters, can be called from the web server thread without
+        blocking the radio loop. Rates are left to the consumer (e.g. rate() in
+        Prometheus), so several consumers do not reset each other's rate windows.
+
+        Returns:
+            (bytes): Metrics exposition
+        """
+        stats = self.trilaterator.stats if self.trilaterator else None
+
+        w = MetricsWriter()
+        w.counter("polls_sent_total", "Number of sent poll frames", self.send)
+        w.counter("polls_acked_total", "Number of acknowledged poll frames", self.acked)
+        w.counter("foreign_acks_total", "Number of ignored acknowledgements of other tags' polls", self.foreign_acks)
+        w.counter("inactivity_timeouts_total", "Number of inactivity resets", self.timeouts)
+        w.counter("rx_frames_total", "Number of received good frames", self.rx_frames)
+        w.counter("tx_frames_total", "Number of sent frames", self.tx_frames)
+        w.counter("rx_errors_total", "Number of receiver errors", self.rx_errors)
+        w.counter("rx_rejected_total", "Number of frames for other nodes rejected by frame filtering", self.rx_rejected)
+        w.counter("rx_timeouts_total", "Number of receiver frame wait timeouts", self.rx_timeouts)
+        w.counter("ranges_total", "Number of valid ranges", self.ranges)
+        w.counter("fixes_total", "Number of positions", self.fixes)
+        w.family("anchor_retries_total", "counter", "Number of poll retries per anchor",
+                 (({"anchor": a.hex()}, r) for a, r in zip(self.anchor_list, self.anchor_retries)))
+        w.family("recoveries_total", "counter", "Number of inactivity recoveries per tier",
+                 (({"tier": name}, count) for name, count in zip(TIER_NAMES, self.recovery.counts)))
+        if self.drift:
+            w.family("clock_offset_ppm", "gauge", "Filtered clock offset per anchor, positive if the anchor clock is faster",
+                     (({"anchor": a.hex()}, ppm) for a, ppm in zip(self.anchor_list, self.drift.ppm()) if ppm is not None))
+            w.family("clock_offset_samples_total", "counter", "Number of accepted clock offset samples per anchor",
+                     (({"anchor": a.hex()}, n) for a, n in zip(self.anchor_list, self.drift.samples)))
+            w.counter("clock_offset_rejected_total", "Number of clock offset samples beyond drift_limit", self.drift.rejected)
+        w.counter("bursts_total", "Number of combined ranges", self.bursts)
+        w.counter("burst_exchanges_total", "Number of polls sent right after a range of the same burst", self.burst_exchanges)
+        w.counter("burst_exchange_seconds_total", "Poll to poll time of these polls", self.burst_exchange_time)
+        w.counter("burst_retries_total", "Number of polls within a burst re-sent after a timeout or an invalid range", self.burst_retries)
+        w.family("burst_range_std_meters", "gauge", "Standard deviation of the last combined range per anchor",
+                 (({"anchor": a.hex()}, v ** 0.5) for a, v in zip(self.anchor_list, self.burst_variances) if v is not None))
+        w.counter("recovery_escalations_total", "Number of recoveries escalated to the next tier", self.recovery.escalations)
+        w.counter("recoveries_completed_total", "Number of recoveries followed by activity", self.recovery.recovered)
+        w.counter("recovery_seconds_total", "Time from the last activity before to the first after a recovery", self.recovery.time_total)
+        w.gauge("recovery_seconds_max", "Longest time to recover", self.recovery.time_max)
+        w.gauge("recovery_seconds_last", "Last time to recover", self.recovery.time_last)
+        w.counter("spi_read_bytes_total", "Number of bytes read over SPI", self.dw1000.spiBytesRead)
+        w.counter("spi_written_bytes_total", "Number of bytes written over SPI", self.dw1000.spiBytesWritten)
+        if stats:
+            w.counter("solver_solves_total", "Number of full trilateration solves", stats.solves)
+            w.counter("solver_steps_total", "Number of incremental Gauss-Newton steps", stats.steps)
+            w.counter("solver_subset_solves_total", "Number of RANSAC anchor subset solves", stats.subset_solves)
+            w.counter("solver_seconds_total", "Time spent in the trilateration solver", stats.time_ns / 1e9)
+        w.gauge("anchor_tries", "Poll tries to the current anchor", self.anchor_tries)
+        w.gauge("rxrfto_count", "Current number of receiver timeouts for the current poll", self.rxrfto_count)
+        w.gauge("profiling_enabled", "Stage latency profiling state", int(profiler.enabled))
+        if self.time_first_range is not None:
+            w.gauge("first_range_seconds", "Time from startup to the first valid range", self.time_first_range)
+        if self.uplink:
+            counters = self.uplink.counters()
+            w.counter("uplink_sent_total", "Number of records sent to the positioning server", counters["sent"])
+            w.counter("uplink_datagrams_total", "Number of datagrams sent to the positioning server", counters["datagrams"])
+            w.counter("uplink_dropped_total", "Number of records dropped by the uplink", counters["dropped"])
+            w.counter("uplink_aggregated_total", "Number of records replaced by newer records", counters["aggregated"])
+            w.counter("uplink_errors_total", "Number of failed uplink sends", counters["errors"])
+            w.gauge("uplink_queued", "Number of records waiting for the uplink", counters["queued"])
+        w.profile(profiler)
+        return w.render()
+
+    def publishFix(self, position, source):
+        """ Push a position to the /stream clients
+
+        Args:
+            position: Position
+            source: "P" for round solutions, "T" for range by range updates
+        """
+        if self.events.subscribers:
+            self.events.publish("fix", {"t": unixTimestamp(), "source": source, "position": [float(i) for i in position]})
+
+    def writeLog(self, logstring):
+        """ Write a record to the logfile
+
+        Args:
+            logstring: Record including the trailing newline
+        """
+        t = profiler.start()
+        self.logfile.write(logstring)
+        profiler.stop(P.LOG_WRITE, t)
+
+    def rangeWeight(self, quality, fp_power):
+        """ Weight of a range measurement for the trilaterator
+
+        Ranges with low receive quality (first path amplitude to noise) or a weak
+        first path are likely NLOS or multipath and get a lower weight.
+
+        Args:
+            quality: Receive quality, see DW1000.getReceiveQuality()
+            fp_power: First path power in dBm, see DW1000.getFirstPathPower()
+
+        Returns:
+            float: Weight in range [0.01, 1]
+        """
+        weight = min(1., quality / self.config.solver_quality_ref)
+        if fp_power < self.config.solver_fp_power_ref:
+            weight *= 10 ** ((fp_power - self.config.solver_fp_power_ref) / 10.)
+        return max(0.01, weight)
+
+    def updateTracker(self, range_):
+        """ Fuse a single range into the position tracker
+
+        A position is published after every accepted range. With the tracker disabled
+        the latest ranges are trilaterated instead, see solveLatest().
+
+        Args:
+            range_: Range to the current anchor in meter
+        """
+        if not self.config.tracker_enable:
+            if self.trilaterator:
+                self.solveLatest(range_)
+            return
+        if not self.tracker or not self.tracker.initialized:
+            return
+        if self.tracker.updateRange(self.anchor_positions[self.anchor_idx], range_, self.clock()):
+            position = self.tracker.position
+            self.http_position = position
+            self.fixes += 1
+            self.publishFix(position, "T")
+            logstring = "{} T {:2} {:2} {:2}\n".format(unixTimestamp(), *position)
+            self.writeLog(logstring)
+        elif __debug__ and TRACE:
+            logging.debug("Tracker rejected range %.3f (innovation %.3f)", range_, self.tracker.last_innovation)
+
+    def solveLatest(self, range_):
+        """ Trilaterate the latest range of every anchor
+
+        Every call changes one range, so the trilaterator takes a single Gauss-Newton
+        step from the previous solution instead of a full solve (see Trilaterator.trilaterate()).
+
+        Args:
+            range_: Range to the current anchor in meter
+        """
+        self.latest_distances[self.anchor_idx] = range_
+        self.latest_weights[self.anchor_idx] = self.anchor_weights.get(self.anchor_idx, 1.)
+        if len(self.latest_distances) < 3:
+            return
+        anchors = sorted(self.latest_distances)
+        positions = self.config.anchor_array[anchors]
+        t = profiler.start()
+        position = self.trilaterator.trilaterate(positions, [self.latest_distances[k] for k in anchors], positions[0], key=LATEST_KEY,
+                                                 weights=[self.latest_weights[k] for k in anchors] if self.config.solver_weighting else None)
+        profiler.stop(P.SOLVE, t)
+        self.http_position = position
+        self.fixes += 1
+        self.publishFix(position, "T")
+        logstring = "{} T {:2} {:2} {:2}\n".format(unixTimestamp(), *position)
+        self.writeLog(logstring)
+
     def cb_rxfcg_(self):
         """ Custom rxfcg callback """
-        if self.header.frameControl.frameType == MAC.FT_ACK:
+        if self.frame.frameType == MAC.FT_ACK:
+            if self.frame.seqNumber != self.dw1000.txSeqNum[0]:
+                # Acknowledgement of another tag's poll, it carries no address, keep waiting for ours
+                self.foreign_acks += 1
+                self.enableRx = True
+                return
             self.time_resp_recv_ts = self.dw1000.getReceiveTimestamp()
+            # Read along with the timestamp, no additional SPI transfers
+            self.rx_diagnostics.assign(self.dw1000.rxDiagnostics)
+            if self.drift:
+                self.drift.update(self.anchor_idx, self.dw1000.getClockOffset())
             self.acked += 1
         else:
+            t = profiler.start()
             try:
-                self.time_poll_recv_ts, self.time_resp_send_ts = [int(i) for i in MAC.getPayload(self.message).decode().split(" ")]
-                logging.debug("time_poll_recv_ts: {}".format(self.time_poll_recv_ts))
-                logging.debug("time_resp_send_ts: {}".format(self.time_resp_send_ts))
+                self.time_poll_recv_ts, self.time_resp_send_ts = [int(i) for i in str(self.frame.payload, "ascii").split(" ")]
+                if __debug__ and TRACE:
+                    logging.debug("time_poll_recv_ts: %d time_resp_send_ts: %d", self.time_poll_recv_ts, self.time_resp_send_ts)
+                if self.drift:
+                    self.drift.update(self.anchor_idx, self.dw1000.getClockOffset())
                 range_ = self.computeRange()
                 # Discard unrealistic values
                 if range_ > 5000:
                     logging.error("Invalid range")
                     self.anchor_tries += 1
+                    self.anchor_retries[self.anchor_idx] += 1
                     self.rxrfto_count = 0
-                    self.dw1000.sendMessage(self.anchor_list[self.anchor_idx], config.pan.to_bytes(2, byteorder="little"), b"", ackReq=True, wait4resp=True)
-                    logging.debug("RXFCG: Started ranging to {} with try {}".format(self.anchor_list[self.anchor_idx].hex(), self.anchor_tries))
+                    self.sendPoll(backoff=True)
+                    if __debug__ and TRACE:
+                        logging.debug("RXFCG: Started ranging to %s with try %d", self.anchor_list[self.anchor_idx].hex(), self.anchor_tries)
                 else:
-                    logging.debug("Range to {}: {}".format(self.anchor_list[self.anchor_idx].hex(), range_))
-                    self.anchor_distances[self.anchor_idx] = range_
-                    self.anchor_next = True
-                    logstring = "{} R {} {:4} {} {} {} {}\n".format(unixTimestamp(), self.anchor_list[self.anchor_idx].hex(), range_, self.time_poll_send_ts, self.time_poll_recv_ts, self.time_resp_send_ts, self.time_resp_recv_ts)
-                    logfile.write(logstring)
+                    if __debug__ and TRACE:
+                        logging.debug("Range to %s: %.3f", self.anchor_list[self.anchor_idx].hex(), range_)
+                    self.burst.append(range_)
+                    self.ranges += 1
+                    if self.time_first_range is None:
+                        self.time_first_range = self.clock() - self.time_start
+                        logging.info("Time to first range: {:.3f} s".format(self.time_first_range))
+                    # Range record: timestamps followed by first path power, receive power, quality, NLOS indicator and the clock offset of the anchor in ppm
+                    logstring = "{} R {} {:4} {} {} {} {} {} {:.4f}\n".format(unixTimestamp(), self.anchor_list[self.anchor_idx].hex(), range_, self.time_poll_send_ts, self.time_poll_recv_ts, self.time_resp_send_ts, self.time_resp_recv_ts, self.rx_diagnostics, self.drift.offsets[self.anchor_idx] * 1e6 if self.drift else 0.)
+                    self.writeLog(logstring)
+                    if len(self.burst) < self.config.burst_length:
+                        # Next poll of the burst right away, the receiver is armed by the transmission
+                        self.sendPoll(burst=True)
+                        profiler.stop(P.BURST_TURNAROUND, t)
+                        return
+                    self.finishBurst()
             except:
                 pass
 
         self.enableRx = True
 
+    def sendPoll(self, backoff=False, burst=False):
+        """ Send a poll to the current anchor, the frames are prebuilt (see DW1000.sendFrame())
+
+        Args:
+            backoff: Delay the poll randomly by up to poll_backoff, so tags whose polls collided
+                do not collide again
+            burst: The poll directly follows a range of the same burst, its poll to poll time is measured
+        """
+        self.burst_poll = burst
+        delay = 0
+        if backoff and self.config.poll_backoff:
+            window = self.config.poll_backoff << min(self.anchor_tries, BACKOFF_EXPONENT_MAX)
+            delay = random.uniform(BACKOFF_MIN, max(BACKOFF_MIN, window))
+        self.dw1000.sendFrame(self.poll_frames[self.anchor_idx], wait4resp=True, delay=delay)
+
+    def finishBurst(self):
+        """ Combine the ranges of the burst to the current anchor
+
+        The combined range (see burstRange()) is the range of the anchor in this round,
+        it is published, sent to the server and fused into the tracker. The next
+        updateAnchors() moves on to the next anchor.
+        """
+        if not self.burst:
+            return
+        if len(self.burst) == 1:
+            range_, variance = self.burst[0], None
+        else:
+            range_, variance = burstRange(self.burst, self.config.burst_trim)
+            logstring = "{} B {} {:4} {:.6f} {}\n".format(unixTimestamp(), self.anchor_list[self.anchor_idx].hex(), range_, variance, len(self.burst))
+            self.writeLog(logstring)
+        self.bursts += 1
+        self.burst_variances[self.anchor_idx] = variance
+        self.burst.clear()
+
+        self.anchor_distances[self.anchor_idx] = range_
+        self.anchor_weights[self.anchor_idx] = self.rangeWeight(self.rx_diagnostics.quality, self.rx_diagnostics.fpPower)
+        self.anchor_next = True
+        if self.events.subscribers:
+            self.events.publish("range", {"t": unixTimestamp(), "anchor": self.anchor_list[self.anchor_idx].hex(), "range": range_, "variance": variance})
+        if self.uplink:
+            self.uplink.push(R.RangeRecord(self.address, self.anchor_list[self.anchor_idx], self.round, unixTimestamp(), range_, self.anchor_weights[self.anchor_idx]))
+        self.updateTracker(range_)
+
     def cb_txfrs_(self):
         """ Custom txfrs callback """
+        previous = self.time_poll_send_ts
         self.time_poll_send_ts = self.dw1000.getTransmitTimestamp()
         self.send += 1
+        if self.burst_poll:
+            # Poll to poll time within a burst, the overhead per exchange
+            self.burst_exchanges += 1
+            self.burst_exchange_time += self.dw1000.wrapTimestamp(self.time_poll_send_ts - previous) * C.TIME_RES * 1e-6
+        elif self.burst:
+            # The previous poll timed out or gave an invalid range, its wait would distort the exchange time
+            self.burst_retries += 1
 
     def cb_rxrfto_(self):
         """ Custom rxrfto callback """
         self.rxrfto_count += 1
         if self.rxrfto_count >= self.rxrfto_limit:
             self.anchor_tries += 1
+            self.anchor_retries[self.anchor_idx] += 1
             self.rxrfto_count = 0
             self.updateAnchors()
-            self.dw1000.sendMessage(self.anchor_list[self.anchor_idx], config.pan.to_bytes(2, byteorder="little"), b"", ackReq=True, wait4resp=True)
-            logging.debug("RXRFTO Started ranging to {} with try {}".format(self.anchor_list[self.anchor_idx].hex(), self.anchor_tries))
+            self.sendPoll(backoff=True)
+            if __debug__ and TRACE:
+                logging.debug("RXRFTO Started ranging to %s with try %d", self.anchor_list[self.anchor_idx].hex(), self.anchor_tries)
         else:
             self.dw1000.newReceive()
             self.dw1000.startReceive()
 
     def cb_rxerr_(self):
-        """ Custom rxerr callback """
-        self.anchor_next = True
-        self.updateAnchors()
-        self.dw1000.sendMessage(self.anchor_list[self.anchor_idx], config.pan.to_bytes(2, byteorder="little"), b"", ackReq=True, wait4resp=True)
-        logging.debug("RXERR Started ranging to {} with try {}".format(self.anchor_list[self.anchor_idx].hex(), self.anchor_tries))
+        """ Custom rxerr callback
+
+        The cheapest recovery: re-enable the receiver and keep waiting for the response of the
+        current anchor. A lost response ends in a frame wait timeout, which retries the poll
+        to the same anchor (see cb_rxrfto_()) instead of skipping it for the round.
+        """
+        self.dw1000.newReceive()
+        self.dw1000.startReceive()
 
     def cb_reset_(self):
         """ Custom reset callback """
         self.anchor_tries += 1
-        self.dw1000.sendMessage(self.anchor_list[self.anchor_idx], config.pan.to_bytes(2, byteorder="little"), b"", ackReq=True, wait4resp=True)
-        logging.debug("Timeout Started ranging to {} with try {}".format(self.anchor_list[self.anchor_idx].hex(), self.anchor_tries))
-
-    class TagHTTPRequestHandler(BaseHTTPRequestHandler):
-        outer = None
-
-        def do_GET(self):
-            global page
-
-            width = 800
-            height = 800
-
-            min_x = float(min([i[0] for i in config.anchor_positions] + [self.outer.http_position[0]])) - .5
-            min_y = float(min([i[1] for i in config.anchor_positions] + [self.outer.http_position[1]])) - .5
-            max_x = float(max([i[0] for i in config.anchor_positions] + [self.outer.http_position[0]])) + .5
-            max_y = float(max([i[1] for i in config.anchor_positions] + [self.outer.http_position[1]])) + .5
-
-            width_m = max_x - min_x
-            height_m = max_y - min_y
-
-            anchor1_x = ((config.anchor_positions[0][0] - min_x) / width_m) * width
-            anchor1_y = ((config.anchor_positions[0][1] - min_y) / height_m) * height
-            anchor2_x = ((config.anchor_positions[1][0] - min_x) / width_m) * width
-            anchor2_y = ((config.anchor_positions[1][1] - min_y) / height_m) * height
-            anchor3_x = ((config.anchor_positions[2][0] - min_x) / width_m) * width
-            anchor3_y = ((config.anchor_positions[2][1] - min_y) / height_m) * height
-            anchor4_x = ((config.anchor_positions[3][0] - min_x) / width_m) * width
-            anchor4_y = ((config.anchor_positions[3][1] - min_y) / height_m) * height
-            tag_x = ((self.outer.http_position[0] - min_x) / width_m) * width
-            tag_y = ((self.outer.http_position[1] - min_y) / height_m) * height
-
-            self.send_response(200)
-            self.end_headers()
-            self.wfile.write(page.format(width, height,
-                                         anchor1_x, anchor1_y,
-                                         anchor2_x, anchor2_y,
-                                         anchor3_x, anchor3_y,
-                                         anchor4_x, anchor4_y,
-                                         tag_x, tag_y).encode())
+        self.anchor_retries[self.anchor_idx] += 1
+        self.sendPoll(backoff=True)
+        if __debug__ and TRACE:
+            logging.debug("Timeout Started ranging to %s with try %d", self.anchor_list[self.anchor_idx].hex(), self.anchor_tries)
 
     def webserveFunc(self):
+        from webui import WebUIServer
         logging.debug("Starting web server")
-        req_handler = self.TagHTTPRequestHandler
-        req_handler.outer = self
-        self.httpd = HTTPServer(('', 8080), req_handler)
+        self.httpd = WebUIServer(('', self.config.webui_port), self)
         self.httpd.serve_forever()
         logging.debug("Stopped web server")
 
@@ -312,13 +654,22 @@ def main():
     try:
         tag.run()
     except KeyboardInterrupt:
-        tag.dw1000.stop()
+        tag.stop()
 
     end = datetime.utcnow()
 
     delta = end - start
 
     logging.info("Timedelta: {}\nSend: {}\nAcked: {}\nTimeouts: {}\n".format(delta, tag.send, tag.acked, tag.timeouts))
+    if tag.trilaterator:
+        logging.info("Trilaterator: {}".format(tag.trilaterator.stats))
+    logging.info("Recovery: {}".format(tag.recovery.counters()))
+    if tag.burst_exchanges:
+        logging.info("Burst: {} combined ranges, {:.3f} ms per exchange, {} retries".format(tag.bursts, tag.burst_exchange_time / tag.burst_exchanges * 1e3, tag.burst_retries))
+    if tag.drift:
+        logging.info("Clock offsets in ppm: {}".format(dict(zip((a.hex() for a in tag.anchor_list), tag.drift.ppm()))))
+    if tag.uplink:
+        logging.info("Uplink: {}".format(tag.uplink.counters()))
 
 if __name__ == "__main__":
     main()
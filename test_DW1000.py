@@ -0,0 +1,34 @@
+import DW1000Constants as C
+import benchmark
+
+def test_restore_snapshot():
+    device = benchmark.fakeDevice()
+    snapshot = device.takeSnapshot()
+    restored = benchmark.fakeDevice()
+    restored.spi.register(C.SYS_CFG, 4)[:] = bytes(4)
+    assert restored.restoreSnapshot(snapshot)
+    assert restored.readSnapshotRegisters() == device.readSnapshotRegisters()
+
+def test_restore_corrupt_snapshot():
+    device = benchmark.fakeDevice()
+    snapshot = device.takeSnapshot()
+    snapshot["registers"][2] = "00000000"
+    transfers = device.spi.transfers
+    assert not device.restoreSnapshot(snapshot)
+    assert device.spi.transfers == transfers
+
+def test_restore_snapshot_verify_mismatch():
+    device = benchmark.fakeDevice()
+    snapshot = device.takeSnapshot()
+    device.writeBytes = lambda address, offset, data, size: None
+    device.spi.register(C.SYS_CFG, 4)[:] = bytes(4)
+    assert not device.restoreSnapshot(snapshot)
+
+def test_send_frame_delayed():
+    device = benchmark.fakeDevice()
+    frame = bytearray(9)
+    device.sendFrame(frame)
+    assert not device.spi.register(C.SYS_CTRL, 4)[0] & 1 << C.TXDLYS_BIT
+    device.sendFrame(frame, delay=1000)
+    assert device.spi.register(C.SYS_CTRL, 4)[0] & 1 << C.TXDLYS_BIT
+    assert int.from_bytes(device.spi.register(C.DX_TIME, 5)[0:5], "little") > 0
@@ -0,0 +1,37 @@
+from threading import Thread
+
+import DW1000Constants as C
+from DW1000Register import DW1000Register
+import benchmark
+
+def readNewRegister(device):
+    device.readRegister(DW1000Register(C.SYS_STATUS, C.NO_SUB, 5))
+
+def test_allocations_counts_per_call_objects():
+    device = benchmark.fakeDevice()
+    blocks, size = benchmark.allocations(lambda: readNewRegister(device))
+    assert blocks >= 1
+    assert size > 0
+
+def test_allocations_preallocated_register():
+    device = benchmark.fakeDevice()
+    blocks, size = benchmark.allocations(lambda: device.readRegister(device.sysstatus))
+    assert round(blocks) == 0
+
+def test_gate_fails_on_allocating_path():
+    device = benchmark.fakeDevice()
+    functions = [("read_new", lambda: readNewRegister(device)),
+                 ("read_preallocated", lambda: device.readRegister(device.sysstatus))]
+    paths = ("read_new", "read_preallocated")
+    assert benchmark.checkAllocations(functions, paths) == ["read_new"]
+
+def test_frame_paths_do_not_allocate():
+    # Only the frame paths are measured, the solver benchmarks take minutes
+    functions = [(name, function) for name, function in benchmark.benchmarks() if name in benchmark.FRAME_PATHS]
+    assert sorted(name for name, function in functions) == sorted(benchmark.FRAME_PATHS)
+    # Traced from a thread, the deep pytest call stack makes every traceback of the snapshots expensive
+    results = []
+    thread = Thread(target=lambda: results.append(benchmark.checkAllocations(functions, benchmark.FRAME_PATHS)))
+    thread.start()
+    thread.join()
+    assert results == [[]]
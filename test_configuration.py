@@ -0,0 +1,45 @@
+import pytest
+
+import configuration
+
+ENVIRON = {"UWB_ANCHOR_LIST": '["0a3b", "0b:3b", [12, 59]]',
+           "UWB_ANCHOR_POSITIONS": "[[0, 0, 0], [4, 0, 0], [4, 3, 0.5]]"}
+
+RADIO = {"eid": "7D:00:22:EA:82:60:3B:0A", "pin_cs": 16, "pin_irq": 19, "pin_rst": 23}
+
+def test_environment_anchors():
+    settings = configuration.load(environ=ENVIRON)
+    assert settings.anchor_list == [b"\x0a\x3b", b"\x0b\x3b", b"\x0c\x3b"]
+    assert settings.anchor_positions == [[0., 0., 0.], [4., 0., 0.], [4., 3., 0.5]]
+    assert settings.anchor_index[b"\x0c\x3b"] == 2
+
+def test_environment_anchor_positions_need_3_coordinates():
+    environ = dict(ENVIRON, UWB_ANCHOR_POSITIONS="[[0, 0], [4, 0], [4, 3]]")
+    with pytest.raises(ValueError, match="anchor_positions"):
+        configuration.load(environ=environ)
+
+def test_environment_radios():
+    settings = configuration.load(environ={"UWB_RADIOS": '[{"eid": "7D:00:22:EA:82:60:3B:0A", "pin_cs": "16", '
+                                                          '"pin_irq": 19, "pin_rst": 23, "role": "tag"}]'})
+    assert settings.radios == [dict(RADIO, role="tag")]
+
+@pytest.mark.parametrize("channel, preamble_code", [(1, 9), (2, 12), (4, 17), (5, 10), (7, 20)])
+def test_radio_channel_preamble_code(channel, preamble_code):
+    radio = dict(RADIO, channel=channel, preamble_code=preamble_code)
+    assert configuration.parseRadio(radio, 0) == radio
+
+@pytest.mark.parametrize("radio, message", [
+    ({"pin_cs": 16, "pin_irq": 19, "pin_rst": 23}, "without eid"),
+    (dict(RADIO, pin_irq="GPIO19"), "pin_irq"),
+    (dict(RADIO, eid="7D:00"), "eid"),
+    (dict(RADIO, role="gateway"), "role"),
+    (dict(RADIO, channel=6), "channel"),
+    (dict(RADIO, channel=5, preamble_code=1), "preamble_code 1 is not supported on channel 5"),
+    (dict(RADIO, channel=4), "preamble_code 9 is not supported on channel 4"),
+    (dict(RADIO, preamble_code=17), "preamble_code 17 is not supported on channel 5"),
+    (dict(RADIO, antenna_delay=-1), "antenna_delay"),
+    (dict(RADIO, pin=4), "unknown settings pin"),
+    ([16, 19, 23], "not a table")])
+def test_invalid_radio(radio, message):
+    with pytest.raises(ValueError, match=message):
+        configuration.fromModule(radios=[RADIO, radio])
@@ -0,0 +1,38 @@
+import io
+import logging
+
+import pytest
+
+import logsetup
+
+@pytest.fixture
+def output():
+    root = logging.getLogger()
+    handlers, level = list(root.handlers), root.level
+    stream = io.StringIO()
+    logsetup.setup(level="DEBUG", rate=0, stream=stream)
+    yield stream
+    logsetup.stop()
+    for h in list(root.handlers):
+        root.removeHandler(h)
+    for h in handlers:
+        root.addHandler(h)
+    root.setLevel(level)
+
+def test_arguments_formatted_when_logged(output):
+    ranges = [1.5]
+    logging.getLogger("test").info("Ranges %s", ranges)
+    ranges.append(2.5)
+    logsetup.stop()
+    assert output.getvalue() == "INFO test: Ranges [1.5]\n"
+
+def test_exception_rendered_when_logged(output):
+    try:
+        raise ValueError("broken frame")
+    except ValueError:
+        logging.getLogger("test").exception("Frame %d", 7)
+    logsetup.stop()
+    lines = output.getvalue().splitlines()
+    assert lines[0] == "ERROR test: Frame 7"
+    assert lines[1] == "Traceback (most recent call last):"
+    assert lines[-1] == "ValueError: broken frame"
@@ -0,0 +1,121 @@
+import configuration
+import DW1000Constants as C
+import benchmark
+from node import Node
+
+def createNode():
+    node = Node(configuration.fromModule(snapshot_enable=False))
+    node.dw1000 = benchmark.fakeDevice()
+    node.start()
+    return node
+
+def setStatus(node, bit):
+    node.dw1000.spi.register(C.SYS_STATUS, 5)[bit // 8] |= 1 << (bit % 8)
+
+def test_rejected_frame_is_no_receiver_error():
+    node = createNode()
+    errors = []
+    aborts = []
+    node.cb_rxerr = lambda: errors.append(1)
+    node.dw1000.abortReceive = lambda: aborts.append(1)
+    setStatus(node, C.AFFREJ_BIT)
+    node.interruptCB()
+    assert node.rx_rejected == 1
+    assert node.rx_errors == 0
+    assert errors == [] and aborts == []
+    assert node.recovery.errors == 0
+    assert not node.dw1000.spi.register(C.SYS_STATUS, 5)[C.AFFREJ_BIT // 8]
+
+def test_rejected_frame_with_receiver_error():
+    node = createNode()
+    setStatus(node, C.AFFREJ_BIT)
+    setStatus(node, C.RXFCE_BIT)
+    node.interruptCB()
+    assert node.rx_rejected == 1
+    assert node.rx_errors == 1
+
+class DoubleBufferSpi(benchmark.FakeSpi):
+    """
+    FakeSpi with the transceiver state and both receive buffers of the anchor.
+
+    Toggling the host side buffer pointer shows the status of the next buffered frame,
+    TRXOFF discards the buffered frames and RXENAB turns the receiver on.
+
+    Attributes:
+        pending: Number of good frames in the other receive buffer
+        controls: Executed SYS_CTRL commands
+    """
+    def __init__(self):
+        super().__init__()
+        self.pending = 0
+        self.controls = []
+
+    def xfer(self, values):
+        command = self.header is None and self.write and self.address == C.SYS_CTRL
+        offset = self.offset
+        result = super().xfer(values)
+        if command:
+            self.control(values[0] << 8 * offset)
+        return result
+
+    def control(self, bits):
+        state = self.register(C.SYS_STATE, 5)
+        status = self.register(C.SYS_STATUS, 5)
+        if bits & 1 << C.TRXOFF_BIT:
+            self.controls.append("TRXOFF")
+            state[C.PMSC_STATE_SUB] = C.PMSC_STATE_IDLE
+            self.pending = 0
+        if bits & 1 << C.RXENAB_BIT:
+            self.controls.append("RXENAB")
+            state[C.PMSC_STATE_SUB] = C.PMSC_STATE_RX
+        if bits & 1 << C.HRBPT_BIT:
+            self.controls.append("HRBPT")
+            status[C.HSRBP_BIT // 8] ^= 1 << C.HSRBP_BIT % 8
+            if self.pending:
+                self.pending -= 1
+                status[C.RXFCG_BIT // 8] |= 1 << C.RXFCG_BIT % 8 | 1 << C.RXDFR_BIT % 8
+
+def createAnchor(receiver):
+    node = Node(configuration.fromModule(snapshot_enable=False))
+    node.dw1000 = benchmark.fakeDevice(DoubleBufferSpi())
+    node.dw1000.enableDoubleBuffer()
+    node.dw1000.permanentReceive = True
+    node.start()
+    spi = node.dw1000.spi
+    frame = benchmark.dataFrame()
+    spi.register(C.RX_FINFO, 4)[0:2] = (len(frame) + 2).to_bytes(2, "little")
+    spi.register(C.RX_BUFFER, len(frame))[0:len(frame)] = frame
+    spi.register(C.SYS_STATE, 5)[C.PMSC_STATE_SUB] = receiver
+    spi.controls.clear()
+    return node
+
+def test_double_buffer_drain_keeps_receiver_on():
+    node = createAnchor(C.PMSC_STATE_RX)
+    node.dw1000.spi.pending = 1
+    setStatus(node, C.RXFCG_BIT)
+    setStatus(node, C.TXFRS_BIT)
+    node.interruptCB()
+    assert node.rx_frames == 2
+    assert node.tx_frames == 1
+    assert node.dw1000.spi.controls == ["HRBPT", "HRBPT"]
+
+def test_idle_receiver_enabled_without_trxoff():
+    node = createAnchor(C.PMSC_STATE_IDLE)
+    setStatus(node, C.TXFRS_BIT)
+    node.interruptCB()
+    assert node.dw1000.spi.controls == ["RXENAB"]
+
+def test_overrun_resets_and_resyncs_buffers():
+    node = createAnchor(C.PMSC_STATE_RX)
+    spi = node.dw1000.spi
+    spi.pending = 1
+    setStatus(node, C.ICRBP_BIT)
+    setStatus(node, C.RXFCG_BIT)
+    setStatus(node, C.RXOVRR_BIT)
+    node.interruptCB()
+    assert node.rx_overruns == 1
+    assert node.rx_frames == 0
+    assert node.recovery.errors == 1
+    assert spi.controls == ["TRXOFF", "HRBPT", "RXENAB"]
+    status = spi.register(C.SYS_STATUS, 5)
+    assert bool(status[C.HSRBP_BIT // 8] & 1 << C.HSRBP_BIT % 8) == bool(status[C.ICRBP_BIT // 8] & 1 << C.ICRBP_BIT % 8)
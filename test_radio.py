@@ -0,0 +1,64 @@
+import time
+
+import pytest
+
+import DW1000Constants as C
+import benchmark
+from radio import RadioDispatcher, createNode
+
+RADIOS = [{"eid": "7D:00:22:EA:82:60:3B:0A", "pin_cs": 16, "pin_irq": 19, "pin_rst": 23, "role": "anchor"},
+          {"eid": "7D:00:22:EA:82:60:3B:0B", "pin_cs": 8, "pin_irq": 25, "pin_rst": 24, "role": "anchor",
+           "channel": 2, "preamble_code": 10}]
+
+def createNodes(gpio, radios=RADIOS):
+    nodes = []
+    for index, radio in enumerate(radios):
+        node = createNode(radio, index, gpio=gpio)
+        node.dw1000.spi = benchmark.FakeSpi()
+        gpio.listeners[node.dw1000.cs] = node.dw1000.spi.select
+        nodes.append(node)
+    return nodes
+
+def waitFor(condition, timeout=2.):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+def test_radio_settings():
+    nodes = createNodes(benchmark.FakeGpio())
+    assert [(node.dw1000.cs, node.dw1000.irq, node.dw1000.rst) for node in nodes] == [(16, 19, 23), (8, 25, 24)]
+    assert [(node.mode[C.CHANNEL_BIT], node.mode[C.PREAMBLE_CODE_BIT]) for node in nodes] == [(5, 9), (2, 10)]
+    assert nodes[0].config.snapshot_file != nodes[1].config.snapshot_file
+
+def test_interrupt_steps_only_its_node():
+    gpio = benchmark.FakeGpio()
+    nodes = createNodes(gpio)
+    steps = [[], []]
+    for node, log in zip(nodes, steps):
+        node.step = lambda log=log: log.append(1)
+    dispatcher = RadioDispatcher(nodes, poll_interval=3600.)
+    dispatcher.start()
+    try:
+        gpio.edge(25)
+        assert waitFor(lambda: dispatcher.interrupts == [0, 1])
+    finally:
+        dispatcher.stop()
+    assert steps == [[], [1]]
+    assert dispatcher.steps == [0, 1]
+
+def test_shared_interrupt_pin_rejected():
+    radios = [RADIOS[0], dict(RADIOS[1], pin_irq=RADIOS[0]["pin_irq"])]
+    with pytest.raises(ValueError, match="interrupt pin"):
+        RadioDispatcher(createNodes(benchmark.FakeGpio(), radios))
+
+def test_stop_leaves_other_radio_pins():
+    gpio = benchmark.FakeGpio()
+    nodes = createNodes(gpio)
+    for node in nodes:
+        node.dw1000.enableInterrupt(lambda pin: None)
+    nodes[0].stop()
+    assert sorted(gpio.released) == [16, 19, 23]
+    assert list(gpio.callbacks) == [25]
+    assert gpio.levels[23] == gpio.LOW
+    assert 24 not in gpio.levels
@@ -0,0 +1,61 @@
+import configuration
+import DW1000Constants as C
+import recovery as R
+import benchmark
+from node import Node
+
+class Clock():
+    def __init__(self):
+        self.now = 0.
+
+    def __call__(self):
+        return self.now
+
+def createNode(error_limit=8):
+    node = Node(configuration.fromModule(snapshot_enable=False))
+    node.dw1000 = benchmark.fakeDevice()
+    node.clock = Clock()
+    node.recovery = R.Recovery(error_limit)
+    node.start()
+    return node
+
+def receiveError(node):
+    node.dw1000.spi.register(C.SYS_STATUS, 5)[1] |= 1 << (C.RXFCE_BIT - 8)
+
+def test_errors_do_not_postpone_the_timeout():
+    node = createNode(error_limit=1000)
+    for i in range(0, 6):
+        node.clock.now += 0.1
+        receiveError(node)
+        node.step()
+    assert node.rx_errors == 6
+    assert node.timeouts == 1
+    assert node.recovery.counts == [1, 0, 0]
+    assert node.recovery.pending == 0.
+
+def test_errors_escalate():
+    node = createNode(error_limit=3)
+    tiers = []
+    for i in range(0, 9):
+        node.clock.now += 0.01
+        receiveError(node)
+        node.step()
+        tiers.append(list(node.recovery.counts))
+    assert node.timeouts == 0
+    assert tiers[2] == [0, 1, 0]
+    assert tiers[5] == [0, 1, 1]
+    assert tiers[8] == [0, 1, 2]
+    assert node.recovery.escalations == 1
+
+def test_activity_ends_recovery():
+    node = createNode(error_limit=2)
+    for i in range(0, 2):
+        node.clock.now += 0.01
+        receiveError(node)
+        node.step()
+    node.clock.now = 0.5
+    node.dw1000.spi.register(C.SYS_STATUS, 5)[0] |= 1 << C.TXFRS_BIT
+    node.step()
+    assert node.recovery.pending is None
+    assert node.recovery.recovered == 1
+    assert node.recovery.time_last == 0.5
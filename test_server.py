@@ -0,0 +1,46 @@
+import time
+import socket
+
+import pytest
+
+import configuration
+import rangerecord as R
+from server import PositionServer
+
+ANCHORS = {b"\x0a\x3b": [0., 0., 0.], b"\x0b\x3b": [4., 0., 0.], b"\x0c\x3b": [4., 3., 0.]}
+
+def waitFor(condition, timeout=2.):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+@pytest.mark.parametrize("data", [b"", b"xx", b"UW\x01"])
+def test_decode_short_datagram(data):
+    with pytest.raises(ValueError):
+        R.decodeDatagram(data)
+
+def test_short_datagram_keeps_receiving():
+    server = PositionServer(ANCHORS, ("127.0.0.1", 0), workers=1, round_timeout=0.1)
+    server.start()
+    sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        address = server.socket.getsockname()
+        sender.sendto(b"xx", address)
+        assert waitFor(lambda: server.counters["invalid"] == 1)
+        assert server.threads[0].is_alive()
+
+        record = R.RangeRecord(b"\x00\x3b", b"\x0a\x3b", 1, time.time(), 1.5)
+        sender.sendto(R.encodeDatagram([record]), address)
+        assert waitFor(lambda: server.counters["datagrams"] == 1)
+    finally:
+        sender.close()
+        server.stop()
+
+def test_tracks_use_server_config():
+    settings = configuration.fromModule(tracker_enable=False)
+    server = PositionServer(ANCHORS, ("127.0.0.1", 0), workers=1, config=settings)
+    try:
+        assert server.getTrack(b"\x00\x3b").tracker is None
+    finally:
+        server.socket.close()
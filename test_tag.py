@@ -0,0 +1,119 @@
+import io
+import time
+import socket
+
+import numpy as np
+import pytest
+
+import configuration
+import MAC
+import benchmark
+import rangerecord as R
+from tag import Tag, burstRange
+from trilaterate import Trilaterator
+
+def createTag(**overrides):
+    tag = Tag(configuration.fromModule(**dict(dict(uplink_enable=False, snapshot_enable=False), **overrides)))
+    tag.dw1000 = benchmark.fakeDevice()
+    tag.dw1000.txSeqNum[0] = 5
+    tag.poll_frames = [bytearray(9) for anchor in tag.anchor_list]
+    tag.polls = []
+    tag.dw1000.sendFrame = lambda frame, wait4resp=True, delay=0: tag.polls.append(delay)
+    return tag
+
+def receiveAck(tag, seq):
+    tag.frame = MAC.Frame(16)
+    tag.frame.buffer[0:5] = bytes([MAC.FT_ACK, 0, seq, 0, 0])
+    tag.frame.load(5)
+    tag.cb_rxfcg_()
+
+def test_foreign_ack_ignored():
+    tag = createTag()
+    receiveAck(tag, 4)
+    assert tag.foreign_acks == 1
+    assert tag.acked == 0
+    assert tag.time_resp_recv_ts is None
+    assert tag.enableRx
+
+def test_own_ack():
+    tag = createTag()
+    receiveAck(tag, 5)
+    assert tag.foreign_acks == 0
+    assert tag.acked == 1
+    assert tag.time_resp_recv_ts is not None
+
+def test_receive_error_keeps_waiting():
+    tag = createTag()
+    tag.anchor_idx = 1
+    tag.cb_rxerr_()
+    assert tag.anchor_idx == 1
+    assert not tag.anchor_next
+    assert tag.polls == []
+
+def test_backoff_disabled():
+    tag = createTag(poll_backoff=0)
+    tag.sendPoll(backoff=True)
+    assert tag.polls == [0]
+
+def test_backoff_window_doubles_per_try():
+    tag = createTag(poll_backoff=1000)
+    for tries in range(0, 6):
+        tag.anchor_tries = tries
+        for i in range(0, 50):
+            tag.sendPoll(backoff=True)
+        window = 1000 << min(tries, 3)
+        assert all(500 <= delay <= window for delay in tag.polls)
+        tag.polls.clear()
+    tag.sendPoll()
+    assert tag.polls == [0]
+
+def test_stop_flushes_uplink():
+    receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver.bind(("127.0.0.1", 0))
+    receiver.settimeout(1.)
+    host, port = receiver.getsockname()
+    tag = createTag(uplink_enable=True, server_host=host, server_port=port, webui_enable=False)
+    stopped = []
+    tag.dw1000.stop = lambda: stopped.append(1)
+    tag.uplink.push(R.RangeRecord(b"\x01\x00", tag.anchor_list[0], 1, time.time(), 1.5))
+    tag.uplink.start()
+    tag.stop()
+    records = R.decodeDatagram(receiver.recv(65536))
+    receiver.close()
+    assert [r.range for r in records] == [1.5]
+    assert not tag.uplink.thread.is_alive()
+    assert stopped == [1]
+
+def test_ranges_solved_by_steps_without_tracker():
+    tag = createTag(tracker_enable=False)
+    tag.logfile = io.StringIO()
+    tag.trilaterator = Trilaterator(tag.config.solver_loss, tag.config.solver_f_scale)
+    position = np.array([0.3, 0.4, 0.])
+    ranges = np.linalg.norm(position - tag.config.anchor_array, axis=1)
+    for i, anchor_idx in enumerate([0, 1, 2, 3, 0, 1, 2]):
+        tag.anchor_idx = anchor_idx
+        tag.updateTracker(ranges[anchor_idx] + 0.002 * i)
+    # Full solves for 3 and 4 anchors, then one step per range
+    assert tag.trilaterator.stats.solves == 2
+    assert tag.trilaterator.stats.steps == 3
+    assert tag.fixes == 5
+    assert np.allclose(tag.http_position, position, atol=0.05)
+
+def test_burst_range_trimmed_to_one_range():
+    # The single kept range is the median, the variance comes from all ranges
+    range_, variance = burstRange([1.3, 1.0, 1.1], 0.34)
+    assert range_ == 1.1
+    assert variance == pytest.approx(burstRange([1.3, 1.0, 1.1], 0.5)[1])
+    assert variance > 0.
+
+def test_burst_range_single_range():
+    assert burstRange([1.2], 0.25) == (1.2, None)
+
+def test_metrics_independent_of_scrapes():
+    # Scrapes by several consumers (Prometheus, a browser) see the same counters
+    tag = createTag()
+    tag.fixes = 3
+    first = tag.metrics()
+    assert b"uwb_fixes_total 3" in first
+    assert b"per_second" not in first
+    assert tag.metrics() == first
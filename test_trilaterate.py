@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+from trilaterate import Trilaterator
+
+BEACONS = [[0., 0., 0.], [10., 0., 0.], [10., 10., 0.], [0., 10., 2.]]
+POSITION = [3., 4., 1.]
+
+def distances(position=POSITION):
+    return list(np.linalg.norm(np.asarray(position) - np.asarray(BEACONS), axis=1))
+
+@pytest.mark.parametrize("loss, weights", [("linear", None), ("soft_l1", [1., 0.5, 0.8, 1.]), ("cauchy", None)])
+def test_one_changed_distance_takes_a_step(loss, weights):
+    solver = Trilaterator(loss, f_scale=0.2)
+    solver.trilaterate(BEACONS, distances(), key=1, weights=weights)
+    moved = distances([3.05, 4., 1.])
+    current = distances()
+    current[1] = moved[1]
+    position = solver.trilaterate(BEACONS, current, key=1, weights=weights)
+    assert solver.stats.solves == 1
+    assert solver.stats.steps == 1
+    reference = Trilaterator(loss, f_scale=0.2).trilaterate(BEACONS, current, POSITION, weights=weights)
+    # One step gets within millimeters of the full solve, far below the range noise
+    assert np.allclose(position, reference, atol=0.01)
+    residuals, inliers = solver.getResiduals(1)
+    assert np.allclose(residuals, solver.residuals(position, np.asarray(current), np.asarray(BEACONS)))
+
+def test_unchanged_distances_cached():
+    solver = Trilaterator()
+    first = solver.trilaterate(BEACONS, distances(), key=1)
+    assert np.array_equal(solver.trilaterate(BEACONS, distances(), key=1), first)
+    assert solver.stats.cached == 1
+    assert solver.stats.solves == 1
+
+def test_several_changed_distances_solved():
+    solver = Trilaterator()
+    solver.trilaterate(BEACONS, distances(), key=1)
+    position = solver.trilaterate(BEACONS, distances([5., 5., 1.]), key=1)
+    assert solver.stats.solves == 2
+    assert solver.stats.steps == 0
+    assert np.allclose(position, [5., 5., 1.], atol=1e-4)
+
+def test_changed_weight_counts_as_change():
+    solver = Trilaterator("soft_l1", f_scale=0.2)
+    solver.trilaterate(BEACONS, distances(), key=1, weights=[1., 1., 1., 1.])
+    current = distances()
+    current[0] += 0.05
+    solver.trilaterate(BEACONS, current, key=1, weights=[1., 0.5, 1., 1.])
+    assert solver.stats.steps == 0
+    assert solver.stats.solves == 2
+
+def test_no_step_with_ransac():
+    solver = Trilaterator(ransac=True)
+    solver.trilaterate(BEACONS, distances(), key=1)
+    current = distances()
+    current[0] += 0.05
+    solver.trilaterate(BEACONS, current, key=1)
+    assert solver.stats.steps == 0
+
+def test_step_raising_the_cost_falls_back_to_solve():
+    solver = Trilaterator()
+    solver.trilaterate(BEACONS, distances(), key=1)
+    current = distances()
+    current[0] += 50.
+    position = solver.trilaterate(BEACONS, current, key=1)
+    reference = Trilaterator().trilaterate(BEACONS, current, POSITION)
+    assert solver.stats.steps + solver.stats.solves == 2
+    assert np.sum(solver.residuals(position, np.asarray(current), np.asarray(BEACONS)) ** 2) <= \
+        np.sum(solver.residuals(reference, np.asarray(current), np.asarray(BEACONS)) ** 2) + 1e-6
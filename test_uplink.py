@@ -0,0 +1,97 @@
+import time
+import socket
+
+import pytest
+
+import rangerecord as R
+from uplink import Uplink
+
+ANCHORS = [b"\x0a\x3b", b"\x0b\x3b", b"\x0c\x3b", b"\x0d\x3b"]
+
+@pytest.fixture
+def receiver():
+    # Local receiver standing in for the server
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(("127.0.0.1", 0))
+    sock.settimeout(0.5)
+    yield sock
+    sock.close()
+
+def ranges(n):
+    return [R.RangeRecord(b"\x01\x00", ANCHORS[i % 4], i // 4, time.time(), 1. + i / 1000.) for i in range(0, n)]
+
+def receive(receiver):
+    records = []
+    sizes = []
+    try:
+        while True:
+            data = receiver.recv(65536)
+            sizes.append(len(data))
+            records += R.decodeDatagram(data)
+    except socket.timeout:
+        pass
+    return records, sizes
+
+def test_unknown_policy():
+    with pytest.raises(ValueError, match="policy"):
+        Uplink(("127.0.0.1", 9), policy="block")
+
+def test_batching(receiver):
+    uplink = Uplink(receiver.getsockname(), linger=0.01)
+    uplink.start()
+    for record in ranges(1000):
+        uplink.push(record)
+    assert uplink.flush()
+    records, sizes = receive(receiver)
+    uplink.stop()
+    # All records arrive in order, batched into datagrams of at most one packet
+    assert [(r.round, r.anchor) for r in records] == [(r.round, r.anchor) for r in ranges(1000)]
+    assert max(sizes) <= R.MAX_DATAGRAM
+    assert len(sizes) < 1000
+    counters = uplink.counters()
+    assert counters["sent"] == 1000
+    assert counters["datagrams"] == len(sizes)
+    assert counters["dropped"] == counters["aggregated"] == counters["errors"] == counters["queued"] == 0
+
+@pytest.mark.parametrize("policy, rounds, dropped, aggregated", [
+    ("drop_oldest", range(225, 250), 900, 0),
+    ("drop_newest", range(0, 25), 900, 0),
+    # Every full queue collapses to the newest record per anchor
+    ("aggregate", range(240, 250), 0, 960)])
+def test_overflow_policy(receiver, policy, rounds, dropped, aggregated):
+    # The sender is not started, so the queue stays full
+    uplink = Uplink(receiver.getsockname(), policy=policy, maxlen=100)
+    for record in ranges(1000):
+        uplink.push(record)
+    assert uplink.queued <= 100
+    assert uplink.dropped == dropped
+    assert uplink.aggregated == aggregated
+    uplink.start()
+    uplink.stop()
+    records, sizes = receive(receiver)
+    assert sorted(set(r.round for r in records)) == list(rounds)
+    assert set(r.anchor for r in records) == set(ANCHORS)
+    assert uplink.counters()["sent"] == len(records) == 1000 - dropped - aggregated
+    assert uplink.counters()["queued"] == 0
+
+def test_aggregate_keeps_newest_position(receiver):
+    uplink = Uplink(receiver.getsockname(), policy="aggregate", maxlen=3)
+    for i in range(0, 3):
+        uplink.push(R.PositionRecord(b"\x01\x00", i, time.time(), [float(i), 0., 0.]))
+    uplink.push(ranges(1)[0])
+    assert uplink.aggregated == 2
+    assert [r.kind for r in uplink.queue] == [R.PositionRecord.kind, R.RangeRecord.kind]
+    assert uplink.queue[0].round == 2
+    uplink.stop(flush=False)
+
+def test_send_error_drops_batch():
+    uplink = Uplink(("127.0.0.1", 0), retry_interval=0.)
+    uplink.push(ranges(1)[0])
+    uplink.start()
+    deadline = time.monotonic() + 2.
+    while not uplink.errors and time.monotonic() < deadline:
+        time.sleep(0.01)
+    uplink.stop()
+    assert uplink.errors == 1
+    assert uplink.dropped == 1
+    assert uplink.sent == 0
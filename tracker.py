@@ -0,0 +1,160 @@
+"""@package tracker
+
+This module provides a constant velocity extended Kalman filter that tracks
+the position of a tag from single range measurements.
+"""
+
+import numpy as np
+
+class PositionTracker():
+    """
+    Tightly coupled constant velocity EKF.
+
+    Every range measurement to a single anchor is fused as soon as it arrives,
+    so a new position estimate is available after each range instead of after
+    each full ranging round. The cost of one update is constant (6x6 state).
+
+    Args:
+        range_std: Standard deviation of a range measurement in meter
+        accel_std: Standard deviation of the (white noise) acceleration in m/s^2
+        gate: Innovation gate, maximum normalized squared innovation (chi-square, 1 dof)
+        reject_limit: Number of consecutive rejected ranges before the track is dropped
+
+    Attributes:
+        x: State vector [px, py, pz, vx, vy, vz]
+        P: State covariance
+        t: Time of the last update
+        initialized: Track state, set by reset()
+        accepted: Number of fused ranges
+        rejected: Number of ranges rejected by the innovation gate
+        rejected_row: Number of consecutive rejected ranges
+        last_innovation: Innovation of the last processed range
+    """
+    def __init__(self, range_std=0.1, accel_std=1.0, gate=9.0, reject_limit=10):
+        self.R = range_std ** 2
+        self.q = accel_std ** 2
+        self.gate = gate
+        self.reject_limit = reject_limit
+
+        self.x = np.zeros(6)
+        self.P = np.eye(6)
+        self.t = None
+        self.initialized = False
+
+        self.accepted = 0
+        self.rejected = 0
+        self.rejected_row = 0
+        self.last_innovation = 0.
+
+        # Preallocated work matrices
+        self._F = np.eye(6)
+        self._Q = np.zeros((6, 6))
+        self._H = np.zeros(6)
+
+    def reset(self, position, t, position_std=0.5, velocity_std=1.0):
+        """
+        Bootstrap the track, e.g. with a position from the Trilaterator.
+
+        Args:
+            position: Initial position
+            t: Timestamp of the position in seconds
+            position_std: Initial position uncertainty in meter
+            velocity_std: Initial velocity uncertainty in m/s
+        """
+        self.x[0:3] = position[0:3]
+        self.x[3:6] = 0.
+        self.P = np.diag([position_std ** 2] * 3 + [velocity_std ** 2] * 3)
+        self.t = t
+        self.rejected_row = 0
+        self.initialized = True
+
+    def predict(self, t):
+        """
+        Propagate the state to time t.
+
+        Args:
+            t: Timestamp in seconds
+        """
+        dt = t - self.t
+        if dt <= 0.:
+            return
+        F = self._F
+        F[0, 3] = F[1, 4] = F[2, 5] = dt
+
+        Q = self._Q
+        q3 = self.q * dt ** 3 / 3.
+        q2 = self.q * dt ** 2 / 2.
+        q1 = self.q * dt
+        for i in range(0, 3):
+            Q[i, i] = q3
+            Q[i, i + 3] = Q[i + 3, i] = q2
+            Q[i + 3, i + 3] = q1
+
+        self.x = F @ self.x
+        self.P = F @ self.P @ F.T + Q
+        self.t = t
+
+    def updateRange(self, anchor, distance, t):
+        """
+        Fuse a single range measurement.
+
+        Args:
+            anchor: Position of the ranged anchor
+            distance: Measured distance in meter
+            t: Timestamp of the measurement in seconds
+
+        Returns:
+            (bool): True if the range passed the innovation gate and was fused
+        """
+        self.predict(t)
+
+        diff = self.x[0:3] - np.asarray(anchor, dtype=float)
+        predicted = np.linalg.norm(diff)
+        if predicted < 1e-6:
+            return False
+
+        H = self._H
+        H[0:3] = diff / predicted
+        PHt = self.P @ H
+        S = H @ PHt + self.R
+        y = distance - predicted
+        self.last_innovation = y
+
+        if y * y / S > self.gate:
+            self.rejected += 1
+            self.rejected_row += 1
+            # Track lost, wait for a new bootstrap
+            if self.rejected_row >= self.reject_limit:
+                self.initialized = False
+            return False
+
+        K = PHt / S
+        self.x = self.x + K * y
+        self.P = self.P - np.outer(K, PHt)
+        self.accepted += 1
+        self.rejected_row = 0
+        return True
+
+    @property
+    def position(self):
+        """ Current position estimate """
+        return self.x[0:3]
+
+    @property
+    def velocity(self):
+        """ Current velocity estimate """
+        return self.x[3:6]
+
+if __name__ == "__main__":
+    anchors = [[0.0, 0.0, 0.0],
+               [1.0, 0.0, 0.0],
+               [1.0, 1.0, 0.0],
+               [0.0, 1.0, 0.0]]
+    truth = np.array([0.4, 0.6, 0.0])
+
+    tracker = PositionTracker(range_std=0.02)
+    tracker.reset([0.5, 0.5, 0.0], 0.)
+    for i in range(0, 40):
+        anchor = np.array(anchors[i % len(anchors)])
+        tracker.updateRange(anchor, np.linalg.norm(truth - anchor), 0.01 * (i + 1))
+    print(tracker.position)
@@ -3,12 +3,114 @@
 This module provides a class for trilateration from n position and range measurements.
 """
 
+import time
+from itertools import combinations, islice
+
 import numpy as np
 from scipy import optimize
 from math import sqrt
 
+# Robust loss functions of least_squares as (rho(z), rho'(z)) of the squared scaled residual z
+LOSSES = {
+    "linear": lambda z: (z, np.ones_like(z)),
+    "soft_l1": lambda z: (2. * (np.sqrt(1. + z) - 1.), 1. / np.sqrt(1. + z)),
+    "huber": lambda z: (np.where(z <= 1., z, 2. * np.sqrt(z) - 1.), np.where(z <= 1., 1., 1. / np.sqrt(np.maximum(z, 1.)))),
+    "cauchy": lambda z: (np.log1p(z), 1. / (1. + z)),
+    "arctan": lambda z: (np.arctan(z), 1. / (1. + z * z)),
+}
+
+class TrilaterationState():
+    """
+    Solver state of one ranged entity (tag).
+
+    Attributes:
+        position: Last solution
+        beacons: Beacon positions used for the last solution
+        distances: Distances used for the last solution
+        residuals: Per beacon residuals of the last solution
+        inliers: Per beacon inlier mask of the last solution
+        sqrtw: Square roots of the measurement weights used for the last solution, None if unweighted
+    """
+    def __init__(self, position, beacons, distances, residuals=None, inliers=None, sqrtw=None):
+        self.position = position
+        self.beacons = beacons
+        self.distances = distances
+        self.residuals = residuals
+        self.inliers = inliers
+        self.sqrtw = sqrtw
+
+class SolverStats():
+    """
+    Statistics of the Trilaterator.
+
+    Attributes:
+        solves: Number of full least squares solves
+        steps: Number of incremental Gauss-Newton steps
+        cached: Number of requests answered from the state without solving
+        iterations: Total number of residual evaluations of the full solves
+        last_iterations: Residual evaluations of the last full solve
+        time_ns: Total solve time in nanoseconds
+        last_time_ns: Time of the last solve or step in nanoseconds
+        subset_solves: Number of RANSAC subset solves, not counted in solves and iterations
+        outliers: Number of beacons rejected by RANSAC
+        batched: Number of positions solved by trilaterateBatch()
+    """
+    def __init__(self):
+        self.solves = 0
+        self.steps = 0
+        self.cached = 0
+        self.iterations = 0
+        self.last_iterations = 0
+        self.time_ns = 0
+        self.last_time_ns = 0
+        self.subset_solves = 0
+        self.outliers = 0
+        self.batched = 0
+
+    def __str__(self):
+        count = self.solves + self.steps + self.batched
+        return "Solves: {}, steps: {}, cached: {}, subset solves: {}, batched: {}, outliers: {}, mean iterations: {:.1f}, mean time: {:.3f} ms".format(
+            self.solves, self.steps, self.cached, self.subset_solves, self.batched, self.outliers,
+            self.iterations / self.solves if self.solves else 0.,
+            self.time_ns / count / 1e6 if count else 0.)
+
 class Trilaterator():
-    def trilaterate(self, beacons, distances, estimate):
+    """
+    Trilateration solver with warm start.
+
+    The solver keeps a state per ranged entity (see the key argument of trilaterate()).
+    The previous solution is used as starting point for the next solve and if only one
+    distance changed since the last call, a single Gauss-Newton step is taken instead
+    of a full solve. This is the case when the latest range of every beacon is solved
+    range by range (see Tag.updateTracker()).
+
+    For robustness against NLOS and multipath ranges a robust loss function of
+    scipy.optimize.least_squares can be selected and/or RANSAC over beacon subsets
+    can be enabled. Incremental steps reweight the residuals by the robust loss,
+    they are not taken with RANSAC.
+
+    Args:
+        loss: Loss function of least_squares ("linear", "soft_l1", "huber", "cauchy", "arctan")
+        f_scale: Soft margin between inlier and outlier residuals in meter
+        ransac: Enable RANSAC over beacon subsets
+        ransac_threshold: Maximum absolute residual of an inlier in meter
+        ransac_max_subsets: Maximum number of evaluated beacon subsets
+
+    Attributes:
+        states: Solver state per key
+        stats: Solver statistics
+    """
+    def __init__(self, loss="linear", f_scale=1.0, ransac=False, ransac_threshold=0.5, ransac_max_subsets=20):
+        self.loss = loss
+        self.f_scale = f_scale
+        self.ransac = ransac
+        self.ransac_threshold = ransac_threshold
+        self.ransac_max_subsets = ransac_max_subsets
+
+        self.states = {}
+        self.stats = SolverStats()
+
+    def trilaterate(self, beacons, distances, estimate=None, key=None, weights=None):
         """
         This function takes some beacon position and ranges which are used to
         estimate the position of the ranged entity.
@@ -16,15 +118,238 @@ class Trilaterator():
         Args:
             beacons: List of beacon positions, itself lists
             distances: List of distance measurements to beacons
-            estimate: Initial position estimate
+            estimate: Initial position estimate, only used if there is no previous solution
+            key: Identifier of the ranged entity, selects the warm start state
+            weights: Optional list of per measurement weights (e.g. from the receive quality)
 
         Returns:
             Estimated position
         """
-        return optimize.least_squares(self.residuals,
-                                        estimate,
-                                        args=(np.array(distances),
-                                              np.array(beacons))).x
+        start = time.perf_counter_ns()
+
+        beacons = np.asarray(beacons, dtype=float)
+        distances = np.asarray(distances, dtype=float)
+        sqrtw = None if weights is None else np.sqrt(np.asarray(weights, dtype=float))
+
+        state = self.states.get(key)
+        if self.loss in LOSSES and not self.ransac and state is not None and state.beacons.shape == beacons.shape \
+                and np.array_equal(state.beacons, beacons) and (state.sqrtw is None) == (sqrtw is None):
+            changed = state.distances != distances
+            if sqrtw is not None:
+                changed |= state.sqrtw != sqrtw
+            changed = np.count_nonzero(changed)
+            if changed == 0:
+                self.stats.cached += 1
+                return state.position.copy()
+            if changed == 1:
+                position = self.step(state.position, distances, beacons, sqrtw)
+                if position is not None:
+                    residuals = self.residuals(position, distances, beacons)
+                    self.states[key] = TrilaterationState(position, beacons, distances, residuals, state.inliers, sqrtw)
+                    self.stats.steps += 1
+                    self.stats.last_time_ns = time.perf_counter_ns() - start
+                    self.stats.time_ns += self.stats.last_time_ns
+                    return position.copy()
+
+        if state is not None:
+            x0 = state.position
+        elif estimate is not None:
+            x0 = np.asarray(estimate, dtype=float)
+        else:
+            x0 = np.mean(beacons, axis=0)
+
+        inliers = np.ones(len(distances), dtype=bool)
+        if self.ransac and len(distances) > 3:
+            inliers = self.consensus(x0, distances, beacons, sqrtw)
+            self.stats.outliers += len(distances) - np.count_nonzero(inliers)
+
+        position = self.solve(x0, distances[inliers], beacons[inliers], None if sqrtw is None else sqrtw[inliers])
+        residuals = self.residuals(position, distances, beacons)
+        self.states[key] = TrilaterationState(position, beacons, distances, residuals, inliers, sqrtw)
+
+        self.stats.last_time_ns = time.perf_counter_ns() - start
+        self.stats.time_ns += self.stats.last_time_ns
+        return position.copy()
+
+    def trilaterateBatch(self, beacons, distances, estimates=None, weights=None, iterations=10, damping=1e-3, tolerance=1e-4):
+        """
+        Solve many independent positions at once with a vectorized damped Gauss-Newton.
+
+        All problems of a batch need the same number of beacons. The loss is always
+        linear and no warm start state is kept, pass previous solutions as estimates.
+
+        Args:
+            beacons: Array of shape (batch, n, 3) of beacon positions
+            distances: Array of shape (batch, n) of distances
+            estimates: Optional array of shape (batch, 3) of starting points, defaults to the beacon centroids
+            weights: Optional array of shape (batch, n) of per measurement weights
+            iterations: Maximum number of iterations
+            damping: Levenberg damping, keeps the normal equations regular (e.g. for coplanar beacons)
+            tolerance: Stop if no position moves more than this in meter
+
+        Returns:
+            Array of shape (batch, 3) of estimated positions
+        """
+        start = time.perf_counter_ns()
+
+        beacons = np.asarray(beacons, dtype=float)
+        distances = np.asarray(distances, dtype=float)
+        if estimates is None:
+            x = np.mean(beacons, axis=1)
+        else:
+            x = np.array(estimates, dtype=float)
+        w = np.ones(distances.shape) if weights is None else np.asarray(weights, dtype=float)
+        regularization = damping * np.eye(beacons.shape[2])
+
+        for i in range(0, iterations):
+            diff = x[:, np.newaxis, :] - beacons
+            norm = np.maximum(np.linalg.norm(diff, axis=2), 1e-9)
+            residuals = distances - norm
+            J = -diff / norm[:, :, np.newaxis]
+            JtW = np.swapaxes(J, 1, 2) * w[:, np.newaxis, :]
+            delta = np.linalg.solve(JtW @ J + regularization, -(JtW @ residuals[:, :, np.newaxis]))[:, :, 0]
+            x += delta
+            if np.max(np.abs(delta)) < tolerance:
+                break
+
+        self.stats.batched += len(x)
+        self.stats.last_time_ns = time.perf_counter_ns() - start
+        self.stats.time_ns += self.stats.last_time_ns
+        return x
+
+    def solve(self, x0, distances, beacons, sqrtw=None):
+        """
+        Full least squares solve with the configured loss function.
+
+        Args:
+            x0: Starting point
+            distances: Array of distances
+            beacons: Array of beacons
+            sqrtw: Optional array of square roots of the measurement weights
+
+        Returns:
+            Estimated position
+        """
+        result = self.fit(x0, distances, beacons, sqrtw)
+        self.stats.solves += 1
+        self.stats.last_iterations = result.nfev
+        self.stats.iterations += result.nfev
+        return result.x
+
+    def fit(self, x0, distances, beacons, sqrtw=None):
+        """
+        Least squares solve with the configured loss function, without statistics.
+
+        Args:
+            x0: Starting point
+            distances: Array of distances
+            beacons: Array of beacons
+            sqrtw: Optional array of square roots of the measurement weights
+
+        Returns:
+            scipy.optimize.OptimizeResult
+        """
+        if sqrtw is None:
+            fun, jac = self.residuals, self.jacobian
+        else:
+            fun = lambda x, d, b: sqrtw * self.residuals(x, d, b)
+            jac = lambda x, d, b: sqrtw[:, np.newaxis] * self.jacobian(x, d, b)
+
+        return optimize.least_squares(fun,
+                                      x0,
+                                      jac=jac,
+                                      loss=self.loss,
+                                      f_scale=self.f_scale,
+                                      args=(distances, beacons))
+
+    def consensus(self, x0, distances, beacons, sqrtw=None):
+        """
+        RANSAC over beacon subsets.
+
+        Solves the position for subsets of three beacons and selects the subset
+        with the most beacons within ransac_threshold (ties broken by the
+        sum of squared inlier residuals).
+
+        Args:
+            x0: Starting point
+            distances: Array of distances
+            beacons: Array of beacons
+            sqrtw: Optional array of square roots of the measurement weights
+
+        Returns:
+            Boolean inlier mask
+        """
+        best = None
+        best_score = None
+        for subset in islice(combinations(range(len(distances)), 3), self.ransac_max_subsets):
+            subset = list(subset)
+            position = self.fit(x0, distances[subset], beacons[subset], None if sqrtw is None else sqrtw[subset]).x
+            self.stats.subset_solves += 1
+            residuals = np.abs(self.residuals(position, distances, beacons))
+            inliers = residuals < self.ransac_threshold
+            score = (np.count_nonzero(inliers), -np.sum(residuals[inliers] ** 2))
+            if best_score is None or score > best_score:
+                best, best_score = inliers, score
+
+        # Not enough consistent beacons, fall back to all
+        if np.count_nonzero(best) < 3:
+            return np.ones(len(distances), dtype=bool)
+        return best
+
+    def step(self, estimate, distances, beacons, sqrtw=None):
+        """
+        Single Gauss-Newton update step.
+
+        A robust loss is applied by reweighting the residuals with the loss derivative
+        at the estimate (iteratively reweighted least squares).
+
+        Args:
+            estimate: Current position estimate
+            distances: Array of distances
+            beacons: Array of beacons
+            sqrtw: Optional array of square roots of the measurement weights
+
+        Returns:
+            Updated position estimate, None if the step does not lower the cost
+        """
+        if sqrtw is None:
+            sqrtw = np.ones(len(distances))
+        loss = LOSSES[self.loss]
+        residuals = sqrtw * self.residuals(estimate, distances, beacons)
+        rho, drho = loss((residuals / self.f_scale) ** 2)
+        scale = np.sqrt(drho)
+        delta = np.linalg.lstsq((scale * sqrtw)[:, np.newaxis] * self.jacobian(estimate, distances, beacons),
+                                -scale * residuals,
+                                rcond=None)[0]
+        position = estimate + delta
+        residuals = sqrtw * self.residuals(position, distances, beacons)
+        if np.sum(loss((residuals / self.f_scale) ** 2)[0]) > np.sum(rho):
+            return None
+        return position
+
+    def getResiduals(self, key=None):
+        """
+        Per beacon residuals of the last solution.
+
+        Args:
+            key: Identifier of the ranged entity
+
+        Returns:
+            Tuple of residuals and inlier mask arrays, (None, None) if there is no solution
+        """
+        state = self.states.get(key)
+        if state is None:
+            return None, None
+        return state.residuals, state.inliers
+
+    def reset(self, key=None):
+        """
+        Drop the warm start state.
+
+        Args:
+            key: Identifier of the ranged entity
+        """
+        self.states.pop(key, None)
 
     def residuals(self, estimate, distances, beacons):
         """
@@ -32,13 +357,23 @@ class Trilaterator():
 
         Args:
             estimate: Current position estimate
-            distances: List of distances
-            beacons: List of beacons
+            distances: Array of distances
+            beacons: Array of beacons
         """
-        s = np.empty(distances.shape[0])
-        for i in range(0, distances.shape[0]):
-            s[i] = distances[i] - np.linalg.norm(estimate - beacons[i])
-        return s
+        return distances - np.linalg.norm(estimate - beacons, axis=1)
+
+    def jacobian(self, estimate, distances, beacons):
+        """
+        Jacobian of residuals()
+
+        Args:
+            estimate: Current position estimate
+            distances: Array of distances
+            beacons: Array of beacons
+        """
+        diff = estimate - beacons
+        norm = np.maximum(np.linalg.norm(diff, axis=1), 1e-9)
+        return -diff / norm[:, np.newaxis]
 
 if __name__ == "__main__":
     tri = Trilaterator()
@@ -51,3 +386,18 @@ if __name__ == "__main__":
     estimate = beacons[0]
     estimate = tri.trilaterate(beacons, distances, estimate)
     print(estimate)
+    distances[1] = 0.72
+    estimate = tri.trilaterate(beacons, distances, estimate)
+    print(estimate)
+    print(tri.stats)
+
+    robust = Trilaterator(loss="soft_l1", f_scale=0.1, ransac=True, ransac_threshold=0.2)
+    beacons.append([0.5, 2.0, 0.0])
+    distances = [0.7, 0.7, 0.7, 0.7, 3.0] # Last range has a NLOS error of ~1.5 m
+    print(robust.trilaterate(beacons, distances))
+    print(robust.getResiduals())
+
+    batch = np.array([[0.3, 0.4, 0.], [0.8, 0.2, 0.], [0.5, 0.9, 0.]])
+    batch_beacons = np.array([beacons[0:4]] * len(batch))
+    batch_distances = np.linalg.norm(batch[:, np.newaxis, :] - batch_beacons, axis=2)
+    print(tri.trilaterateBatch(batch_beacons, batch_distances))
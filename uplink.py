@@ -0,0 +1,198 @@
+"""@package uplink
+Range and position uplink from a tag to the positioning server.
+
+Records (see rangerecord.py) are queued by the radio loop without blocking and
+sent from a background thread, batched into datagrams of at most one packet.
+If the network does not keep up, the queue is bounded by a policy instead of
+stalling the radio loop:
+
+    drop_oldest: Discard the oldest queued record
+    drop_newest: Discard the new record
+    aggregate: Keep only the newest record per anchor (ranges) and the newest position,
+               then discard the oldest if the queue is still full
+"""
+
+import time
+import socket
+import logging
+from collections import deque
+from threading import Thread, Event, Lock
+
+import rangerecord as R
+
+POLICIES = ("drop_oldest", "drop_newest", "aggregate")
+
+class Uplink():
+    """
+    Non-blocking batching UDP sender.
+
+    Args:
+        address: Server address (host, port)
+        policy: Overflow policy, one of POLICIES
+        maxlen: Maximum number of queued records
+        max_datagram: Maximum datagram size in bytes
+        linger: Seconds to wait for more records before a datagram is sent, 0 sends immediately
+        retry_interval: Seconds to wait after the socket buffer ran full
+
+    Attributes:
+        queue: Queued records
+        lock: Protects the queue
+        event: Set when records are queued
+        sent: Number of sent records
+        datagrams: Number of sent datagrams
+        dropped: Number of records discarded by the policy
+        aggregated: Number of records replaced by a newer record (aggregate policy)
+        errors: Number of failed sends, the records of a failed send are dropped
+        blocked: Number of sends deferred because the socket buffer was full
+    """
+    def __init__(self, address, policy="drop_oldest", maxlen=1024, max_datagram=R.MAX_DATAGRAM, linger=0., retry_interval=0.01):
+        if policy not in POLICIES:
+            raise ValueError("Unknown uplink policy: {}".format(policy))
+        self.address = address
+        self.policy = policy
+        self.maxlen = maxlen
+        self.max_datagram = max_datagram
+        self.linger = linger
+        self.retry_interval = retry_interval
+
+        self.queue = deque()
+        self.lock = Lock()
+        self.event = Event()
+        self.running = False
+        self.thread = None
+
+        self.sent = 0
+        self.datagrams = 0
+        self.dropped = 0
+        self.aggregated = 0
+        self.errors = 0
+        self.blocked = 0
+
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.setblocking(False)
+
+    @property
+    def queued(self):
+        """ Number of queued records """
+        return len(self.queue)
+
+    def start(self):
+        """ Start the sender thread """
+        self.running = True
+        self.thread = Thread(target=self.sendFunc, daemon=True)
+        self.thread.start()
+
+    def stop(self, flush=True):
+        """
+        Stop the sender thread.
+
+        Args:
+            flush: Send the queued records before stopping
+        """
+        if flush:
+            self.flush()
+        self.running = False
+        self.event.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.socket.close()
+
+    def push(self, record):
+        """
+        Queue a record, never blocks on the network.
+
+        Args:
+            record: RangeRecord or PositionRecord
+        """
+        with self.lock:
+            if len(self.queue) >= self.maxlen:
+                if self.policy == "drop_newest":
+                    self.dropped += 1
+                    return
+                if self.policy == "aggregate":
+                    self.aggregate()
+                while len(self.queue) >= self.maxlen:
+                    self.queue.popleft()
+                    self.dropped += 1
+            self.queue.append(record)
+        self.event.set()
+
+    def aggregate(self):
+        """ Replace queued records by the newest record of the same anchor or position, call with lock held """
+        newest = {}
+        for record in self.queue:
+            newest[(record.kind, getattr(record, "anchor", None))] = record
+        aggregated = deque(r for r in self.queue if newest[(r.kind, getattr(r, "anchor", None))] is r)
+        self.aggregated += len(self.queue) - len(aggregated)
+        self.queue = aggregated
+
+    def takeBatch(self):
+        """
+        Remove as many records as fit into one datagram from the queue.
+
+        Returns:
+            (list): Records
+        """
+        batch = []
+        size = R.headerStruct.size
+        with self.lock:
+            while self.queue and len(batch) < 255:
+                record = self.queue[0]
+                if size + record.size > self.max_datagram:
+                    break
+                size += record.size
+                batch.append(self.queue.popleft())
+        return batch
+
+    def flush(self, timeout=1.):
+        """
+        Wait until the queue is empty.
+
+        Args:
+            timeout: Maximum waiting time in seconds
+
+        Returns:
+            (bool): True if the queue was emptied
+        """
+        deadline = time.monotonic() + timeout
+        while self.queue and time.monotonic() < deadline:
+            self.event.set()
+            time.sleep(0.001)
+        return not self.queue
+
+    def sendFunc(self):
+        """ Sender thread """
+        while self.running:
+            if not self.queue:
+                self.event.wait()
+            self.event.clear()
+            if self.linger and self.running:
+                time.sleep(self.linger)
+
+            while self.queue and self.running:
+                batch = self.takeBatch()
+                try:
+                    self.socket.sendto(R.encodeDatagram(batch), self.address)
+                except BlockingIOError:
+                    # Socket buffer full, put the batch back and let the policy bound the queue
+                    with self.lock:
+                        self.queue.extendleft(reversed(batch))
+                    self.blocked += 1
+                    time.sleep(self.retry_interval)
+                    continue
+                except OSError as e:
+                    logging.debug("Uplink send failed: %s", e)
+                    self.errors += 1
+                    self.dropped += len(batch)
+                    time.sleep(self.retry_interval)
+                    continue
+                self.sent += len(batch)
+                self.datagrams += 1
+
+    def counters(self):
+        """
+        Returns:
+            (dict): Uplink counters and the current queue length
+        """
+        return {"sent": self.sent, "datagrams": self.datagrams, "dropped": self.dropped, "aggregated": self.aggregated,
+                "errors": self.errors, "blocked": self.blocked, "queued": len(self.queue)}
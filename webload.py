@@ -0,0 +1,166 @@
+"""@package webload
+Load test of the tag web UI.
+
+Opens many concurrent /stream viewers and /map pollers against a tag and reports
+event rate, event latency, request latency and (for the local stand-in server)
+the CPU time spent by the server.
+
+Usage:
+    python webload.py [--url http://tag:8080] [--viewers 200] [--pollers 20] [--duration 10] [--rate 10]
+
+Without --url a stand-in tag web server is started in a subprocess. It publishes
+fixes at --rate Hz through the same code path as the tag.
+"""
+
+import sys
+import time
+import json
+import math
+import random
+import argparse
+import subprocess
+import http.client
+from urllib.parse import urlparse
+from threading import Thread, Event
+
+import config
+from eventstream import EventBroadcaster
+from webui import WebUIServer
+
+class StandInTag():
+    """
+    Object published by the web server in place of a tag.
+    """
+    def __init__(self):
+        self.anchor_list = config.anchor_list
+        self.anchor_positions = config.anchor_positions
+        self.http_position = [0.5, 0.5, 0.]
+        self.events = EventBroadcaster()
+
+    def metrics(self):
+        return b""
+
+    def publish(self, t):
+        self.http_position = [0.5 + 0.4 * math.cos(t), 0.5 + 0.4 * math.sin(t), 0.]
+        if self.events.subscribers:
+            self.events.publish("fix", {"t": time.time(), "source": "T", "position": self.http_position})
+
+def serve(port, rate):
+    """
+    Run the stand-in server until stdin is closed, then print the CPU time used.
+    """
+    tag = StandInTag()
+    httpd = WebUIServer(('127.0.0.1', port), tag)
+    Thread(target=httpd.serve_forever, daemon=True).start()
+
+    stop = Event()
+    def waitStdin():
+        sys.stdin.read()
+        stop.set()
+    Thread(target=waitStdin, daemon=True).start()
+
+    print("READY", flush=True)
+    start = time.monotonic()
+    while not stop.wait(1. / rate):
+        tag.publish(time.monotonic() - start)
+    print("CPU {}".format(time.process_time()), flush=True)
+
+def percentile(values, p):
+    if not values:
+        return 0.
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100.))]
+
+def viewer(host, port, stop, result):
+    """ Read /stream until stop is set """
+    events = 0
+    latencies = []
+    conn = http.client.HTTPConnection(host, port, timeout=20)
+    try:
+        conn.request("GET", "/stream")
+        response = conn.getresponse()
+    except OSError:
+        result.append((events, latencies, False))
+        return
+    while not stop.is_set():
+        try:
+            line = response.fp.readline()
+        except OSError:
+            break
+        if not line:
+            break
+        if line.startswith(b"data: ") and b"\"source\"" in line:
+            events += 1
+            latencies.append(time.time() - json.loads(line[6:])["t"])
+    conn.close()
+    result.append((events, latencies, True))
+
+def poller(host, port, stop, result):
+    """ Request /map until stop is set """
+    conn = http.client.HTTPConnection(host, port, timeout=5)
+    latencies = []
+    while not stop.is_set():
+        start = time.perf_counter()
+        conn.request("GET", "/map")
+        conn.getresponse().read()
+        latencies.append(time.perf_counter() - start)
+    conn.close()
+    result.append(latencies)
+
+def main():
+    parser = argparse.ArgumentParser(description="Tag web UI load test")
+    parser.add_argument("--url", help="Tag web UI, a local stand-in server is used if not given")
+    parser.add_argument("--viewers", type=int, default=200, help="Number of concurrent /stream viewers")
+    parser.add_argument("--pollers", type=int, default=20, help="Number of concurrent /map pollers")
+    parser.add_argument("--duration", type=float, default=10., help="Test duration in seconds")
+    parser.add_argument("--rate", type=float, default=10., help="Fix rate of the stand-in server in Hz")
+    parser.add_argument("--serve", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.rate)
+        return
+
+    server = None
+    if args.url:
+        url = urlparse(args.url)
+        host, port = url.hostname, url.port or 80
+    else:
+        host, port = "127.0.0.1", random.randint(20000, 30000)
+        server = subprocess.Popen([sys.executable, __file__, "--serve", str(port), "--rate", str(args.rate)],
+                                  stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+        server.stdout.readline()
+
+    stop = Event()
+    viewer_results = []
+    poller_results = []
+    threads = [Thread(target=viewer, args=(host, port, stop, viewer_results)) for i in range(0, args.viewers)]
+    threads += [Thread(target=poller, args=(host, port, stop, poller_results)) for i in range(0, args.pollers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(args.duration)
+    stop.set()
+
+    server_cpu = None
+    if server:
+        server.stdin.close()
+        server_cpu = float(server.stdout.readline().split()[1])
+        server.wait()
+    for thread in threads:
+        thread.join()
+
+    connected = [r for r in viewer_results if r[2]]
+    events = sum(r[0] for r in connected)
+    event_latencies = [l for r in viewer_results for l in r[1]]
+    map_latencies = [l for r in poller_results for l in r]
+
+    print("Viewers: {}, pollers: {}, duration: {} s".format(args.viewers, args.pollers, args.duration))
+    print("Stream: {} connected, {:.1f} events/s per viewer, latency p50 {:.2f} ms, p99 {:.2f} ms".format(
+        len(connected), events / max(1, len(connected)) / args.duration, percentile(event_latencies, 50) * 1e3, percentile(event_latencies, 99) * 1e3))
+    print("Map: {:.1f} requests/s, latency p50 {:.2f} ms, p99 {:.2f} ms".format(
+        len(map_latencies) / args.duration, percentile(map_latencies, 50) * 1e3, percentile(map_latencies, 99) * 1e3))
+    if server_cpu is not None:
+        print("Server CPU: {:.2f} s ({:.1f} %)".format(server_cpu, server_cpu / args.duration * 100))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,274 @@
+"""@package webui
+Web visualization of a tag.
+
+This module provides the threaded web server of the tag. It serves a live page
+fed by Server-Sent Events, a server rendered map, metrics and the profiler summary.
+"""
+
+import json
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from profiler import profiler
+from metrics import CONTENT_TYPE
+
+# Static page drawing positions pushed over /stream
+live_page = ("<!DOCTYPE html>\n"
+        "<html>\n"
+        "<head>\n"
+        "<meta charset=\"UTF-8\">\n"
+        "<style>canvas {position: absolute; left: 0; top: 0;}</style>\n"
+        "</head>\n"
+        "<body>\n"
+        "<canvas id=\"base\" width=\"800\" height=\"800\"></canvas>\n"
+        "<canvas id=\"overlay\" width=\"800\" height=\"800\"></canvas>\n"
+        "<script>\n"
+        "var base = document.getElementById(\"base\").getContext(\"2d\");\n"
+        "var overlay = document.getElementById(\"overlay\").getContext(\"2d\");\n"
+        "var anchors = [], ranges = {}, trail = [], box = null;\n"
+        "function px(p) { return [(p[0] - box[0]) / (box[2] - box[0]) * 800, (p[1] - box[1]) / (box[3] - box[1]) * 800]; }\n"
+        "function fit(p) { return p[0] >= box[0] && p[0] <= box[2] && p[1] >= box[1] && p[1] <= box[3]; }\n"
+        "function drawBase() {\n"
+        "  base.clearRect(0, 0, 800, 800); base.fillStyle = \"#000000\";\n"
+        "  anchors.forEach(function(a) { var q = px(a.position); base.fillRect(q[0] - 8, q[1] - 8, 16, 16); base.fillText(a.id, q[0] + 10, q[1]); });\n"
+        "}\n"
+        "function bounds(points) {\n"
+        "  var xs = points.map(function(p) { return p[0]; }), ys = points.map(function(p) { return p[1]; });\n"
+        "  box = [Math.min.apply(null, xs) - .5, Math.min.apply(null, ys) - .5, Math.max.apply(null, xs) + .5, Math.max.apply(null, ys) + .5];\n"
+        "  drawBase();\n"
+        "}\n"
+        "var source = new EventSource(\"/stream\");\n"
+        "source.addEventListener(\"anchors\", function(e) { anchors = JSON.parse(e.data); bounds(anchors.map(function(a) { return a.position; })); });\n"
+        "source.addEventListener(\"range\", function(e) { var r = JSON.parse(e.data); ranges[r.anchor] = r.range; });\n"
+        "source.addEventListener(\"fix\", function(e) {\n"
+        "  var f = JSON.parse(e.data);\n"
+        "  if (!box) return;\n"
+        "  if (!fit(f.position)) bounds(anchors.map(function(a) { return a.position; }).concat([f.position]));\n"
+        "  trail.push(f.position); if (trail.length > 50) trail.shift();\n"
+        "  overlay.clearRect(0, 0, 800, 800); overlay.fillStyle = \"#FFB0B0\";\n"
+        "  trail.forEach(function(p) { var q = px(p); overlay.fillRect(q[0] - 2, q[1] - 2, 4, 4); });\n"
+        "  var q = px(f.position); overlay.fillStyle = \"#FF0000\"; overlay.fillRect(q[0] - 8, q[1] - 8, 16, 16);\n"
+        "  overlay.fillStyle = \"#000000\"; overlay.fillText(Object.keys(ranges).map(function(k) { return k + \": \" + ranges[k].toFixed(2); }).join(\"  \"), 10, 790);\n"
+        "});\n"
+        "</script>\n"
+        "</body>\n"
+        "</html>\n").encode()
+
+# Server rendered map, refreshed by the browser every second
+map_page_head = (""
+        "<!DOCTYPE html>"
+        "<html>"
+        "<head>"
+        "<meta charset=\"UTF-8\">"
+        "<meta http-equiv=\"refresh\" content=\"1\">"
+        "</head>"
+        "<body>"
+        "<canvas id=\"uwbmap\" width=\"{}\" height=\"{}\"></canvas>"
+        "<script>"
+        "var c = document.getElementById(\"uwbmap\");"
+        "var ctx = c.getContext(\"2d\");"
+        "ctx.fillStyle = \"#000000\";"
+        "")
+map_page_rect = "ctx.fillRect({}, {}, 16, 16);"
+map_page_tag = "ctx.fillStyle = \"#FF0000\";"
+map_page_tail = (""
+        "</script>"
+        "</body>"
+        "</html>"
+        "")
+
+class MapLayout():
+    """
+    Precomputed geometry of the server rendered map.
+
+    The bounds and anchor pixel positions are computed once, rendering a
+    position only formats the tag marker.
+
+    Args:
+        anchor_positions: List of anchor positions (any number of anchors)
+        width: Canvas width in pixel
+        height: Canvas height in pixel
+        margin: Margin around the anchors in meter
+
+    Attributes:
+        bounds: [min_x, min_y, max_x, max_y] in meter
+        head: Page up to and including the anchor markers
+    """
+    def __init__(self, anchor_positions, width=800, height=800, margin=.5):
+        self.anchor_positions = [[float(i) for i in p] for p in anchor_positions]
+        self.width = width
+        self.height = height
+        self.margin = margin
+
+        self.bounds = [min(p[0] for p in self.anchor_positions) - margin,
+                       min(p[1] for p in self.anchor_positions) - margin,
+                       max(p[0] for p in self.anchor_positions) + margin,
+                       max(p[1] for p in self.anchor_positions) + margin]
+        self.width_m = self.bounds[2] - self.bounds[0]
+        self.height_m = self.bounds[3] - self.bounds[1]
+
+        self.head = map_page_head.format(width, height)
+        for p in self.anchor_positions:
+            self.head += map_page_rect.format(*self.toPixel(p))
+        self.head += map_page_tag
+
+    def toPixel(self, position):
+        """
+        Args:
+            position: Position in meter
+
+        Returns:
+            (tuple): Canvas coordinates
+        """
+        return (((position[0] - self.bounds[0]) / self.width_m) * self.width,
+                ((position[1] - self.bounds[1]) / self.height_m) * self.height)
+
+    def contains(self, position):
+        """
+        Args:
+            position: Position in meter
+
+        Returns:
+            (bool): True if the position is within the margin around the anchors
+        """
+        return self.bounds[0] + self.margin <= position[0] <= self.bounds[2] - self.margin and \
+               self.bounds[1] + self.margin <= position[1] <= self.bounds[3] - self.margin
+
+    def render(self, position):
+        """
+        Render the page for a tag position.
+
+        Args:
+            position: Tag position in meter
+
+        Returns:
+            (bytes): Page
+        """
+        if not self.contains(position):
+            # Rare case, the view is extended to include the tag
+            return MapLayout(self.anchor_positions + [position[0:2] + [0.]], self.width, self.height, self.margin).render(position)
+        return (self.head + map_page_rect.format(*self.toPixel(position)) + map_page_tail).encode()
+
+class WebUIRequestHandler(BaseHTTPRequestHandler):
+    """
+    Request handler of the web UI, the tag is accessed through self.server.tag.
+    """
+    def do_GET(self):
+        """ Serve the web UI
+
+        Paths:
+            /: Live page, draws fixes pushed over /stream
+            /stream: Server-Sent Events stream of fixes and ranges
+            /map: Page rendered on the server, refreshed every second
+            /metrics: Prometheus metrics
+            /profile: Profiler summary
+        """
+        url = urlparse(self.path)
+        if url.path == "/":
+            self.sendBody(live_page, "text/html; charset=utf-8")
+        elif url.path == "/map":
+            self.sendBody(self.server.mapPage(), "text/html; charset=utf-8")
+        elif url.path == "/stream":
+            self.sendStream()
+        elif url.path == "/metrics":
+            self.sendBody(self.server.tag.metrics(), CONTENT_TYPE)
+        elif url.path == "/profile":
+            self.sendProfile(parse_qs(url.query))
+        else:
+            self.send_error(404)
+
+    def log_message(self, format, *args):
+        """ Do not log every request """
+        pass
+
+    def sendBody(self, body, content_type):
+        """
+        Send a complete response.
+
+        Args:
+            body (bytes): Response body
+            content_type: Content type header
+        """
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def sendStream(self):
+        """ Push fixes and ranges as Server-Sent Events until the client disconnects """
+        events = self.server.tag.events
+        subscriber = events.subscribe()
+        try:
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.end_headers()
+            self.wfile.write(self.server.anchors_event)
+            self.wfile.flush()
+            while not subscriber.closed:
+                messages = subscriber.get(15.)
+                # Comment line as keep alive
+                self.wfile.write(b"".join(messages) if messages else b": keep-alive\n\n")
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            events.unsubscribe(subscriber)
+
+    def sendProfile(self, query):
+        """ Serve the profiler summary as JSON
+
+        The query parameter enable=1|0 switches the profiler, reset=1 clears it.
+        """
+        if "enable" in query:
+            if query["enable"][0] == "1":
+                profiler.enable()
+            else:
+                profiler.disable()
+        if query.get("reset", ["0"])[0] == "1":
+            profiler.reset()
+
+        body = json.dumps({"enabled": profiler.enabled, "stages": profiler.summary()}).encode()
+        self.sendBody(body, "application/json")
+
+class WebUIServer(ThreadingHTTPServer):
+    """
+    Threaded web server of a tag, one thread per connection.
+
+    Args:
+        address: Server address
+        tag: Published object, needs anchor_list, anchor_positions, http_position, events and metrics()
+
+    Attributes:
+        tag: Published object
+        layout (MapLayout): Precomputed map geometry
+        anchors_event (bytes): Encoded anchor layout, first event of every stream
+        map_cache: Tuple of the position object and the rendered map page
+    """
+    daemon_threads = True
+    request_queue_size = 128 # Listen backlog, many viewers connect at once
+
+    def __init__(self, address, tag):
+        super().__init__(address, WebUIRequestHandler)
+        self.tag = tag
+        self.layout = MapLayout(tag.anchor_positions)
+        anchors = [{"id": a.hex(), "position": [float(i) for i in p]} for a, p in zip(tag.anchor_list, tag.anchor_positions)]
+        self.anchors_event = tag.events.encode("anchors", anchors)
+        self.map_cache = (None, b"")
+
+    def mapPage(self):
+        """
+        Rendered map of the latest position.
+
+        The page is rendered again only if the tag published a new position object.
+
+        Returns:
+            (bytes): Page
+        """
+        position = self.tag.http_position
+        cached_position, body = self.map_cache
+        if cached_position is not position:
+            body = self.layout.render([float(i) for i in position])
+            self.map_cache = (position, body)
+        return body